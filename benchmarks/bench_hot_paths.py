@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the scan, thumbnail and apply hot paths.
+
+    benchmarks/bench_hot_paths.py [--sizes 100,10000,50000] [--output FILE] [--compare FILE]
+
+Every folder size runs in its own worker process with a throwaway HOME, synthetic
+wallpapers (hard links to one generated JPEG) and fake hyprctl/pkill/notify-send/
+systemctl executables on PATH that only log their invocation. The report holds cold
+and warm timings, peak RSS and subprocess counts per hot path, as JSON that can be
+diffed across commits with --compare.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+FAKE_MONITORS = '[{"name": "DP-1"}, {"name": "HDMI-A-1"}]'
+FAKE_TOOLS = ('hyprctl', 'pkill', 'notify-send', 'systemctl')
+
+
+def make_fake_tools(bin_dir, log_path):
+    """Write logging stand-ins for every external command the app spawns."""
+    os.makedirs(bin_dir, exist_ok=True)
+    for tool in FAKE_TOOLS:
+        script = f'#!/bin/sh\necho "{tool} $*" >> "{log_path}"\n'
+        if tool == 'hyprctl':
+            script += f'if [ "$1" = "monitors" ]; then echo \'{FAKE_MONITORS}\'; fi\n'
+        script += 'exit 0\n'
+        path = os.path.join(bin_dir, tool)
+        with open(path, 'w') as f:
+            f.write(script)
+        os.chmod(path, 0o755)
+
+
+def make_wallpaper_folder(folder, count, GdkPixbuf, GLib):
+    """Create count wallpapers as hard links to a single generated 1080p JPEG."""
+    os.makedirs(folder, exist_ok=True)
+    width, height = 1920, 1080
+    row = bytes((x * 5 + (x >> 3)) & 0xFF for x in range(width * 3))
+    pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(row * height), GdkPixbuf.Colorspace.RGB,
+                                             False, 8, width, height, width * 3)
+    source = os.path.join(folder, os.pardir, 'source.jpg')
+    pixbuf.savev(source, 'jpeg', ['quality'], ['85'])
+    for i in range(count):
+        target = os.path.join(folder, f"wallpaper_{i:06d}.jpg")
+        try:
+            os.link(source, target)
+        except OSError:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                dst.write(src.read())
+
+
+def count_spawns(log_path):
+    counts = {tool: 0 for tool in FAKE_TOOLS}
+    if os.path.exists(log_path):
+        with open(log_path) as f:
+            for line in f:
+                tool = line.split(' ', 1)[0].strip()
+                counts[tool] = counts.get(tool, 0) + 1
+    return counts
+
+
+class Section:
+    """Times a hot path and records the subprocesses it spawned."""
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.results = {}
+
+    def measure(self, name, phase, func, repeat=1):
+        before = count_spawns(self.log_path)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - start) / repeat
+        after = count_spawns(self.log_path)
+        entry = self.results.setdefault(name, {})
+        entry[f'{phase}_ms'] = round(elapsed * 1000, 3)
+        entry[f'{phase}_spawns'] = {k: (after[k] - before.get(k, 0)) / repeat
+                                    for k in after if after[k] - before.get(k, 0)}
+
+
+def run_worker(size, args):
+    with tempfile.TemporaryDirectory(prefix=f'pyprwall-bench-{size}-') as root:
+        return measure_library(size, args, root)
+
+
+def measure_library(size, args, root):
+    home = os.path.join(root, 'home')
+    os.makedirs(home)
+    log_path = os.path.join(root, 'spawns.log')
+    bin_dir = os.path.join(root, 'bin')
+    make_fake_tools(bin_dir, log_path)
+    runtime_dir = os.path.join(root, 'run')
+    os.makedirs(runtime_dir, mode=0o700)
+    # Nothing may reach the running session: its cycle lease, hyprpaper, logind or notifications
+    no_bus = 'unix:path=' + os.path.join(root, 'no-bus')
+    os.environ.update({
+        'HOME': home,
+        'XDG_CACHE_HOME': os.path.join(home, '.cache'),
+        'XDG_RUNTIME_DIR': runtime_dir,
+        'HYPRLAND_INSTANCE_SIGNATURE': 'bench',
+        'DBUS_SESSION_BUS_ADDRESS': no_bus,
+        'DBUS_SYSTEM_BUS_ADDRESS': no_bus,
+        'PATH': bin_dir + os.pathsep + os.environ.get('PATH', ''),
+    })
+
+    sys.path.insert(0, REPO_DIR)
+    import pyprwall
+    from pyprwall import GdkPixbuf, GLib
+
+    folder = os.path.join(root, 'wallpapers')
+    make_wallpaper_folder(folder, size, GdkPixbuf, GLib)
+
+    app = pyprwall.WallpaperManager(application_id="com.reeves.pyprwall.bench")
+    app.daemon_mode = True
+    section = Section(log_path)
+
+    wallpapers = []
+    def scan():
+        wallpapers[:] = app.scan_wallpaper_folder(folder)
+    section.measure('load_wallpapers.scan', 'cold', scan)
+    section.measure('load_wallpapers.scan', 'warm', scan, repeat=args.repeat)
+
+    app.save_wallpaper_cache(folder, wallpapers)
+    section.measure('is_cache_valid', 'cold', lambda: app.is_cache_valid(folder))
+    section.measure('is_cache_valid', 'warm', lambda: app.is_cache_valid(folder), repeat=args.repeat)
+
+    sample = wallpapers[:args.thumb_sample]
+    def thumbnails():
+        for path in sample:
+            app.load_or_create_thumbnail(path)
+    section.measure('load_or_create_thumbnail', 'cold', thumbnails)
+    section.measure('load_or_create_thumbnail', 'warm', thumbnails)
+    for phase in ('cold', 'warm'):
+        section.results['load_or_create_thumbnail'][f'{phase}_ms_per_file'] = round(
+            section.results['load_or_create_thumbnail'][f'{phase}_ms'] / max(1, len(sample)), 3)
+
+    def apply():
+        app.update_hyprpaper_config()
+        app.apply_hyprlock_wallpaper()
+    app.current_wallpaper = wallpapers[0]
+    section.measure('apply_config', 'cold', apply)
+    app.current_wallpaper = wallpapers[-1]
+    section.measure('apply_config', 'warm', apply, repeat=args.repeat)
+
+    app.wallpaper_list = wallpapers
+    app.start_cycling()
+    if app.playlist is None:
+        raise RuntimeError(f"cycling did not start, the lease is held by {app.lease.holder()}")
+    section.measure('cycle_to_next_wallpaper', 'cold', app.cycle_to_next_wallpaper)
+    section.measure('cycle_to_next_wallpaper', 'warm', app.cycle_to_next_wallpaper, repeat=args.cycles)
+    app.stop_cycling()
+
+    return {
+        'size': size,
+        'thumb_sample': len(sample),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'total_spawns': count_spawns(log_path),
+        'timings': section.results,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(report, baseline):
+    """Print old/new ratios for every timing present in both reports."""
+    old_runs = {run['size']: run for run in baseline.get('runs', [])}
+    print(f"{'size':>7}  {'hot path':<32} {'phase':<5} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for run in report['runs']:
+        old = old_runs.get(run['size'])
+        if not old:
+            continue
+        for name, entry in run['timings'].items():
+            for phase in ('cold', 'warm'):
+                new_ms = entry.get(f'{phase}_ms')
+                old_ms = old['timings'].get(name, {}).get(f'{phase}_ms')
+                if new_ms is None or old_ms is None:
+                    continue
+                ratio = new_ms / old_ms if old_ms else float('inf')
+                print(f"{run['size']:>7}  {name:<32} {phase:<5} {old_ms:>10.3f} {new_ms:>10.3f} {ratio:>7.2f}")
+        print(f"{run['size']:>7}  {'peak_rss_kb':<32} {'':<5} {old['peak_rss_kb']:>10} {run['peak_rss_kb']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,10000,50000', help='Comma separated folder sizes')
+    parser.add_argument('--thumb-sample', type=int, default=200, help='Thumbnails generated per size')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions for warm timings')
+    parser.add_argument('--cycles', type=int, default=20, help='Warm cycles to average')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--compare', help='Baseline JSON report to compare against')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        result = run_worker(args.worker, args)
+        with open(args.result_file, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    runs = []
+    for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+            result_file = tmp.name
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', str(size), '--result-file', result_file,
+               '--thumb-sample', str(args.thumb_sample), '--repeat', str(args.repeat), '--cycles', str(args.cycles)]
+        # The app prints its own diagnostics, keep them off our stdout
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            print(f"Worker for {size} wallpapers failed:\n{proc.stderr}", file=sys.stderr)
+            return 1
+        with open(result_file) as f:
+            runs.append(json.load(f))
+        os.remove(result_file)
+
+    report = {'revision': git_revision(), 'python': sys.version.split()[0], 'runs': runs}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    elif not args.output:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
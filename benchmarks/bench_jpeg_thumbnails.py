@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Compare the JPEG thumbnail fast path against the generic GdkPixbuf path.
+
+    benchmarks/bench_jpeg_thumbnails.py [FOLDER] [--limit N] [--repeat N]
+
+Without FOLDER a set of synthetic 4K JPEGs is generated in a temporary directory.
+GdkPixbuf can't write EXIF, so synthetic files only exercise the reduced-resolution
+decode; point it at a real camera folder to measure the embedded-preview path too.
+Prints a JSON report on stdout.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def make_synthetic_jpegs(folder, count, GdkPixbuf, GLib):
+    width, height = 3840, 2160
+    row = bytes((x * 7 + (x >> 4)) & 0xFF for x in range(width * 3))
+    data = GLib.Bytes.new(row * height)
+    pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(data, GdkPixbuf.Colorspace.RGB, False, 8, width, height, width * 3)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"synthetic_{i:04d}.jpg")
+        pixbuf.savev(path, 'jpeg', ['quality'], ['90'])
+        paths.append(path)
+    return paths
+
+
+def time_calls(func, paths, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            func(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('folder', nargs='?', help='Folder of JPEGs to benchmark')
+    parser.add_argument('--limit', type=int, default=50, help='Maximum number of files')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions, the best run is reported')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix='pyprwall-bench-') as scratch:
+        return benchmark(args, scratch)
+
+
+def benchmark(args, scratch):
+    # Keep the app's config and cache writes out of the real home directory
+    home = os.path.join(scratch, 'home')
+    os.makedirs(home)
+    os.environ['HOME'] = home
+    import pyprwall
+    from pyprwall import GdkPixbuf, GLib
+
+    if args.folder:
+        paths = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder)
+                       if os.path.splitext(f)[1].lower() in pyprwall.JPEG_EXTENSIONS)[:args.limit]
+    else:
+        paths = make_synthetic_jpegs(os.path.join(scratch, 'jpeg'), args.limit, GdkPixbuf, GLib)
+    if not paths:
+        print("No JPEG files found", file=sys.stderr)
+        return 1
+
+    app = pyprwall.WallpaperManager(application_id="com.reeves.pyprwall.bench")
+    width, height = pyprwall.THUMB_WIDTH, pyprwall.THUMB_HEIGHT
+    with_preview = sum(1 for p in paths if (pyprwall.read_jpeg_info(p) or (0, 0, None))[2])
+
+    generic = time_calls(lambda p: GdkPixbuf.Pixbuf.new_from_file_at_size(p, width, height), paths, args.repeat)
+    fast = time_calls(lambda p: app.load_jpeg_thumbnail(p, width, height), paths, args.repeat)
+
+    report = {
+        'files': len(paths),
+        'files_with_exif_preview': with_preview,
+        'thumb_size': [width, height],
+        'generic_ms_per_file': round(generic * 1000 / len(paths), 3),
+        'fast_ms_per_file': round(fast * 1000 / len(paths), 3),
+        'speedup': round(generic / fast, 2) if fast else None,
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
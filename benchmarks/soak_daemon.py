@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Soak test for the cycling daemon: drive its cycle engine for a long time and fail on growth.
+
+    benchmarks/soak_daemon.py [--cycles 100000] [--wallpapers 1000] [--output FILE]
+
+Runs the daemon's start-up and cycle path (load_daemon_wallpapers, the control socket,
+start_cycling, on_cycle_timeout) in a throwaway HOME and runtime directory. hyprpaper and
+Hyprland are local fakes listening on their IPC sockets, and the other external commands
+are the logging stand-ins from bench_hot_paths.py. The clock seen by the app jumps one interval per
+cycle, so schedules and backoffs move at daemon speed while the cycles run back to back.
+
+RSS, open file descriptors and spawned processes are sampled along the way, and the
+growth after the warm-up is compared with the thresholds. It also records per-cycle
+latency percentiles. The exit status is 1 when a threshold is exceeded, and the JSON
+report is printed or written either way.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import types
+
+from bench_hot_paths import count_spawns, make_fake_tools, git_revision
+
+
+class FakeHyprpaper:
+    """Answers 'ok' on hyprpaper's IPC socket and counts the requests per command."""
+
+    def __init__(self, path):
+        self.path = path
+        self.requests = {}
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(path)
+        self._sock.listen(16)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _addr = self._sock.accept()
+            except OSError:
+                return
+            with conn:
+                message = conn.recv(4096).decode(errors='replace')
+                command = message.split(' ', 1)[0]
+                self.requests[command] = self.requests.get(command, 0) + 1
+                conn.sendall(self.reply(command))
+
+    def reply(self, command):
+        return b'' if command == 'listloaded' else b'ok'
+
+    def close(self):
+        self._sock.close()
+
+
+class FakeHyprland(FakeHyprpaper):
+    """Answers j/monitors on Hyprland's IPC socket with one output that is switched on."""
+
+    def reply(self, command):
+        return json.dumps([{'name': 'DP-1', 'dpmsStatus': True}]).encode()
+
+
+class AcceleratedClock:
+    """Stands in for the app's time module, with time() and monotonic() moved forward on demand."""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def install(self, module):
+        real = module.time
+        proxy = types.SimpleNamespace(**{name: getattr(real, name) for name in dir(real) if not name.startswith('_')})
+        proxy.time = lambda: real.time() + self.offset
+        proxy.monotonic = lambda: real.monotonic() + self.offset
+        module.time = proxy
+
+    def advance(self, seconds):
+        self.offset += seconds
+
+
+def read_rss_kb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def count_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def run(args, root):
+    home = os.path.join(root, 'home')
+    runtime_dir = os.path.join(root, 'run')
+    bin_dir = os.path.join(root, 'bin')
+    log_path = os.path.join(root, 'spawns.log')
+    hypr_dir = os.path.join(runtime_dir, 'hypr', 'soak')
+    os.makedirs(home)
+    os.makedirs(hypr_dir, mode=0o700)
+    make_fake_tools(bin_dir, log_path)
+    os.environ.update({
+        'HOME': home,
+        'XDG_CACHE_HOME': os.path.join(home, '.cache'),
+        'XDG_RUNTIME_DIR': runtime_dir,
+        'HYPRLAND_INSTANCE_SIGNATURE': 'soak',
+        # No logind: the session counts as present and every cycle checks DPMS
+        'DBUS_SYSTEM_BUS_ADDRESS': 'unix:path=' + os.path.join(root, 'no-bus'),
+        'PATH': bin_dir + os.pathsep + os.environ.get('PATH', ''),
+    })
+
+    folder = os.path.join(root, 'wallpapers')
+    os.makedirs(folder)
+    for i in range(args.wallpapers):
+        # The daemon never decodes images, hyprpaper does
+        open(os.path.join(folder, f"wallpaper_{i:06d}.jpg"), 'wb').close()
+    config_dir = os.path.join(home, '.config', 'pyprwall')
+    os.makedirs(config_dir)
+    config = {
+        'wallpaper_dir': folder,
+        'interval': args.interval,
+        'random_order': args.random,
+        'hyprpaper_socket': True,
+        'lockscreen_mode': args.lockscreen,
+        'idle_aware': args.idle_aware,
+        'schedule': [{'from': '22:00', 'to': '06:00', 'wallpaper': os.path.join(folder, 'wallpaper_000000.jpg')}],
+    }
+    with open(os.path.join(config_dir, 'pyprwall.json'), 'w') as f:
+        json.dump(config, f)
+
+    hyprpaper = FakeHyprpaper(os.path.join(hypr_dir, '.hyprpaper.sock'))
+    hyprland = FakeHyprland(os.path.join(hypr_dir, '.socket.sock'))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import pyprwall
+    from pyprwall import GLib
+    pyprwall.setup_logging(args.log_level)
+    clock = AcceleratedClock()
+    clock.install(pyprwall)
+
+    app = pyprwall.WallpaperManager(application_id="com.reeves.pyprwall.soak")
+    app.daemon_mode = True
+    if not app.load_daemon_wallpapers():
+        raise RuntimeError("the daemon found no wallpapers")
+    app.start_control_server()
+    app.start_cycling()
+    context = GLib.MainContext.default()
+
+    samples = []
+    latencies = []
+    baseline = None
+    for cycle in range(1, args.cycles + 1):
+        clock.advance(app.cycle_interval)
+        start = time.perf_counter()
+        app.on_cycle_timeout()
+        boundary = app.schedule.next_boundary()
+        if boundary is not None and boundary <= clock.offset + time.time():
+            app.on_schedule_boundary()
+        latencies.append(time.perf_counter() - start)
+        # Let idle callbacks and retry timers run as they would in the main loop
+        while context.pending():
+            context.iteration(False)
+
+        if cycle == args.warmup or cycle % args.sample_every == 0 or cycle == args.cycles:
+            spawns = sum(count_spawns(log_path).values())
+            sample = {'cycle': cycle, 'rss_kb': read_rss_kb(), 'fds': count_fds(), 'spawns': spawns,
+                      'threads': threading.active_count()}
+            samples.append(sample)
+            if cycle == args.warmup:
+                baseline = sample
+    app.stop_cycling()
+    hyprpaper.close()
+    hyprland.close()
+
+    baseline = baseline or samples[0]
+    final = samples[-1]
+    measured = max(1, final['cycle'] - baseline['cycle'])
+    ordered = sorted(latencies[args.warmup:] or latencies)
+    growth = {
+        'rss_kb': final['rss_kb'] - baseline['rss_kb'],
+        'fds': final['fds'] - baseline['fds'],
+        'threads': final['threads'] - baseline['threads'],
+        'spawns_per_cycle': round((final['spawns'] - baseline['spawns']) / measured, 4),
+    }
+    latency_ms = {name: round(percentile(ordered, q) * 1000, 3)
+                  for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))}
+
+    failures = []
+    if growth['rss_kb'] > args.max_rss_growth_kb:
+        failures.append(f"RSS grew by {growth['rss_kb']} KiB (limit {args.max_rss_growth_kb})")
+    if growth['fds'] > args.max_fd_growth:
+        failures.append(f"{growth['fds']} more open file descriptors (limit {args.max_fd_growth})")
+    if growth['threads'] > 0:
+        failures.append(f"{growth['threads']} more threads")
+    if growth['spawns_per_cycle'] > args.max_spawns_per_cycle:
+        failures.append(f"{growth['spawns_per_cycle']} processes spawned per cycle (limit {args.max_spawns_per_cycle})")
+    if latency_ms['p99'] > args.max_p99_ms:
+        failures.append(f"p99 cycle latency {latency_ms['p99']} ms (limit {args.max_p99_ms})")
+
+    return {
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'cycles': args.cycles,
+        'warmup': args.warmup,
+        'wallpapers': args.wallpapers,
+        'lockscreen_mode': args.lockscreen,
+        'simulated_days': round(clock.offset / 86400, 1),
+        'growth': growth,
+        'latency_ms': latency_ms,
+        'hyprpaper_requests': dict(hyprpaper.requests),
+        'hyprland_requests': dict(hyprland.requests),
+        'total_spawns': count_spawns(log_path),
+        'samples': samples,
+        'failures': failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=100000, help='Wallpaper changes to drive')
+    parser.add_argument('--warmup', type=int, default=1000, help='Cycles before the baseline sample')
+    parser.add_argument('--sample-every', type=int, default=5000, help='Cycles between samples')
+    parser.add_argument('--wallpapers', type=int, default=1000, help='Files in the fake wallpaper folder')
+    parser.add_argument('--interval', type=int, default=1800, help='Simulated seconds between cycles')
+    parser.add_argument('--random', action='store_true', help='Cycle in random order')
+    parser.add_argument('--lockscreen', choices=['eager', 'lazy'], default='lazy',
+                        help='Lockscreen mode; eager also runs pkill hyprlock every cycle')
+    parser.add_argument('--no-idle-aware', dest='idle_aware', action='store_false',
+                        help="Don't check the idle/DPMS state before each cycle")
+    parser.add_argument('--max-rss-growth-kb', type=int, default=8192)
+    parser.add_argument('--max-fd-growth', type=int, default=0)
+    parser.add_argument('--max-spawns-per-cycle', type=float, default=0.0)
+    parser.add_argument('--max-p99-ms', type=float, default=50.0)
+    parser.add_argument('--log-level', default='warning', choices=['debug', 'info', 'warning', 'error'])
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+    args.warmup = min(args.warmup, args.cycles)
+
+    with tempfile.TemporaryDirectory(prefix='pyprwall-soak-') as root:
+        report = run(args, root)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    for failure in report['failures']:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if report['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
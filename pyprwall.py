@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import os
+import sys
 import gi
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
@@ -10,16 +11,1863 @@ from pathlib import Path
 from gi.repository import Gtk, Gio, Gdk, GdkPixbuf, GObject, Adw, Pango
 
 import threading
+import queue
 from gi.repository import GLib
 import json
 import random
 import argparse
+import struct
+import zlib
+from array import array
+from collections import deque
+import hashlib
+import fcntl
+import time
+import datetime
+import math
+import bisect
+import functools
+import logging
+from contextlib import contextmanager
+import concurrent.futures
+import multiprocessing
+import re
+import importlib.util
 
-# To customize the thumbnail size
+from pyprwall_analysis import analyze_batch
+
+# To customize the thumbnail size (grid cells at zoom 1, in logical pixels)
 THUMB_WIDTH = 320
 THUMB_HEIGHT = 200
+GRID_ZOOM_MIN = 0.5
+GRID_ZOOM_MAX = 2.0
+GRID_ZOOM_STEP = 0.25
+THUMB_UPGRADE_DELAY = 150  # ms of scrolling quiet before visible thumbnails are sharpened
+GRID_ZOOM_SAVE_DELAY = 1000  # ms the zoom slider must rest before the config is written
 MAX_CHILDREN_PER_LINE = 5
 LABEL_MAX_CHARS = 30
+SUPPORTED_FORMATS = ('.png', '.jpg', '.jpeg', '.jxl', '.webp')
+SYSTEMD_UNIT = 'pyprwall.service'
+SYSTEMD_SOCKET_UNIT = 'pyprwall.socket'
+SYSTEMD_TIMER_UNIT = 'pyprwall-cycle.timer'
+SYSTEMD_ONESHOT_UNIT = 'pyprwall-cycle.service'
+# Units to enable per service mode; the first one is watched for the status indicator
+SERVICE_MODES = {
+    'resident': [SYSTEMD_UNIT],
+    'on-demand': [SYSTEMD_SOCKET_UNIT, SYSTEMD_TIMER_UNIT],
+}
+CONTROL_SOCKET_NAME = 'pyprwall.sock'
+CONTROL_COMMANDS = ('next', 'pause', 'resume', 'start', 'stop', 'reload', 'status')
+CYCLE_LEASE_NAME = 'pyprwall-cycle.lock'
+LEASE_RETRY = 10  # seconds between a waiting daemon's attempts to take over cycling
+ATTACH_POLL = 1  # seconds between status requests of a GUI mirroring the daemon
+DPMS_RECHECK = 60  # seconds between checks for the displays coming back on
+CONFIG_RELOAD_DELAY = 500  # ms of quiet after a config file change before the daemon re-reads it
+HYPRPAPER_FAILURE_THRESHOLD = 3  # consecutive failures before requests fail fast
+HYPRPAPER_BACKOFF = (5, 300)  # first and longest wait before probing hyprpaper again, seconds
+HYPRPAPER_TIMEOUT = 10
+HYPRPAPER_PROBE_TIMEOUT = 2
+SD_LISTEN_FDS_START = 3
+DAEMON_IDLE_EXIT = 30  # seconds an on-demand daemon lingers after its last request
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+JPEG_READ_CHUNK = 256 * 1024
+# SOFn markers carrying the frame size (DHT, JPG and DAC share the range)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Shared thumbnail cache flavors from the freedesktop thumbnail spec, smallest first
+FREEDESKTOP_THUMB_FLAVORS = (('normal', 128), ('large', 256), ('x-large', 512), ('xx-large', 1024))
+# Longest single wait for a schedule boundary; monotonic timers stop during suspend
+SCHEDULE_MAX_WAIT = 900
+# Color analysis works on thumbnails scaled down to this size, this many per process pool task
+ANALYSIS_SIZE = (64, 40)
+ANALYSIS_BATCH = 32
+DHASH_SIZE = 8  # 8x8 bits
+GRID_BATCH = 32  # thumbnails added to the grid per main loop callback
+FOLDER_SCAN_TIMEOUT = 15  # seconds without progress before a folder counts as offline
+THUMB_SOURCE_PRIVATE = -1  # thumbnail source: the private cache, otherwise a flavor index
+SEARCH_WORD_SPLIT = re.compile(r'[\W_]+')
+SEARCH_REFINE_LIMIT = 2000  # narrow the previous result instead of querying the index up to this size
+DUPLICATE_DISTANCE = 4  # dHash bits two near-duplicates may differ in
+LIBRARY_SORTS = ['Name', 'Hue']
+# Brightness filter: mean luma range
+BRIGHTNESS_FILTERS = {'All': (0.0, 1.01), 'Dark': (0.0, 0.35), 'Medium': (0.35, 0.65), 'Light': (0.65, 1.01)}
+GRAY_SATURATION = 0.12  # dominant colors below this sort after the hues
+
+
+def _exif_thumbnail(tiff):
+    """Return the IFD1 JPEG preview from a TIFF-structured EXIF payload, or None."""
+    try:
+        order = {b'II': '<', b'MM': '>'}[tiff[:2]]
+        ifd0 = struct.unpack(order + 'I', tiff[4:8])[0]
+        count = struct.unpack(order + 'H', tiff[ifd0:ifd0 + 2])[0]
+        next_ifd = ifd0 + 2 + count * 12
+        ifd1 = struct.unpack(order + 'I', tiff[next_ifd:next_ifd + 4])[0]
+        if not ifd1:
+            return None
+        count = struct.unpack(order + 'H', tiff[ifd1:ifd1 + 2])[0]
+        offset = length = None
+        for i in range(count):
+            entry = ifd1 + 2 + i * 12
+            tag, _type, _count, value = struct.unpack(order + 'HHII', tiff[entry:entry + 12])
+            if tag == 0x0201:
+                offset = value
+            elif tag == 0x0202:
+                length = value
+        if offset and length and offset + length <= len(tiff):
+            return tiff[offset:offset + length]
+    except (KeyError, struct.error):
+        pass
+    return None
+
+
+def read_jpeg_info(path):
+    """
+    Return (width, height, exif_thumbnail) for a JPEG file, or None if it can't be parsed.
+
+    Only the marker segments in front of the first frame header are read, so the cost
+    is a few kilobytes of I/O no matter how large the image is.
+    """
+    thumbnail = None
+    with open(path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            byte = f.read(1)
+            if not byte:
+                return None
+            if byte != b'\xff':
+                continue
+            marker = f.read(1)
+            while marker == b'\xff':
+                marker = f.read(1)
+            if not marker:
+                return None
+            code = marker[0]
+            if code == 0x01 or 0xD0 <= code <= 0xD7:
+                continue  # standalone markers carry no length
+            if code in (0xD9, 0xDA):
+                return None  # end of image or scan data before any frame header
+            length_bytes = f.read(2)
+            if len(length_bytes) < 2:
+                return None
+            length = struct.unpack('>H', length_bytes)[0]
+            if length < 2:
+                return None
+            if code in JPEG_SOF_MARKERS:
+                frame = f.read(5)
+                if len(frame) < 5:
+                    return None
+                height, width = struct.unpack('>xHH', frame)
+                if not width or not height:
+                    return None
+                return width, height, thumbnail
+            segment = f.read(length - 2)
+            if code == 0xE1 and thumbnail is None and segment.startswith(b'Exif\x00\x00'):
+                thumbnail = _exif_thumbnail(segment[6:])
+
+
+class Metrics:
+    """
+    Span timers with fixed-bucket histograms and plain counters. Recording a span is a
+    perf_counter pair plus a bisect, so it stays on in the daemon all the time.
+    """
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}  # name -> [per-bucket counts (+Inf last), sum, count, max]
+        self.counters = {}
+        self.started = time.time()
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block into histogram `name`; exceptions also bump `name.errors`."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.count(f"{name}.errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator form of span() for whole methods."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = [[0] * (len(self.BUCKETS) + 1), 0.0, 0, 0.0]
+            hist[0][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            hist[1] += seconds
+            hist[2] += 1
+            if seconds > hist[3]:
+                hist[3] = seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        """Return a JSON-serialisable copy with cumulative bucket counts."""
+        with self._lock:
+            histograms = {}
+            for name, (buckets, total, count, maximum) in self.histograms.items():
+                cumulative, running = [], 0
+                for n in buckets:
+                    running += n
+                    cumulative.append(running)
+                histograms[name] = {'count': count, 'sum': total, 'max': maximum,
+                                    'buckets': dict(zip([*map(str, self.BUCKETS), '+Inf'], cumulative))}
+            return {'started': self.started, 'updated': time.time(),
+                    'histograms': histograms, 'counters': dict(self.counters)}
+
+    def render_prometheus(self, snap=None):
+        """Render the current values, or those of snapshot `snap`, in the Prometheus text exposition format."""
+        snap = snap or self.snapshot()
+        lines = ['# TYPE pyprwall_span_seconds histogram']
+        for name, hist in sorted(snap['histograms'].items()):
+            for le, n in hist['buckets'].items():
+                lines.append(f'pyprwall_span_seconds_bucket{{span="{name}",le="{le}"}} {n}')
+            lines.append(f'pyprwall_span_seconds_sum{{span="{name}"}} {hist["sum"]:.6f}')
+            lines.append(f'pyprwall_span_seconds_count{{span="{name}"}} {hist["count"]}')
+        lines.append('# TYPE pyprwall_events_total counter')
+        for name, n in sorted(snap['counters'].items()):
+            lines.append(f'pyprwall_events_total{{event="{name}"}} {n}')
+        return '\n'.join(lines) + '\n'
+
+
+def combine_stats(total, other, sign=1):
+    """Add (sign=-1: subtract) the histograms and counters of Metrics snapshot `other` to those of `total`"""
+    histograms = {name: dict(hist, buckets=dict(hist['buckets'])) for name, hist in total.get('histograms', {}).items()}
+    for name, hist in other.get('histograms', {}).items():
+        mine = histograms.get(name)
+        if mine is None:
+            mine = histograms[name] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': dict.fromkeys(hist['buckets'], 0)}
+        mine['count'] += sign * hist['count']
+        mine['sum'] += sign * hist['sum']
+        if sign > 0:
+            mine['max'] = max(mine['max'], hist['max'])  # a difference keeps the later maximum
+        for le, n in hist['buckets'].items():
+            mine['buckets'][le] = mine['buckets'].get(le, 0) + sign * n
+    counters = dict(total.get('counters', {}))
+    for name, n in other.get('counters', {}).items():
+        counters[name] = counters.get(name, 0) + sign * n
+    return {'started': min(total.get('started', time.time()), other.get('started', time.time())),
+            'updated': max(total.get('updated', 0), other.get('updated', 0)),
+            'histograms': histograms, 'counters': counters}
+
+
+def format_stats(snapshot):
+    """Format a Metrics snapshot as a table for --stats."""
+    def quantile(hist, q):
+        target = q * hist['count']
+        for le, n in hist['buckets'].items():
+            if n >= target:
+                return le
+        return '+Inf'
+
+    rows = [f"{'span':<32} {'count':>8} {'mean ms':>10} {'max ms':>10} {'p50 <=':>8} {'p95 <=':>8}"]
+    for name, hist in sorted(snapshot.get('histograms', {}).items()):
+        mean = hist['sum'] / hist['count'] * 1000 if hist['count'] else 0.0
+        rows.append(f"{name:<32} {hist['count']:>8} {mean:>10.2f} {hist['max'] * 1000:>10.2f} "
+                    f"{quantile(hist, 0.5):>8} {quantile(hist, 0.95):>8}")
+    for name, n in sorted(snapshot.get('counters', {}).items()):
+        rows.append(f"{name:<32} {n:>8}")
+    return '\n'.join(rows)
+
+
+METRICS = Metrics()
+
+log = logging.getLogger('pyprwall')
+
+
+def fields(**kwargs):
+    """Structured per-event fields for a log call: log.info(msg, extra=fields(wallpaper=...))."""
+    return {'fields': kwargs}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """`2024-01-01T12:00:00 INFO message key=value ...`, readable in a terminal or journalctl."""
+
+    def format(self, record):
+        line = f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')} {record.levelname} {record.getMessage()}"
+        for key, value in getattr(record, 'fields', {}).items():
+            line += f" {key}={value}"
+        if getattr(record, 'suppressed', 0):
+            line += f" suppressed={record.suppressed}"
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'level': record.levelname.lower(), 'msg': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let each warning/error message template through at most `burst` times per `window`
+    seconds. The first record after a quiet period carries the number it suppressed.
+    """
+
+    def __init__(self, burst=5, window=300.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._seen = {}  # (level, template) -> [window start, emitted, suppressed]
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.levelno, record.msg)
+        now = record.created
+        state = self._seen.get(key)
+        if state is None or now - state[0] >= self.window:
+            record.suppressed = state[2] if state else 0
+            self._seen[key] = [now, 1, 0]
+            return True
+        if state[1] < self.burst:
+            state[1] += 1
+            return True
+        state[2] += 1
+        return False
+
+
+def setup_logging(level='info', json_lines=False):
+    """Configure the pyprwall logger; records below `level` cost a single level check."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonLinesFormatter() if json_lines else KeyValueFormatter())
+    handler.addFilter(RateLimitFilter())
+    log.handlers[:] = [handler]
+    log.setLevel(getattr(logging, level.upper(), logging.INFO))
+    log.propagate = False
+
+
+def get_control_socket_path():
+    """Path of the daemon's control socket ($XDG_RUNTIME_DIR/pyprwall.sock, the %t of the socket unit)"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or str(Path.home() / ".config" / "pyprwall")
+    return os.path.join(runtime_dir, CONTROL_SOCKET_NAME)
+
+
+def get_cycle_lease_path():
+    """Lock file whose holder runs the cycle timer, next to the control socket"""
+    return os.path.join(os.path.dirname(get_control_socket_path()), CYCLE_LEASE_NAME)
+
+
+def send_control_command(command, socket_path=None, timeout=5.0):
+    """Send one command to the daemon's control socket and return its decoded reply; raises OSError"""
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path or get_control_socket_path())
+        sock.sendall(f"{command}\n".encode())
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+    try:
+        return json.loads(data)
+    except ValueError:
+        raise OSError(f"Invalid reply from daemon: {data!r}")
+
+
+def hyprland_runtime_dir():
+    """$XDG_RUNTIME_DIR/hypr/$HYPRLAND_INSTANCE_SIGNATURE, where Hyprland and hyprpaper put their sockets"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or f"/run/user/{os.getuid()}"
+    return os.path.join(runtime_dir, 'hypr', os.environ.get('HYPRLAND_INSTANCE_SIGNATURE', ''))
+
+
+def hyprland_request(request, timeout):
+    """Send one request, e.g. 'j/monitors', to Hyprland's IPC socket and return the reply; raises OSError"""
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(os.path.join(hyprland_runtime_dir(), '.socket.sock'))
+        sock.sendall(request.encode())
+        data = b''
+        while True:  # Hyprland closes the connection after the reply
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return data.decode(errors='replace')
+
+
+class HyprpaperClient:
+    """
+    hyprpaper IPC with a circuit breaker. Requests go through `hyprctl hyprpaper` or,
+    with use_socket, straight to hyprpaper's socket without a process per request.
+    After HYPRPAPER_FAILURE_THRESHOLD consecutive failures requests fail at once; a
+    cheap `listloaded` probe decides when to let them through again, the wait doubling
+    from HYPRPAPER_BACKOFF[0] up to HYPRPAPER_BACKOFF[1] seconds. Failures raise OSError.
+    """
+
+    def __init__(self, use_socket=False):
+        self.use_socket = use_socket
+        self.failures = 0
+        self.delay = HYPRPAPER_BACKOFF[0]
+        self.retry_at = 0.0
+
+    @staticmethod
+    def socket_path():
+        return os.path.join(hyprland_runtime_dir(), '.hyprpaper.sock')
+
+    @property
+    def healthy(self):
+        return self.failures < HYPRPAPER_FAILURE_THRESHOLD
+
+    def retry_in(self):
+        return 0.0 if self.healthy else max(0.0, self.retry_at - time.monotonic())
+
+    def state(self):
+        return {'healthy': self.healthy, 'failures': self.failures, 'retry_in': round(self.retry_in(), 1)}
+
+    def available(self):
+        """False while the breaker is open; once a retry is due, a probe decides"""
+        if self.healthy:
+            return True
+        if time.monotonic() < self.retry_at:
+            return False
+        METRICS.count('hyprpaper.probe')
+        try:
+            self._send('listloaded', HYPRPAPER_PROBE_TIMEOUT)
+        except OSError as e:
+            log.debug("hyprpaper probe failed: %s", e)
+            return False
+        log.info("hyprpaper is answering again", extra=fields(backend='hyprpaper'))
+        return True
+
+    def request(self, command, argument):
+        """Send one hyprpaper command, e.g. request('preload', path); returns the reply"""
+        if not self.available():
+            METRICS.count('hyprpaper.fast_fail')
+            raise OSError(f"hyprpaper is not answering, next try in {self.retry_in():.0f}s")
+        return self._send(f"{command} {argument}", HYPRPAPER_TIMEOUT)
+
+    def _send(self, message, timeout):
+        import socket
+        command = message.split(' ', 1)[0]
+        try:
+            if self.use_socket:
+                with METRICS.span(f'hyprpaper.{command}'):
+                    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                        sock.settimeout(timeout)
+                        sock.connect(self.socket_path())
+                        sock.sendall(message.encode())
+                        reply = sock.recv(4096).decode(errors='replace').strip()
+            else:
+                with METRICS.span(f'hyprctl.{command}'):
+                    reply = subprocess.run(['hyprctl', 'hyprpaper', *message.split(' ', 1)], check=True,
+                                           capture_output=True, text=True, timeout=timeout).stdout.strip()
+        except (OSError, subprocess.SubprocessError) as e:
+            self._failed()
+            raise OSError(f"hyprpaper {command} failed: {e}") from e
+        self.failures = 0
+        self.delay = HYPRPAPER_BACKOFF[0]
+        if self.use_socket and command != 'listloaded' and reply != 'ok':
+            raise OSError(f"hyprpaper {command}: {reply}")  # hyprpaper is fine, the request wasn't
+        return reply
+
+    def _failed(self):
+        self.failures += 1
+        if self.failures < HYPRPAPER_FAILURE_THRESHOLD:
+            return
+        if self.failures == HYPRPAPER_FAILURE_THRESHOLD:
+            log.warning("hyprpaper failed %d times in a row, backing off", self.failures,
+                        extra=fields(backend='hyprpaper'))
+            self.delay = HYPRPAPER_BACKOFF[0]
+        else:
+            self.delay = min(self.delay * 2, HYPRPAPER_BACKOFF[1])
+        self.retry_at = time.monotonic() + self.delay
+
+
+def parse_weights(value):
+    """{path: weight} from the config; weights that aren't finite numbers >= 0 are logged and dropped"""
+    weights = {}
+    for path, weight in dict(value).items():
+        try:
+            number = float(weight)
+        except (TypeError, ValueError):
+            number = math.nan
+        if math.isfinite(number) and number >= 0:
+            weights[path] = number
+        else:
+            log.warning("Ignoring the weight %r of %s in the config", weight, path)
+    return weights
+
+
+class Settings:
+    """
+    Typed view of pyprwall.json, parsed once per version of the file. Keys that are
+    missing or don't parse are left out, so the caller's default stays in effect.
+    """
+    PARSERS = {
+        'wallpaper_dir': str,
+        'interval': int,
+        'random_order': bool,
+        'no_repeat_window': int,
+        'favorites': set,
+        'favorite_weight': float,
+        'weights': parse_weights,
+        'skip_duplicates': bool,
+        'grid_zoom': float,
+        'tags': dict,
+        'schedule': list,
+        'location': lambda value: value,
+        'lockscreen_mode': str,
+        'symlink_configs': bool,
+        'idle_aware': bool,
+        'hyprpaper_socket': bool,
+        'service_mode': str,
+    }
+
+    def __init__(self, config):
+        self.values = {}
+        for key, parse in self.PARSERS.items():
+            if key not in config:
+                continue
+            try:
+                self.values[key] = parse(config[key])
+            except (TypeError, ValueError) as e:
+                log.warning("Ignoring %s in the config: %s", key, e)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def changed(self, other):
+        """Keys whose values differ between the two settings"""
+        return {key for key in self.PARSERS if self.values.get(key) != other.values.get(key)}
+
+
+class Playlist:
+    """
+    Compact wallpaper sequence and scheduling engine for cycling.
+
+    Paths are stored as an interned directory table plus, per entry, a directory
+    index and an offset into one NUL-joined string of file names: a few bytes per
+    wallpaper instead of a full path string each.
+
+    Random orders are generated lazily, one O(1) step per wallpaper, in epochs of
+    len(self) steps seeded from (seed, epoch):
+    - 'shuffle' is a sparse Fisher-Yates permutation (each wallpaper once per epoch)
+    - 'weighted' draws from a Vose alias table, for per-item weights or favorites
+    Both avoid the last `no_repeat` wallpapers while alternatives remain. Because
+    the steps are deterministic, seed, epoch, step and the carried-over window are
+    all that is persisted; restore() replays at most one epoch.
+    """
+    NO_REPEAT_TRIES = 8
+
+    def __init__(self, paths, random_order=False, seed=None, no_repeat=0, weights=None):
+        self.dirs = []
+        dir_ids = {}
+        self._dir_of = array('I')
+        self._offsets = array('I', [0])
+        names = []
+        item_weights = array('d')
+        position = 0
+        for path in paths:
+            directory, name = os.path.split(path)
+            dir_id = dir_ids.get(directory)
+            if dir_id is None:
+                dir_id = dir_ids[directory] = len(self.dirs)
+                self.dirs.append(sys.intern(directory))
+            self._dir_of.append(dir_id)
+            names.append(name)
+            position += len(name) + 1
+            self._offsets.append(position)
+            if weights:
+                item_weights.append(max(0.0, float(weights.get(path, 1.0))))
+        self._names = '\0'.join(names) + '\0' if names else ''
+        self.checksum = zlib.crc32('\0'.join(self.dirs + [self._names]).encode('utf-8', 'surrogateescape'))
+        self._index = None
+
+        self._alias = None
+        if random_order and weights and any(w != 1.0 for w in item_weights) and sum(item_weights) > 0:
+            self._alias = self._build_alias(item_weights)
+        if not random_order:
+            self.order = 'sequential'
+        else:
+            self.order = 'weighted' if self._alias else 'shuffle'
+
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.no_repeat = max(0, min(no_repeat, len(self) // 2))
+        self._recent = deque()
+        self._recent_set = set()
+        self._current = None  # item index of the current wallpaper
+        self._peeked = None  # item index drawn by peek() and not shown yet
+        self.cursor = -1  # sequential position, -1 before the first wallpaper
+        self._start_epoch(0)
+        self._committed = (0, 0, [])
+
+    def __len__(self):
+        return len(self._dir_of)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        name = self._names[self._offsets[index]:self._offsets[index + 1] - 1]
+        return os.path.join(self.dirs[self._dir_of[index]], name)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def index_of(self, path):
+        """Item index of path, or None. Uses a hash index built on first use"""
+        if self._index is None:
+            # Keyed by hash so the index doesn't hold a second copy of every path
+            self._index = {}
+            for index, candidate in enumerate(self):
+                self._index.setdefault(hash(candidate), index)
+        index = self._index.get(hash(path))
+        if index is not None and self[index] == path:
+            return index
+        for index, candidate in enumerate(self):  # hash collision, rare
+            if candidate == path:
+                return index
+        return None
+
+    @staticmethod
+    def _build_alias(weights):
+        """Vose's alias method: O(n) setup for O(1) weighted draws"""
+        n = len(weights)
+        total = sum(weights)
+        prob = array('d', (w * n / total for w in weights))
+        alias = array('I', bytes(4 * n))
+        small = [i for i, p in enumerate(prob) if p < 1.0]
+        large = [i for i, p in enumerate(prob) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            alias[less] = more
+            prob[more] = prob[more] + prob[less] - 1.0
+            (small if prob[more] < 1.0 else large).append(more)
+        for i in small + large:
+            prob[i] = 1.0
+        return prob, alias
+
+    def _start_epoch(self, epoch):
+        self.epoch = epoch
+        self._rng = random.Random(self.seed * 1000003 + epoch)
+        self._swaps = {}
+        self._step = 0
+        self._carry = list(self._recent)
+
+    def _remember(self, item):
+        if not self.no_repeat:
+            return
+        if len(self._recent) == self.no_repeat:
+            self._recent_set.discard(self._recent.popleft())
+        self._recent.append(item)
+        self._recent_set.add(item)
+
+    def _draw(self):
+        """Draw the item for the next random step; O(1) expected"""
+        n = len(self)
+        if self._step >= n:
+            self._start_epoch(self.epoch + 1)
+        step = self._step
+        if self._alias is None:
+            # Sparse Fisher-Yates: slots not in _swaps still hold their own index
+            for _ in range(self.NO_REPEAT_TRIES):
+                slot = self._rng.randrange(step, n)
+                if self._swaps.get(slot, slot) not in self._recent_set:
+                    break
+            item = self._swaps.get(slot, slot)
+            self._swaps[slot] = self._swaps.pop(step, step)
+        else:
+            prob, alias = self._alias
+            for _ in range(self.NO_REPEAT_TRIES):
+                slot = self._rng.randrange(n)
+                item = slot if self._rng.random() < prob[slot] else alias[slot]
+                if item not in self._recent_set:
+                    break
+        self._step += 1
+        self._remember(item)
+        return item
+
+    def current(self):
+        """The current wallpaper, or None before the first advance()"""
+        return self[self._current] if self._current is not None else None
+
+    def peek(self):
+        """The wallpaper advance() will return, without moving; O(1)"""
+        if not len(self):
+            return None
+        if self.order == 'sequential':
+            return self[(self.cursor + 1) % len(self)]
+        if self._peeked is None:
+            self._peeked = self._draw()
+        return self[self._peeked]
+
+    def advance(self):
+        """Move to the next wallpaper and return it; O(1)"""
+        if not len(self):
+            return None
+        if self.order == 'sequential':
+            self.cursor = (self.cursor + 1) % len(self)
+            self._current = self.cursor
+        else:
+            self._current = self._peeked if self._peeked is not None else self._draw()
+            self._peeked = None
+            self._committed = (self.epoch, self._step, self._carry)
+        return self.current()
+
+    def seek(self, path):
+        """Make path the current wallpaper; returns False if it isn't in the playlist"""
+        index = self.index_of(path)
+        if index is None:
+            return False
+        self._current = index
+        if self.order == 'sequential':
+            self.cursor = index
+        return True
+
+    def state(self):
+        """The few numbers needed to reproduce the order and position"""
+        epoch, step, carry = self._committed
+        if self.order == 'sequential':
+            epoch, step, carry = 0, self.cursor, []
+        return {'order': self.order, 'seed': self.seed, 'epoch': epoch, 'cursor': step,
+                'carry': carry, 'count': len(self), 'checksum': self.checksum}
+
+    def restore(self, state):
+        """Resume from state(); returns False (and changes nothing) if it belongs to other contents"""
+        if (not state or state.get('count') != len(self) or state.get('checksum') != self.checksum
+                or state.get('order') != self.order):
+            return False
+        if self.order == 'sequential':
+            self.cursor = min(state['cursor'], len(self) - 1)
+            self._current = self.cursor if self.cursor >= 0 else None
+            return True
+        self.seed = state['seed']
+        self._recent.clear()
+        self._recent_set.clear()
+        for item in state.get('carry', [])[-self.no_repeat:] if self.no_repeat else []:
+            self._remember(item)
+        self._start_epoch(state['epoch'])
+        self._current = self._peeked = None
+        for _ in range(min(state['cursor'], len(self))):
+            self._current = self._draw()
+        self._committed = (self.epoch, self._step, self._carry)
+        return True
+
+
+def sun_times(day, latitude, longitude):
+    """
+    Sunrise and sunset on day as unix timestamps, using the sunrise equation
+    (about a minute of error). Returns None during polar day or night.
+    """
+    n = day.toordinal() - datetime.date(2000, 1, 1).toordinal()
+    mean_noon = n - longitude / 360
+    anomaly = math.radians((357.5291 + 0.98560028 * mean_noon) % 360)
+    center = 1.9148 * math.sin(anomaly) + 0.02 * math.sin(2 * anomaly) + 0.0003 * math.sin(3 * anomaly)
+    ecliptic = math.radians((math.degrees(anomaly) + center + 180 + 102.9372) % 360)
+    transit = 2451545.0 + mean_noon + 0.0053 * math.sin(anomaly) - 0.0069 * math.sin(2 * ecliptic)
+    declination = math.asin(math.sin(ecliptic) * math.sin(math.radians(23.4397)))
+    lat = math.radians(latitude)
+    cos_hour = ((math.sin(math.radians(-0.833)) - math.sin(lat) * math.sin(declination))
+                / (math.cos(lat) * math.cos(declination)))
+    if not -1.0 <= cos_hour <= 1.0:
+        return None
+    half_day = math.degrees(math.acos(cos_hour)) / 360
+    return ((transit - half_day - 2440587.5) * 86400, (transit + half_day - 2440587.5) * 86400)
+
+
+def parse_schedule_time(spec):
+    """Parse 'HH:MM', 'sunrise' or 'sunset' with an optional '+MM'/'-MM' offset into (anchor, minutes)"""
+    spec = spec.strip().lower()
+    for anchor in ('sunrise', 'sunset'):
+        if spec.startswith(anchor):
+            offset = spec[len(anchor):].strip()
+            return anchor, int(offset) if offset else 0
+    hours, minutes = spec.split(':')
+    return 'midnight', int(hours) * 60 + int(minutes)
+
+
+class Schedule:
+    """
+    Time-of-day wallpaper ranges, resolved through a precomputed timeline.
+
+    Each rule is {"from": TIME, "to": TIME, "wallpaper": PATH, "monitor": NAME}
+    where TIME is 'HH:MM', 'sunrise' or 'sunset' (optionally '+MM'/'-MM') and
+    monitor is optional; later rules win where they overlap and ranges may wrap
+    past midnight. The timeline covers the days around the requested time as
+    sorted boundaries, each with the {monitor: wallpaper} mapping that holds
+    until the next one ('' applies to every monitor), so resolving is a bisect.
+    """
+
+    def __init__(self, rules, location=None):
+        self.rules = []
+        for rule in rules or []:
+            try:
+                start, end = parse_schedule_time(rule['from']), parse_schedule_time(rule['to'])
+                self.rules.append((start, end, rule.get('monitor') or '', rule['wallpaper']))
+            except (KeyError, ValueError, AttributeError) as e:
+                log.warning("Ignoring schedule rule %r: %s", rule, e)
+                continue
+            if not location and {start[0], end[0]} != {'midnight'}:
+                log.warning("Schedule rule %r needs a location for sunrise/sunset, it never applies", rule)
+        self.location = location
+        self._day = None
+        self._starts = []
+        self._mappings = []
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def _moment(self, day, anchor_minutes):
+        anchor, minutes = anchor_minutes
+        if anchor == 'midnight':
+            base = datetime.datetime.combine(day, datetime.time()).timestamp()
+        else:
+            if not self.location:
+                return None
+            sun = sun_times(day, self.location['latitude'], self.location['longitude'])
+            if sun is None:
+                return None
+            base = sun[0] if anchor == 'sunrise' else sun[1]
+        return base + minutes * 60
+
+    def _build(self, day):
+        intervals = []
+        for offset in (-1, 0, 1):
+            current = day + datetime.timedelta(days=offset)
+            for priority, (start_spec, end_spec, monitor, wallpaper) in enumerate(self.rules):
+                start, end = self._moment(current, start_spec), self._moment(current, end_spec)
+                if start is None or end is None:
+                    continue
+                if end <= start:
+                    end += 86400
+                intervals.append((start, end, priority, monitor, wallpaper))
+        points = sorted({p for start, end, *_ in intervals for p in (start, end)})
+        self._starts, self._mappings = [], []
+        for point in points:
+            active = sorted((i for i in intervals if i[0] <= point < i[1]), key=lambda i: i[2])
+            mapping = {monitor: wallpaper for _s, _e, _p, monitor, wallpaper in active}
+            if not self._mappings or mapping != self._mappings[-1]:
+                self._starts.append(point)
+                self._mappings.append(mapping)
+        self._day = day
+
+    def _ensure(self, now):
+        day = datetime.date.fromtimestamp(now)
+        if day != self._day:
+            self._build(day)
+
+    def resolve(self, now=None):
+        """{monitor: wallpaper} in effect at now, '' meaning every monitor"""
+        if not self.rules:
+            return {}
+        now = time.time() if now is None else now
+        self._ensure(now)
+        index = bisect.bisect_right(self._starts, now) - 1
+        return self._mappings[index] if index >= 0 else {}
+
+    def next_boundary(self, now=None):
+        """Timestamp of the next change after now, or None if nothing is scheduled"""
+        if not self.rules:
+            return None
+        now = time.time() if now is None else now
+        self._ensure(now)
+        index = bisect.bisect_right(self._starts, now)
+        return self._starts[index] if index < len(self._starts) else None
+
+
+class Notifier:
+    """
+    Desktop notifications over a persistent session bus connection to
+    org.freedesktop.Notifications. Notify is called asynchronously, so a slow
+    notification daemon never blocks the caller. Messages sent with the same
+    replace_key replace each other on screen; other messages are dropped if the
+    identical text was already shown within `min_interval` seconds.
+    """
+    BUS_NAME = 'org.freedesktop.Notifications'
+    OBJECT_PATH = '/org/freedesktop/Notifications'
+
+    def __init__(self, app_name='PyprWall', icon='preferences-desktop-wallpaper', min_interval=5.0):
+        self.app_name = app_name
+        self.icon = icon
+        self.min_interval = min_interval
+        self._connection = None
+        self._ids = {}  # replace_key -> id returned by the server
+        self._last_sent = {}  # message -> monotonic time
+
+    def _get_connection(self):
+        if self._connection is None or self._connection.is_closed():
+            self._connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        return self._connection
+
+    def _rate_limited(self, message):
+        now = time.monotonic()
+        if len(self._last_sent) > 64:
+            self._last_sent = {m: t for m, t in self._last_sent.items() if now - t < self.min_interval}
+        last = self._last_sent.get(message)
+        if last is not None and now - last < self.min_interval:
+            return True
+        self._last_sent[message] = now
+        return False
+
+    def notify(self, message, replace_key=None):
+        """Send a notification; returns False if it was rate limited. Raises GLib.Error without a bus."""
+        if replace_key is None and self._rate_limited(message):
+            METRICS.count('notify.rate_limited')
+            return False
+        params = GLib.Variant('(susssasa{sv}i)', (
+            self.app_name, self._ids.get(replace_key, 0), self.icon, self.app_name, message,
+            [], {'desktop-entry': GLib.Variant('s', 'pyprwall')}, -1))
+        self._get_connection().call(
+            self.BUS_NAME, self.OBJECT_PATH, self.BUS_NAME, 'Notify', params,
+            GLib.VariantType.new('(u)'), Gio.DBusCallFlags.NONE, -1, None,
+            self._on_notify_finished, replace_key)
+        return True
+
+    def _on_notify_finished(self, connection, result, replace_key):
+        try:
+            notification_id = connection.call_finish(result).unpack()[0]
+        except GLib.Error as e:
+            log.warning("Notification error: %s", e.message)
+            return
+        if replace_key is not None:
+            self._ids[replace_key] = notification_id
+
+
+class HammingIndex:
+    """
+    Multi-index hashing for near-duplicate lookups over 64-bit perceptual hashes.
+    Each hash is split into max_distance + 1 chunks; by the pigeonhole principle two
+    hashes at most max_distance bits apart agree on a whole chunk, so a query only
+    compares the few items sharing a chunk value instead of the whole library.
+    """
+
+    def __init__(self, max_distance=DUPLICATE_DISTANCE, bits=64):
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        self.spans = []
+        start = 0
+        for i in range(chunks):
+            width = bits // chunks + (i < bits % chunks)
+            self.spans.append((start, (1 << width) - 1))
+            start += width
+        self.tables = [{} for _ in self.spans]
+        self.values = []
+
+    def add(self, value):
+        """Index value and return its item number"""
+        item = len(self.values)
+        self.values.append(value)
+        for table, (shift, mask) in zip(self.tables, self.spans):
+            table.setdefault((value >> shift) & mask, []).append(item)
+        return item
+
+    def query(self, value):
+        """Item numbers within max_distance bits of value"""
+        found = set()
+        values, limit = self.values, self.max_distance
+        for table, (shift, mask) in zip(self.tables, self.spans):
+            for item in table.get((value >> shift) & mask, ()):
+                if bin(values[item] ^ value).count('1') <= limit:
+                    found.add(item)
+        return found
+
+
+def find_duplicates(index, paths):
+    """
+    Group near-duplicate wallpapers by their dHash in the library index. Returns
+    {path: kept path} for every path with a duplicate; the largest file of each
+    group is kept. Paths that haven't been analyzed are never duplicates.
+    """
+    hashes = HammingIndex()
+    members = []
+    parent = []
+
+    def root(item):
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for path in paths:
+        entry = index.get(path)
+        if not entry or 'dhash' not in entry:
+            continue
+        value = int(entry['dhash'], 16)
+        # Query before adding, so each pair is compared once
+        matches = hashes.query(value)
+        item = hashes.add(value)
+        members.append(path)
+        parent.append(item)
+        for other in matches:
+            parent[root(other)] = item
+    groups = {}
+    for item, path in enumerate(members):
+        groups.setdefault(root(item), []).append(path)
+    duplicates = {}
+    for group in groups.values():
+        if len(group) > 1:
+            keep = max(group, key=lambda p: (index.get(p).get('size', 0), p))
+            duplicates.update(dict.fromkeys(group, keep))
+    return duplicates
+
+
+class LibraryIndex:
+    """
+    Per-wallpaper analysis results (dominant color, brightness, ...) in one JSON
+    file, keyed by path. An entry only counts while the file's mtime is unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f).get('entries', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable library index %s: %s", path, e)
+
+    def get(self, path, mtime=None):
+        entry = self.entries.get(path)
+        if entry is None or (mtime is not None and entry.get('mtime') != mtime):
+            return None
+        return entry
+
+    def update(self, path, mtime, values):
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is None or entry.get('mtime') != mtime:
+                entry = self.entries[path] = {'mtime': mtime}
+            entry.update(values)
+            self._dirty = True
+
+    def save(self):
+        """Write the index if anything changed, atomically"""
+        with self._lock:
+            if not self._dirty:
+                return
+            temp = f"{self.path}.tmp"
+            with open(temp, 'w') as f:
+                json.dump({'version': 1, 'entries': self.entries}, f)
+            os.replace(temp, self.path)
+            self._dirty = False
+
+
+class ThumbnailAnalyzer:
+    """
+    Feeds thumbnails to analyze_batch in a process pool, ANALYSIS_BATCH at a time,
+    and stores the results in a LibraryIndex. Thumbnails are first scaled down to
+    ANALYSIS_SIZE (colors) and the dHash grid, and at most a few batches are in
+    flight, so memory stays flat.
+    Without a usable pool (or for a handful of images) batches run in the caller.
+    """
+
+    def __init__(self, index, workers=None):
+        self.index = index
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.pool = None
+        self.pending = []
+        self.futures = deque()
+        self.analyzed = 0
+
+    @staticmethod
+    def _buffer(pixbuf, width, height):
+        # BILINEAR averages over the covered area when shrinking
+        small = pixbuf.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR)
+        return (small.get_pixels(), small.get_width(), small.get_height(),
+                small.get_rowstride(), small.get_n_channels())
+
+    def add(self, path, stat, pixbuf):
+        self.pending.append((path, int(stat.st_mtime), {'size': stat.st_size},
+                             self._buffer(pixbuf, *ANALYSIS_SIZE), self._buffer(pixbuf, DHASH_SIZE + 1, DHASH_SIZE)))
+        if len(self.pending) >= ANALYSIS_BATCH:
+            self._submit()
+
+    @staticmethod
+    @contextmanager
+    def _worker_main():
+        """
+        Spawned workers re-run the parent's __main__ first, which for this script means
+        importing GTK and Adw and connecting to the display in every worker. While workers
+        start, __main__ names the GTK-free analysis module instead, so that is all they run.
+        """
+        main = sys.modules['__main__']
+        saved = getattr(main, '__spec__', None)
+        main.__spec__ = importlib.util.find_spec('pyprwall_analysis')
+        try:
+            yield
+        finally:
+            main.__spec__ = saved
+
+    def _submit(self):
+        batch, self.pending = self.pending, []
+        if self.pool is None:
+            try:
+                # spawn: forking a process with GTK and loader threads running isn't safe
+                self.pool = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context('spawn'))
+            except (OSError, ValueError) as e:
+                log.warning("No process pool for thumbnail analysis (%s), analyzing in this thread", e)
+                self.pool = False
+        if self.pool:
+            with self._worker_main():  # submit() starts the workers as they are needed
+                self.futures.append(self.pool.submit(analyze_batch, batch))
+            while len(self.futures) > 2 * self.workers:
+                self._collect(self.futures.popleft())
+        else:
+            self._store(analyze_batch(batch))
+
+    def _collect(self, future):
+        try:
+            self._store(future.result())
+        except Exception as e:
+            log.warning("Thumbnail analysis failed: %s", e)
+
+    def _store(self, results):
+        for path, mtime, values in results:
+            self.index.update(path, mtime, values)
+        self.analyzed += len(results)
+
+    def finish(self):
+        """Analyze what is left, wait for the pool, save the index; returns the number analyzed"""
+        if self.pending:
+            if self.pool is None and len(self.pending) < ANALYSIS_BATCH:
+                self.pool = False  # not worth starting processes for
+            self._submit()
+        while self.futures:
+            self._collect(self.futures.popleft())
+        if self.pool:
+            self.pool.shutdown()
+        self.pool = None
+        try:
+            self.index.save()
+        except OSError as e:
+            log.warning("Could not save the library index: %s", e)
+        return self.analyzed
+
+
+class FolderScan:
+    """
+    One pass over a folder with os.scandir, in a background thread. The entry types
+    come with the listing and each image is stat()ed once, which matters on network
+    mounts where every call is a round-trip. batches() yields lists of (path, stat)
+    as they are read, and raises TimeoutError when the folder stops answering for
+    `timeout` seconds (a hung mount; the thread is left to finish on its own).
+    With known_mtime, a folder whose mtime still matches isn't listed at all; check
+    `unchanged`. batches() then yields the known_paths that still exist, stat()ed in
+    the same thread and under the same timeout. After a pass, meta is the folder's
+    change-detection record.
+    """
+
+    def __init__(self, folder, known_mtime=None, known_paths=(), timeout=FOLDER_SCAN_TIMEOUT):
+        self.folder = folder
+        self.known_mtime = known_mtime
+        self.known_paths = known_paths
+        self.timeout = timeout
+        self.unchanged = False
+        self.meta = None
+        self._queue = queue.Queue()
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def _run(self):
+        try:
+            mtime = os.stat(self.folder).st_mtime  # before listing, so a change during it shows next time
+            batch = []
+            if mtime == self.known_mtime:
+                self.unchanged = True
+                for path in self.known_paths:
+                    try:
+                        batch.append((path, os.stat(path)))
+                    except OSError:
+                        continue  # removed or unreadable since it was listed
+                    if len(batch) >= GRID_BATCH:
+                        self._queue.put(batch)
+                        batch = []
+            else:
+                with os.scandir(self.folder) as entries:
+                    for entry in entries:
+                        if os.path.splitext(entry.name)[1].lower() not in SUPPORTED_FORMATS:
+                            continue
+                        try:
+                            if entry.is_file():
+                                batch.append((entry.path, entry.stat()))
+                        except OSError:
+                            continue  # vanished while listing
+                        if len(batch) >= GRID_BATCH:
+                            self._queue.put(batch)
+                            batch = []
+            if batch:
+                self._queue.put(batch)
+            self.meta = {'mtime': mtime}
+            self._queue.put(None)
+        except OSError as e:
+            self._queue.put(e)
+
+    def batches(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"{self.folder} did not answer for {self.timeout}s") from None
+            if item is None:
+                return
+            if isinstance(item, OSError):
+                raise item
+            yield item
+
+
+class ThumbnailPaintable(GObject.Object, Gdk.Paintable):
+    """
+    A thumbnail texture with a fixed intrinsic size in logical pixels. Textures made
+    for the display's scale factor are larger than their cell, so Gtk.Picture would
+    otherwise grow the cell instead of drawing them sharp at device resolution.
+    """
+
+    def __init__(self, texture, width, height):
+        super().__init__()
+        self.texture = texture
+        self.width, self.height = width, height
+
+    def resize(self, width, height):
+        self.width, self.height = width, height
+        self.invalidate_size()
+
+    def do_get_intrinsic_width(self):
+        return round(min(self.width, self.height * self.do_get_intrinsic_aspect_ratio()))
+
+    def do_get_intrinsic_height(self):
+        return round(min(self.height, self.width / self.do_get_intrinsic_aspect_ratio()))
+
+    def do_get_intrinsic_aspect_ratio(self):
+        return self.texture.get_width() / self.texture.get_height()
+
+    def do_snapshot(self, snapshot, width, height):
+        self.texture.snapshot(snapshot, width, height)
+
+
+class SearchIndex:
+    """
+    Search over wallpaper names, subfolders and tags. Each wallpaper's text (its
+    path below the library folder plus its tags, lowercased) is indexed by trigram.
+    A query term of 3+ characters must occur in the text: its trigram postings are
+    intersected, rarest first, and longer terms verified against the survivors.
+    Shorter terms must start a word and are looked up in a sorted word list.
+    Results are sets of document ids; query(within=...) narrows a previous result
+    instead, which is cheaper while the user keeps typing (see refines()).
+    """
+
+    def __init__(self, paths, root=None, tags=None):
+        self.paths = list(paths)
+        self.doc_of = {path: doc for doc, path in enumerate(self.paths)}
+        self.texts = []
+        self.trigrams = {}
+        words = []
+        for doc, path in enumerate(self.paths):
+            name = os.path.relpath(path, root) if root else os.path.basename(path)
+            text = ' '.join([name.replace(os.sep, ' ')] + list((tags or {}).get(path, ()))).lower()
+            self.texts.append(text)
+            for gram in {text[i:i + 3] for i in range(len(text) - 2)}:
+                self.trigrams.setdefault(gram, []).append(doc)
+            words.extend((word, doc) for word in SEARCH_WORD_SPLIT.split(text) if word)
+        words.sort()
+        self.words = words
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _term_docs(self, term):
+        if len(term) >= 3:
+            postings = []
+            for gram in {term[i:i + 3] for i in range(len(term) - 2)}:
+                posting = self.trigrams.get(gram)
+                if posting is None:
+                    return set()
+                postings.append(posting)
+            postings.sort(key=len)
+            docs = set(postings[0])
+            for posting in postings[1:]:
+                docs.intersection_update(posting)
+            if len(term) > 3:
+                docs = {doc for doc in docs if term in self.texts[doc]}
+            return docs
+        docs = set()
+        for i in range(bisect.bisect_left(self.words, (term,)), len(self.words)):
+            word, doc = self.words[i]
+            if not word.startswith(term):
+                break
+            docs.add(doc)
+        return docs
+
+    @staticmethod
+    def refines(old, new):
+        """
+        Whether everything new matches also matches old, so old's result can be narrowed.
+        Appending characters isn't enough: a term crossing from 2 to 3 characters switches
+        from word prefix to substring matching.
+        """
+        new_terms = new.lower().split()
+        for prev in old.lower().split():
+            if len(prev) >= 3:
+                if not any(len(term) >= 3 and prev in term for term in new_terms):
+                    return False
+            elif not any(len(term) < 3 and term.startswith(prev) for term in new_terms):
+                return False
+        return True
+
+    def _matches(self, doc, terms):
+        text = self.texts[doc]
+        for term in terms:
+            if len(term) >= 3:
+                if term not in text:
+                    return False
+            elif not any(word.startswith(term) for word in SEARCH_WORD_SPLIT.split(text)):
+                return False
+        return True
+
+    def query(self, text, within=None):
+        """Ids of the documents matching every term of text, optionally only among within"""
+        terms = text.lower().split()
+        if within is not None and len(within) <= SEARCH_REFINE_LIMIT:
+            return {doc for doc in within if self._matches(doc, terms)}
+        docs = None
+        for term in sorted(terms, key=len, reverse=True):
+            found = self._term_docs(term)
+            docs = found if docs is None else docs & found
+            if not docs:
+                break
+        return docs if docs is not None else set(range(len(self.paths)))
+
+
+class HyprlangLine:
+    """One physical line of a Hyprlang file, kept verbatim apart from an edited value."""
+    __slots__ = ('raw', 'key', '_value_start', '_value_end')
+
+    def __init__(self, raw, key=None, value_start=0, value_end=0):
+        self.raw = raw
+        self.key = key
+        self._value_start = value_start
+        self._value_end = value_end
+
+    @property
+    def value(self):
+        return self.raw[self._value_start:self._value_end] if self.key is not None else None
+
+    def set_value(self, value):
+        if value == self.value:
+            return
+        prefix = self.raw[:self._value_start]
+        if not self.value and prefix.endswith('='):
+            prefix += ' '
+        self.raw = prefix + value + self.raw[self._value_end:]
+        self._value_start = len(prefix)
+        self._value_end = len(prefix) + len(value)
+
+
+class HyprlangBlock:
+    """A `name { ... }` category: its opening and closing lines plus child lines and blocks."""
+
+    def __init__(self, name=None, open_line=None):
+        self.name = name
+        self.open_line = open_line
+        self.children = []
+        self.close_line = None
+
+    def render(self, out):
+        if self.open_line:
+            out.append(self.open_line.raw)
+        for child in self.children:
+            if isinstance(child, HyprlangBlock):
+                child.render(out)
+            else:
+                out.append(child.raw)
+        if self.close_line:
+            out.append(self.close_line.raw)
+
+    def blocks(self, name):
+        """Every block called name below this one, in file order"""
+        found = []
+        for child in self.children:
+            if isinstance(child, HyprlangBlock):
+                if child.name == name:
+                    found.append(child)
+                found.extend(child.blocks(name))
+        return found
+
+    def find(self, key):
+        """Direct `key = value` lines of this block"""
+        return [c for c in self.children if isinstance(c, HyprlangLine) and c.key == key]
+
+    def get(self, key, default=None):
+        lines = self.find(key)
+        return lines[-1].value if lines else default
+
+    def set(self, key, value):
+        """Set every `key` line of this block to value, adding one if there is none"""
+        lines = self.find(key)
+        for line in lines:
+            line.set_value(value)
+        if not lines:
+            self.insert(len(self.children), key, value)
+
+    def remove(self, line):
+        self.children.remove(line)
+
+    def insert(self, index, key, value):
+        """Insert a `key = value` line at index, indented like the block's other assignments"""
+        indent = next((c.raw[:len(c.raw) - len(c.raw.lstrip())] for c in self.children
+                       if isinstance(c, HyprlangLine) and c.key), None)
+        if indent is None:
+            indent = '' if self.open_line is None else self.open_line.raw[:len(self.open_line.raw) - len(self.open_line.raw.lstrip())] + '    '
+        self._terminate_before(index)
+        prefix = f"{indent}{key} = " if value else f"{indent}{key} ="
+        line = HyprlangLine(f"{prefix}{value}\n", key, len(prefix), len(prefix) + len(value))
+        self.children.insert(index, line)
+        return line
+
+    def append_block(self, name, items):
+        """Append `name { key = value ... }` with items as (key, value) pairs"""
+        indent = '' if self.open_line is None else self.open_line.raw[:len(self.open_line.raw) - len(self.open_line.raw.lstrip())] + '    '
+        self._terminate_before(len(self.children))
+        if self.children and not isinstance(self.children[-1], HyprlangBlock) and self.children[-1].raw.strip():
+            self.children.append(HyprlangLine('\n'))
+        block = HyprlangBlock(name, HyprlangLine(f"{indent}{name} {{\n"))
+        block.close_line = HyprlangLine(f"{indent}}}\n")
+        self.children.append(block)
+        for key, value in items:
+            block.insert(len(block.children), key, value)
+        return block
+
+    def _terminate_before(self, index):
+        # A last line without a newline would swallow what gets inserted after it
+        previous = self.children[index - 1] if index > 0 else self.open_line
+        while isinstance(previous, HyprlangBlock):
+            previous = previous.close_line or (previous.children[-1] if previous.children else previous.open_line)
+        if previous is not None and not previous.raw.endswith('\n'):
+            previous.raw += '\n'
+
+
+class HyprlangConfig:
+    """
+    Round-trip editor for Hyprlang files (hyprpaper.conf, hyprlock.conf).
+
+    The text is split into lines and nested `name { }` blocks; every line keeps its
+    original bytes, and editing a value only replaces the value's span, so comments,
+    spacing and unrelated keys come back out unchanged. render() == source means
+    nothing changed and save() skips the write.
+    """
+
+    def __init__(self, text=''):
+        self.source = text
+        self.root = HyprlangBlock()
+        stack = [self.root]
+        for raw in text.splitlines(keepends=True):
+            content = self._strip_comment(raw)
+            stripped = content.strip()
+            if stripped.endswith('{'):
+                block = HyprlangBlock(stripped[:-1].strip(), HyprlangLine(raw))
+                stack[-1].children.append(block)
+                stack.append(block)
+            elif stripped == '}' and len(stack) > 1:
+                stack.pop().close_line = HyprlangLine(raw)
+            elif '=' in stripped:
+                key, _, _ = content.partition('=')
+                value_start = len(key) + 1
+                value_start += len(content[value_start:]) - len(content[value_start:].lstrip())
+                value_end = max(value_start, len(content.rstrip()))
+                stack[-1].children.append(HyprlangLine(raw, key.strip(), value_start, value_end))
+            else:
+                stack[-1].children.append(HyprlangLine(raw))
+
+    @staticmethod
+    def _strip_comment(raw):
+        """The line without its comment and newline; '##' is an escaped '#'"""
+        i = 0
+        while True:
+            i = raw.find('#', i)
+            if i < 0:
+                return raw.rstrip('\r\n')
+            if raw.startswith('##', i):
+                i += 2
+                continue
+            return raw[:i]
+
+    @classmethod
+    def load(cls, path):
+        """Parse path; a missing file gives an empty config"""
+        try:
+            with open(path, 'r') as f:
+                return cls(f.read())
+        except FileNotFoundError:
+            return cls()
+
+    def render(self):
+        out = []
+        self.root.render(out)
+        return ''.join(out)
+
+    @property
+    def changed(self):
+        return self.render() != self.source
+
+    def save(self, path):
+        """Write the config if it changed; returns whether it did"""
+        text = self.render()
+        if text == self.source:
+            return False
+        with open(path, 'w') as f:
+            f.write(text)
+        self.source = text
+        return True
+
+
+def point_symlink(link, target):
+    """Atomically (re)point link at target: one symlink() and one rename()"""
+    temp = f"{link}.{os.getpid()}.tmp"
+    try:
+        os.unlink(temp)
+    except FileNotFoundError:
+        pass
+    os.symlink(target, temp)
+    os.replace(temp, link)
+
+
+class CycleLease:
+    """
+    The right to run the cycle timer: an flock on a file in the runtime directory,
+    so the GUI and the daemon never cycle at the same time. The kernel drops the
+    lock when its holder exits, so a crashed owner never blocks the others.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, role):
+        """Take the lease (a no-op if we hold it); False if another process does"""
+        if self.fd is not None:
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as e:
+            log.warning("Can't open the cycle lease %s (%s), cycling without it", self.path, e)
+            return True
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()} {role}\n".encode())
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)  # closing drops the lock
+            self.fd = None
+
+    def holder(self):
+        """'<pid> <role>' of the last process to take the lease"""
+        try:
+            with open(self.path) as f:
+                return f.read().strip() or 'unknown'
+        except OSError:
+            return 'unknown'
+
+
+class LockWatcher:
+    """
+    Calls back just before the lockscreen is needed, from logind on the system bus:
+    Manager.PrepareForSleep(true) and Session.Lock (loginctl lock-session, which
+    hypridle turns into its lock_cmd). Any session's Lock is accepted; preparing
+    once too often is cheap.
+    """
+    BUS_NAME = 'org.freedesktop.login1'
+    MANAGER_PATH = '/org/freedesktop/login1'
+    MANAGER_IFACE = 'org.freedesktop.login1.Manager'
+    SESSION_IFACE = 'org.freedesktop.login1.Session'
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._connection = None
+        self._subscriptions = []
+
+    def start(self):
+        """Subscribe to the logind signals; returns False without a system bus."""
+        if self._subscriptions:
+            return True
+        try:
+            self._connection = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+        except GLib.Error as e:
+            log.warning("No system bus, the lockscreen won't be prepared on lock: %s", e.message)
+            return False
+        self._subscriptions = [
+            self._connection.signal_subscribe(self.BUS_NAME, self.MANAGER_IFACE, 'PrepareForSleep',
+                                              self.MANAGER_PATH, None, Gio.DBusSignalFlags.NONE,
+                                              self._on_prepare_for_sleep, None),
+            self._connection.signal_subscribe(self.BUS_NAME, self.SESSION_IFACE, 'Lock', None, None,
+                                              Gio.DBusSignalFlags.NONE, self._on_lock, None),
+        ]
+        return True
+
+    def stop(self):
+        for subscription in self._subscriptions:
+            self._connection.signal_unsubscribe(subscription)
+        self._subscriptions = []
+
+    def _on_prepare_for_sleep(self, connection, sender, path, interface, signal, params, _data):
+        if params.unpack()[0]:
+            self.callback('sleep')
+
+    def _on_lock(self, connection, sender, path, interface, signal, params, _data):
+        self.callback('lock')
+
+
+class PresenceWatcher:
+    """
+    Whether anybody can see the wallpaper. Follows logind's IdleHint and LockedHint
+    of our session (set by hypridle/swayidle and loginctl lock-session) through
+    PropertiesChanged, and asks Hyprland for the outputs' DPMS state when it matters.
+    Calls back with 'active' when the session stops being idle or locked, and with
+    'resume' after a suspend.
+    """
+    BUS_NAME = 'org.freedesktop.login1'
+    MANAGER_PATH = '/org/freedesktop/login1'
+    MANAGER_IFACE = 'org.freedesktop.login1.Manager'
+    SESSION_IFACE = 'org.freedesktop.login1.Session'
+    PROPERTIES_IFACE = 'org.freedesktop.DBus.Properties'
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.idle = False
+        self.locked = False
+        self._connection = None
+        self._subscriptions = []
+
+    def start(self):
+        """Subscribe to logind; returns False without a system bus or session (DPMS is still checked)."""
+        if self._subscriptions:
+            return True
+        try:
+            self._connection = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+            # 'auto' is our session, or the user's graphical one for a service outside any session
+            session_path = self._connection.call_sync(
+                self.BUS_NAME, self.MANAGER_PATH, self.MANAGER_IFACE, 'GetSession', GLib.Variant('(s)', ('auto',)),
+                GLib.VariantType.new('(o)'), Gio.DBusCallFlags.NONE, -1, None).unpack()[0]
+            props = self._connection.call_sync(
+                self.BUS_NAME, session_path, self.PROPERTIES_IFACE, 'GetAll', GLib.Variant('(s)', (self.SESSION_IFACE,)),
+                GLib.VariantType.new('(a{sv})'), Gio.DBusCallFlags.NONE, -1, None).unpack()[0]
+        except GLib.Error as e:
+            log.warning("Can't follow the session's idle and lock state: %s", e.message)
+            return False
+        self.idle = props.get('IdleHint', False)
+        self.locked = props.get('LockedHint', False)
+        self._subscriptions = [
+            self._connection.signal_subscribe(self.BUS_NAME, self.PROPERTIES_IFACE, 'PropertiesChanged',
+                                              session_path, self.SESSION_IFACE, Gio.DBusSignalFlags.NONE,
+                                              self._on_properties_changed, None),
+            self._connection.signal_subscribe(self.BUS_NAME, self.MANAGER_IFACE, 'PrepareForSleep',
+                                              self.MANAGER_PATH, None, Gio.DBusSignalFlags.NONE,
+                                              self._on_prepare_for_sleep, None),
+        ]
+        return True
+
+    def stop(self):
+        for subscription in self._subscriptions:
+            self._connection.signal_unsubscribe(subscription)
+        self._subscriptions = []
+        self.idle = self.locked = False
+
+    def away_reason(self):
+        """'locked', 'idle' or 'dpms' when nobody can see the wallpaper, otherwise None"""
+        if self.locked:
+            return 'locked'
+        if self.idle:
+            return 'idle'
+        if self.displays_off():
+            return 'dpms'
+        return None
+
+    def displays_off(self):
+        """True when Hyprland reports every output DPMS-off; asked on its socket, no process per check"""
+        try:
+            with METRICS.span('hyprland.monitors'):
+                monitors = json.loads(hyprland_request('j/monitors', HYPRPAPER_PROBE_TIMEOUT))
+        except (OSError, ValueError) as e:
+            log.debug("Can't read the DPMS state: %s", e)
+            return False
+        if not isinstance(monitors, list):
+            return False
+        return bool(monitors) and not any(m.get('dpmsStatus', True) for m in monitors)
+
+    def _on_properties_changed(self, connection, sender, path, interface, signal, params, _data):
+        _iface, changed, _invalidated = params.unpack()
+        was_away = self.idle or self.locked
+        self.idle = changed.get('IdleHint', self.idle)
+        self.locked = changed.get('LockedHint', self.locked)
+        if was_away and not (self.idle or self.locked):
+            self.callback('active')
+
+    def _on_prepare_for_sleep(self, connection, sender, path, interface, signal, params, _data):
+        if not params.unpack()[0]:
+            self.callback('resume')
+
+
+class SystemdUserManager:
+    """
+    Asynchronous control of a user unit through org.freedesktop.systemd1 on the session
+    bus, replacing `systemctl --user` subprocesses. Operations are chains of manager
+    calls that finish with callback(ok, error_message); watch() reports live
+    ActiveState/UnitFileState changes of the unit.
+    """
+    BUS_NAME = 'org.freedesktop.systemd1'
+    OBJECT_PATH = '/org/freedesktop/systemd1'
+    MANAGER_IFACE = 'org.freedesktop.systemd1.Manager'
+    UNIT_IFACE = 'org.freedesktop.systemd1.Unit'
+    PROPERTIES_IFACE = 'org.freedesktop.DBus.Properties'
+
+    def __init__(self, units):
+        self.units = list(units)
+        self.active_state = None
+        self.sub_state = None
+        self.unit_file_state = None
+        self._connection = None
+        self._unit_path = None
+        self._signal_id = None
+        self._on_state_changed = None
+
+    @property
+    def unit(self):
+        return self.units[0]
+
+    def set_units(self, units):
+        """Switch to another set of units, moving the state watch to the new main unit."""
+        if self._signal_id is not None:
+            self._connection.signal_unsubscribe(self._signal_id)
+            self._signal_id = None
+        self.units = list(units)
+        self._unit_path = None
+        self.active_state = self.sub_state = self.unit_file_state = None
+        if self._on_state_changed:
+            self.watch(self._on_state_changed)
+
+    def get_connection(self):
+        """Return the session bus connection; raises GLib.Error when there is none."""
+        if self._connection is None or self._connection.is_closed():
+            self._connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        return self._connection
+
+    def _run_steps(self, steps, callback=None):
+        """Call (method, params, reply_type) manager steps one after another, asynchronously."""
+        def run(index):
+            if index == len(steps):
+                self.refresh()
+                if callback:
+                    callback(True, None)
+                return
+            method, params, reply_type = steps[index]
+            def finished(connection, result, _data):
+                try:
+                    connection.call_finish(result)
+                except GLib.Error as e:
+                    log.error("systemd %s failed: %s", method, e.message, extra=fields(unit=self.unit))
+                    if callback:
+                        callback(False, e.message)
+                    return
+                run(index + 1)
+            self.get_connection().call(
+                self.BUS_NAME, self.OBJECT_PATH, self.MANAGER_IFACE, method, params,
+                GLib.VariantType.new(reply_type), Gio.DBusCallFlags.NONE, -1, None, finished, None)
+        run(0)
+
+    def enable_and_start(self, callback=None):
+        """daemon-reload, enable the unit files and start the units."""
+        self._run_steps([
+            ('Reload', None, '()'),
+            ('EnableUnitFiles', GLib.Variant('(asbb)', (self.units, False, True)), '(ba(sss))'),
+        ] + [('StartUnit', GLib.Variant('(ss)', (unit, 'replace')), '(o)') for unit in self.units], callback)
+
+    def stop_and_disable(self, callback=None):
+        self._run_steps(
+            [('StopUnit', GLib.Variant('(ss)', (unit, 'replace')), '(o)') for unit in self.units] +
+            [('DisableUnitFiles', GLib.Variant('(asb)', (self.units, False)), '(a(sss))')], callback)
+
+    def restart(self, callback=None):
+        """daemon-reload (unit files may have been rewritten) and restart the units."""
+        self._run_steps([('Reload', None, '()')] +
+                        [('RestartUnit', GLib.Variant('(ss)', (unit, 'replace')), '(o)') for unit in self.units],
+                        callback)
+
+    def watch(self, on_state_changed):
+        """Subscribe to the unit's state; on_state_changed(manager) runs on every change."""
+        self._on_state_changed = on_state_changed
+        connection = self.get_connection()
+        connection.call(self.BUS_NAME, self.OBJECT_PATH, self.MANAGER_IFACE, 'Subscribe', None,
+                        None, Gio.DBusCallFlags.NONE, -1, None, None, None)
+
+        def loaded(connection, result, _data):
+            try:
+                self._unit_path = connection.call_finish(result).unpack()[0]
+            except GLib.Error as e:
+                log.warning("Could not watch %s: %s", self.unit, e.message)
+                return
+            self._signal_id = connection.signal_subscribe(
+                self.BUS_NAME, self.PROPERTIES_IFACE, 'PropertiesChanged', self._unit_path,
+                self.UNIT_IFACE, Gio.DBusSignalFlags.NONE, self._on_properties_changed, None)
+            self.refresh()
+        connection.call(self.BUS_NAME, self.OBJECT_PATH, self.MANAGER_IFACE, 'LoadUnit',
+                        GLib.Variant('(s)', (self.unit,)), GLib.VariantType.new('(o)'),
+                        Gio.DBusCallFlags.NONE, -1, None, loaded, None)
+
+    def refresh(self):
+        """Re-read the unit's properties (UnitFileState isn't sent in change signals)."""
+        if self._unit_path is None:
+            return
+        def got(connection, result, _data):
+            try:
+                props = connection.call_finish(result).unpack()[0]
+            except GLib.Error as e:
+                log.debug("Could not read %s properties: %s", self.unit, e.message)
+                return
+            self._update(props)
+        self.get_connection().call(
+            self.BUS_NAME, self._unit_path, self.PROPERTIES_IFACE, 'GetAll',
+            GLib.Variant('(s)', (self.UNIT_IFACE,)), GLib.VariantType.new('(a{sv})'),
+            Gio.DBusCallFlags.NONE, -1, None, got, None)
+
+    def _on_properties_changed(self, connection, sender, path, interface, signal, params, _data):
+        _iface, changed, _invalidated = params.unpack()
+        self._update(changed)
+
+    def _update(self, props):
+        state = (self.active_state, self.sub_state, self.unit_file_state)
+        self.active_state = props.get('ActiveState', self.active_state)
+        self.sub_state = props.get('SubState', self.sub_state)
+        self.unit_file_state = props.get('UnitFileState', self.unit_file_state)
+        if state != (self.active_state, self.sub_state, self.unit_file_state) and self._on_state_changed:
+            self._on_state_changed(self)
+
 
 class WallpaperManager(Adw.Application):
     def on_cycle_countdown(self):
@@ -31,6 +1879,54 @@ class WallpaperManager(Adw.Application):
             self.on_cycle_timeout()
             self.cycle_countdown = self.cycle_interval
         return True
+    def on_cycle_timeout(self):
+        """Countdown reached zero: move on to the next wallpaper, unless nobody would see it."""
+        if not self.defer_if_away('cycle'):
+            self.cycle_to_next_wallpaper()
+
+    def defer_if_away(self, kind):
+        """Hold back a 'cycle' or 'schedule' change while nobody is looking; True if it was held back"""
+        if not self.idle_aware:
+            return False
+        reason = self.presence.away_reason()
+        if reason is None:
+            return False
+        if not self.deferred_work:
+            log.info("Screen %s, holding wallpaper changes until it is back", reason)
+        self.deferred_work.add(kind)
+        METRICS.count('away.skipped_cycles' if kind == 'cycle' else 'away.skipped_schedule')
+        if reason == 'dpms' and self._dpms_recheck_id is None:
+            # Hyprland has no event for outputs coming back on, look again now and then
+            self._dpms_recheck_id = GLib.timeout_add_seconds(DPMS_RECHECK, self.on_dpms_recheck)
+        self.write_metrics()
+        return True
+
+    def on_dpms_recheck(self):
+        if self.deferred_work and self.presence.displays_off():
+            return True
+        self._dpms_recheck_id = None
+        self.on_presence_active('dpms')
+        return False
+
+    def on_presence_active(self, reason):
+        """Back from idle, lock, suspend or DPMS-off: one catch-up apply for everything held back"""
+        if not self.deferred_work or not self.is_cycling or self.is_paused:
+            self.deferred_work.clear()
+            return
+        if self.presence.away_reason():
+            return  # e.g. unlocked while the outputs are still off
+        if self._dpms_recheck_id:
+            GLib.source_remove(self._dpms_recheck_id)
+            self._dpms_recheck_id = None
+        work, self.deferred_work = self.deferred_work, set()
+        log.info("Back from %s, catching up", reason)
+        METRICS.count('away.catch_up')
+        if 'cycle' in work:
+            self.cycle_to_next_wallpaper()  # also resolves the schedule
+            self.cycle_countdown = self.cycle_interval
+        else:
+            self.apply_schedule()
+
     def schedule_next_cycle(self):
         """Schedule the next wallpaper change"""
         if self.cycle_timeout_id:
@@ -45,7 +1941,7 @@ class WallpaperManager(Adw.Application):
             with open(self.config_file, 'r') as f:
                 return json.load(f)
         except Exception as e:
-            print(f"Error loading config: {e}")
+            log.error("Error loading config: %s", e)
             return {}
 
     def save_config(self, config):
@@ -54,103 +1950,99 @@ class WallpaperManager(Adw.Application):
             with open(self.config_file, 'w') as f:
                 json.dump(config, f, indent=2)
         except Exception as e:
-            print(f"Error saving config: {e}")
+            log.error("Error saving config: %s", e)
     def cycle_to_next_wallpaper(self):
         """Cycle to the next wallpaper"""
-        if not hasattr(self, 'cycling_wallpapers') or not self.cycling_wallpapers:
+        if self.attached:
+            self.send_to_daemon('next')
+            return
+        if not self.playlist:
             return
-        # Move to next wallpaper
-        self.current_index = (self.current_index + 1) % len(self.cycling_wallpapers)
-        # If we completed a full cycle in random mode, reshuffle
-        if self.is_random_order and self.current_index == 0:
-            random.shuffle(self.cycling_wallpapers)
-        # Set the new wallpaper
-        next_wallpaper = self.cycling_wallpapers[self.current_index]
-        self.current_wallpaper = next_wallpaper
-        # Multi-monitor: set wallpaper for all monitors
-        for monitor in self.monitors:
-            self.set_wallpaper_for_monitor(monitor, next_wallpaper)
-        # Time-of-day: override if set
-        tod = self.get_time_of_day()
-        tod_wallpaper = self.time_of_day_wallpapers.get(tod)
-        if tod_wallpaper:
-            self.current_wallpaper = tod_wallpaper
-            for monitor in self.monitors:
-                self.set_wallpaper_for_monitor(monitor, tod_wallpaper)
+        with METRICS.span('cycle'):
+            self._cycle_to_next_wallpaper()
+        # Persist the position every time so a restart continues the order instead of repeating it
+        self.save_cycle_state()
+        self.write_metrics()
+
+    def _cycle_to_next_wallpaper(self):
+        start = time.perf_counter()
+        # Scheduled wallpapers win; the playlist only advances for monitors without one
+        assignments = self.resolve_assignments(self.playlist.advance)
+        next_wallpaper = next(iter(assignments.values()))
         # Apply the wallpaper
         try:
-            self.update_hyprpaper_config()
-            self.apply_hyprpaper_via_ipc()
-            self.apply_hyprlock_wallpaper()
-            subprocess.run(["pkill", "hyprlock"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.apply_assignments(assignments)
+            self.update_lockscreen()
             if not self.daemon_mode:
                 self.update_ui_selection()
             wallpaper_name = os.path.basename(next_wallpaper)
             if not self.daemon_mode:
                 self.status_label.set_label(f"Cycled to: {wallpaper_name}")
-                self.show_notification(f"Wallpaper changed to {wallpaper_name}")
-            else:
-                print(f"Cycled to: {wallpaper_name}")
+                self.show_notification(f"Wallpaper changed to {wallpaper_name}", replace_key='cycle')
+            log.info("Cycled to %s", wallpaper_name,
+                     extra=fields(wallpaper=self.current_wallpaper, monitors=','.join(self.monitors),
+                                  backend='hyprpaper', duration_ms=round((time.perf_counter() - start) * 1000, 1)))
         except Exception as e:
+            METRICS.count('cycle.errors')
             error_msg = f"Error cycling wallpaper: {e}"
             if not self.daemon_mode:
                 self.status_label.set_label(error_msg)
-            else:
-                print(error_msg)
+            log.error("Error cycling wallpaper: %s", e, extra=fields(wallpaper=next_wallpaper))
         self.update_cycle_ui()
-    def __init__(self, **kwargs):
-        # ...existing code...
-        self._restart_timer = None  # For debounce
-        self._restart_delay = 0.5  # seconds
-        self._pending_restart = False
-        self._last_restart_error = None
-        # ...existing code...
     def reload_daemon(self):
-        """Send SIGHUP to the daemon to reload config, or restart if not running."""
-        import signal
-        import psutil
-        # Find the pyprwall daemon process
-        try:
-            for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-                if 'pyprwall.py' in ' '.join(proc.info.get('cmdline', [])) and '--cycle-daemon' in proc.info.get('cmdline', []):
-                    os.kill(proc.info['pid'], signal.SIGHUP)
-                    self.show_notification("PyprWall daemon reloaded (SIGHUP)")
-                    return True
-        except Exception as e:
-            print(f"Error sending SIGHUP: {e}")
-        # If not found, fallback to restart
-        return self.restart_systemd_service()
+        """Ask the daemon to re-read its config now, or restart the service if it doesn't answer."""
+        def done(status, error):
+            if status and status.get('ok'):
+                self.show_notification("PyprWall daemon reloaded its settings", replace_key='service')
+                return
+            log.info("Daemon not reachable (%s), restarting the service", error or status.get('error'))
+            self.restart_systemd_service()
+        self.request_daemon('reload', done)
 
     def restart_systemd_service(self):
         """Restart the systemd service, with error handling and UI feedback."""
-        try:
-            subprocess.run(["systemctl", "--user", "restart", "pyprwall.service"], check=True)
-            self._last_restart_error = None
-            self.show_notification("PyprWall cycling service restarted")
-            if hasattr(self, 'cycle_status_label'):
-                self.cycle_status_label.set_label("Cycling daemon restarted")
-            return True
-        except subprocess.CalledProcessError as e:
-            msg = f"Failed to restart cycling service: {e}"
+        def done(ok, error):
+            if ok:
+                self._last_restart_error = None
+                self.show_notification("PyprWall cycling service restarted", replace_key='service')
+                if hasattr(self, 'cycle_status_label'):
+                    self.cycle_status_label.set_label("Cycling daemon restarted")
+                return
+            msg = f"Failed to restart cycling service: {error}"
             self._last_restart_error = msg
-            print(msg)
             if hasattr(self, 'cycle_status_label'):
                 self.cycle_status_label.set_label(msg)
-            self.show_notification(msg)
+            self.show_notification(msg, replace_key='service')
+
+        if self.service_mode == 'on-demand':
+            self.create_systemd_service()  # the timer unit carries the interval
+        try:
+            self.systemd.restart(done)
+            return True
+        except GLib.Error as e:
+            log.debug("systemd D-Bus API unavailable (%s), using systemctl", e.message)
+        try:
+            subprocess.run(["systemctl", "--user", "daemon-reload"], check=True)
+            subprocess.run(["systemctl", "--user", "restart", *self.systemd.units], check=True)
+            done(True, None)
+            return True
+        except subprocess.CalledProcessError as e:
+            log.error("Failed to restart cycling service: %s", e)
+            done(False, e)
             return False
 
     def debounce_restart_service(self):
         """Debounce multiple rapid restarts."""
-        import threading
         if self._restart_timer:
-            self._restart_timer.cancel()
+            GLib.source_remove(self._restart_timer)
         self._pending_restart = True
         def do_restart():
+            self._restart_timer = None
             self._pending_restart = False
-            self.reload_daemon()
-        self._restart_timer = threading.Timer(self._restart_delay, do_restart)
-        self._restart_timer.daemon = True
-        self._restart_timer.start()
+            self.restart_systemd_service()  # rewrites the units, which a config reload can't
+            return False
+        # A main-loop timeout, so the D-Bus replies are dispatched on the GTK thread
+        self._restart_timer = GLib.timeout_add(int(self._restart_delay * 1000), do_restart)
     import threading
     from gi.repository import GLib
     def __init__(self, **kwargs):
@@ -162,31 +2054,91 @@ class WallpaperManager(Adw.Application):
         self.hyprlock_conf = os.path.join(self.hypr_config_dir, "hyprlock.conf")
         self.current_wallpaper = None
         self.thumbnails = {}
+        self.thumbnail_children = {}  # path -> FlowBoxChild, the reverse of thumbnails
+        self.thumbnail_resolution = {}  # path -> width of the box its shown thumbnail was made for
+        self.grid_zoom = 1.0
+        self._upgrade_timeout_id = None
+        self._upgrade_generation = 0
+        self._zoom_save_id = None
+        self.notifier = Notifier()
+        self.lockscreen_mode = 'eager'  # 'lazy' writes the lockscreen only on lock/sleep
+        self.lock_watcher = LockWatcher(self.on_lock_signal)
+        self.idle_aware = True  # hold wallpaper changes while idle, locked or DPMS-off
+        self.presence = PresenceWatcher(self.on_presence_active)
+        self.hyprpaper = HyprpaperClient()
+        self.pending_apply = None  # latest {monitor: wallpaper} hyprpaper missed while down
+        self._hyprpaper_retry_id = None
+        self.deferred_work = set()  # 'cycle'/'schedule' changes held back for one catch-up
+        self._dpms_recheck_id = None
+        self.service_mode = 'resident'
+        self.systemd = SystemdUserManager(SERVICE_MODES[self.service_mode])
+        # The daemon process itself; in on-demand mode the socket unit is active whether it runs or not
+        self.daemon_unit = SystemdUserManager([SYSTEMD_UNIT])
+        self.control_service = None
+        self.control_socket_path = get_control_socket_path()
+        self.config_monitor = None  # daemon: Gio.FileMonitor on pyprwall.json
+        self._config_reload_id = None
+        self.lease = CycleLease(get_cycle_lease_path())
+        self._lease_retry_id = None
+        self.attached = False  # GUI mirroring a running daemon instead of cycling itself
+        self.attaching = False  # status probe in flight; the GUI holds off resuming its own cycling
+        self.daemon_status = {}
+        self._attach_poll_id = None
+        self._poll_in_flight = False
+        self.main_loop = None
+        self.on_demand = False
+        self._idle_exit_id = None
+        self._restart_timer = None  # For debounce
+        self._restart_delay = 0.5  # seconds
+        self._pending_restart = False
+        self._last_restart_error = None
         
         # Cycling feature variables
         self.is_cycling = False
         self.cycle_timeout_id = None
         self.wallpaper_list = []
-        self.current_index = 0
+        self.playlist = None
+        self.saved_playlist_state = None
         self.cycle_interval = 1800  # Default 30 minutes in seconds
         self.is_random_order = False
+        self.no_repeat_window = 10  # Recently shown wallpapers random orders avoid
+        self.favorites = set()
+        self.favorite_weight = 3.0
+        self.cycle_weights = {}  # Optional per-wallpaper weights from the config
+        self.skip_duplicates = False
 
         # Multi-monitor support
         self.monitors = self.get_monitors()
         self.monitor_wallpapers = {m: None for m in self.monitors}
         self.is_paused = False
-        self.time_of_day_wallpapers = {
-            'morning': None,
-            'afternoon': None,
-            'evening': None,
-            'night': None
-        }
+        self.schedule = Schedule([])
+        self.schedule_timeout_id = None
         self.cycle_countdown = 0
         
         # Use a dedicated config directory inside the user's home folder
         self.config_dir = str(Path.home() / ".config" / "pyprwall")
         self.config_file = os.path.join(self.config_dir, 'pyprwall.json')
+        self.stats_file = os.path.join(self.config_dir, 'stats.json')
+        self.shared_stats = False  # timer runs and the on-demand daemon add up into stats.json
+        self._stats_flushed = None  # the snapshot this process last added to it
+        self.wallpaper_cache_file = os.path.join(self.config_dir, 'wallpaper_cache.json')
+        self.cycle_state_file = os.path.join(self.config_dir, 'cycle_state.json')
+        self._legacy_cycle_state = False  # the state still sits in pyprwall.json, moved on the next save
+        self._cycle_state_mtime = None  # of cycle_state.json as this process last read or wrote it
+        self.library_index = LibraryIndex(os.path.join(self.config_dir, 'index.json'))
+        self.grid_snapshot_file = os.path.join(self.config_dir, 'grid_snapshot.json')
+        self.duplicate_of = {}  # path -> the copy kept of its near-duplicate group
+        self.tags = {}  # path -> [tag, ...] from the config, searchable
+        self.search_index = None
+        self.search_query = ''
+        self.search_ids = None  # documents matching search_query, None when not searching
+        self.metrics_file = None  # Optional Prometheus text file, set with --metrics-file
         self.thumbnail_cache_dir = os.path.join(self.config_dir, 'thumbnails')
+        cache_home = os.environ.get('XDG_CACHE_HOME') or str(Path.home() / ".cache")
+        self.shared_thumbnail_dir = os.path.join(cache_home, 'thumbnails')
+        self.link_dir = os.path.join(cache_home, 'pyprwall')  # Stable symlinks the Hypr configs point at
+        self.symlink_configs = False  # Point hyprpaper.conf/hyprlock.conf at links once, then only rename
+        self._linked_assignments = None  # {monitor: link} hyprpaper.conf is known to name
         os.makedirs(self.thumbnail_cache_dir, exist_ok=True)
         # Create directories if they don't exist
         os.makedirs(self.wallpaper_dir, exist_ok=True)
@@ -197,113 +2149,601 @@ class WallpaperManager(Adw.Application):
         # Restore cycling state
         self.restore_cycle_state()
 
-    def load_cycle_config(self):
-        """Load cycling configuration from file"""
-    # All config is now loaded from the single config file
+    def load_cycle_config(self, settings=None):
+        """Load cycling configuration from file, or from already parsed settings"""
+        settings = settings or Settings(self.load_config())
+        self.settings = settings
+        self.cycle_interval = settings.get('interval', self.cycle_interval)
+        self.is_random_order = settings.get('random_order', self.is_random_order)
+        self.no_repeat_window = settings.get('no_repeat_window', self.no_repeat_window)
+        self.favorites = set(settings.get('favorites', ()))
+        self.favorite_weight = settings.get('favorite_weight', self.favorite_weight)
+        self.cycle_weights = dict(settings.get('weights', {}))
+        self.skip_duplicates = settings.get('skip_duplicates', self.skip_duplicates)
+        self.grid_zoom = min(max(settings.get('grid_zoom', self.grid_zoom), GRID_ZOOM_MIN), GRID_ZOOM_MAX)
+        self.tags = dict(settings.get('tags', {}))
+        self.schedule = Schedule(settings.get('schedule', []), settings.get('location'))
+        if settings.get('lockscreen_mode') in ('eager', 'lazy'):
+            self.lockscreen_mode = settings.get('lockscreen_mode')
+        self.symlink_configs = settings.get('symlink_configs', self.symlink_configs)
+        self.idle_aware = settings.get('idle_aware', self.idle_aware)
+        self.hyprpaper.use_socket = settings.get('hyprpaper_socket', self.hyprpaper.use_socket)
+        mode = settings.get('service_mode', self.service_mode)
+        if mode in SERVICE_MODES and mode != self.service_mode:
+            self.service_mode = mode
+            self.systemd.set_units(SERVICE_MODES[mode])
 
     def save_cycle_config(self):
         """Save cycling configuration to file"""
-        try:
-            config = {
-                'interval': self.cycle_interval,
-                'random_order': self.is_random_order
-            }
-            with open(self.cycle_config_file, 'w') as f:
-                json.dump(config, f)
-        except Exception as e:
-            print(f"Error saving cycle config: {e}")
+        config = self.load_config()
+        config['interval'] = self.cycle_interval
+        config['random_order'] = self.is_random_order
+        config['no_repeat_window'] = self.no_repeat_window
+        config['favorites'] = sorted(self.favorites)
+        config['favorite_weight'] = self.favorite_weight
+        config['weights'] = self.cycle_weights
+        config['skip_duplicates'] = self.skip_duplicates
+        config['grid_zoom'] = self.grid_zoom
+        config['lockscreen_mode'] = self.lockscreen_mode
+        config['symlink_configs'] = self.symlink_configs
+        config['idle_aware'] = self.idle_aware
+        config['hyprpaper_socket'] = self.hyprpaper.use_socket
+        config['service_mode'] = self.service_mode
+        self.save_config(config)
 
     def create_systemd_service(self):
-        """Create a systemd user service file for automatic wallpaper cycling"""
+        """
+        Write the systemd user units for the current service mode. 'resident' is a
+        long-running --cycle-daemon; 'on-demand' is a control socket that starts the
+        daemon on the first request (it exits when idle) plus a timer that runs
+        --cycle-once every interval, so nothing stays resident between changes.
+        """
         script_path = os.path.abspath(__file__)
-        service_content = f"""[Unit]
+        unit_dir = os.path.expanduser("~/.config/systemd/user")
+        os.makedirs(unit_dir, exist_ok=True)
+        environment = """Environment=DISPLAY=:0
+Environment=XAUTHORITY=%h/.Xauthority"""
+        if self.service_mode == 'on-demand':
+            units = {
+                SYSTEMD_SOCKET_UNIT: f"""[Unit]
+Description=PyprWall control socket
+
+[Socket]
+ListenStream=%t/{CONTROL_SOCKET_NAME}
+SocketMode=0600
+
+[Install]
+WantedBy=sockets.target
+""",
+                SYSTEMD_UNIT: f"""[Unit]
+Description=PyprWall Wallpaper Cycling (on demand)
+Requires={SYSTEMD_SOCKET_UNIT}
+After=graphical-session.target
+
+[Service]
+Type=simple
+ExecStart={script_path} --cycle-daemon --on-demand
+{environment}
+""",
+                SYSTEMD_TIMER_UNIT: f"""[Unit]
+Description=PyprWall wallpaper cycling timer
+
+[Timer]
+OnActiveSec={self.cycle_interval}
+OnUnitActiveSec={self.cycle_interval}
+AccuracySec=1s
+
+[Install]
+WantedBy=timers.target
+""",
+                SYSTEMD_ONESHOT_UNIT: f"""[Unit]
+Description=PyprWall cycle to the next wallpaper
+After=graphical-session.target
+
+[Service]
+Type=oneshot
+ExecStart={script_path} --cycle-once
+{environment}
+""",
+            }
+        else:
+            units = {
+                SYSTEMD_UNIT: f"""[Unit]
 Description=PyprWall Wallpaper Cycling
 After=graphical-session.target
 
 [Service]
 Type=simple
 ExecStart={script_path} --cycle-daemon
-Environment=DISPLAY=:0
-Environment=XAUTHORITY=%h/.Xauthority
+{environment}
 Restart=on-failure
 
 [Install]
 WantedBy=default.target
-"""
-        
-        service_path = os.path.expanduser("~/.config/systemd/user/pyprwall.service")
-        os.makedirs(os.path.dirname(service_path), exist_ok=True)
-        
-        with open(service_path, 'w') as f:
-            f.write(service_content)
-        
-        return service_path
+""",
+            }
+
+        for name, content in units.items():
+            with open(os.path.join(unit_dir, name), 'w') as f:
+                f.write(content)
+
+        return os.path.join(unit_dir, SERVICE_MODES[self.service_mode][0])
 
-    def enable_systemd_service(self):
-        """Enable and start the systemd service"""
+    def enable_systemd_service(self, callback=None):
+        """Enable and start the systemd service; callback(ok, error) runs once it's done"""
         try:
-            subprocess.run(["systemctl", "--user", "enable", "pyprwall.service"], check=True)
-            subprocess.run(["systemctl", "--user", "start", "pyprwall.service"], check=True)
-            return True
+            self.systemd.enable_and_start(callback)
+            return
+        except GLib.Error as e:
+            log.debug("systemd D-Bus API unavailable (%s), using systemctl", e.message)
+        try:
+            subprocess.run(["systemctl", "--user", "daemon-reload"], check=True)
+            subprocess.run(["systemctl", "--user", "enable", *self.systemd.units], check=True)
+            subprocess.run(["systemctl", "--user", "start", *self.systemd.units], check=True)
+            ok, error = True, None
         except subprocess.CalledProcessError as e:
-            print(f"Error enabling systemd service: {e}")
-            return False
+            log.error("Error enabling systemd service: %s", e)
+            ok, error = False, str(e)
+        if callback:
+            callback(ok, error)
 
-    def disable_systemd_service(self):
-        """Stop and disable the systemd service"""
+    def disable_systemd_service(self, callback=None):
+        """Stop and disable the systemd service; callback(ok, error) runs once it's done"""
         try:
-            subprocess.run(["systemctl", "--user", "stop", "pyprwall.service"], check=True)
-            subprocess.run(["systemctl", "--user", "disable", "pyprwall.service"], check=True)
-            return True
+            self.systemd.stop_and_disable(callback)
+            return
+        except GLib.Error as e:
+            log.debug("systemd D-Bus API unavailable (%s), using systemctl", e.message)
+        try:
+            subprocess.run(["systemctl", "--user", "stop", *self.systemd.units], check=True)
+            subprocess.run(["systemctl", "--user", "disable", *self.systemd.units], check=True)
+            ok, error = True, None
         except subprocess.CalledProcessError as e:
-            print(f"Error disabling systemd service: {e}")
-            return False
+            log.error("Error disabling systemd service: %s", e)
+            ok, error = False, str(e)
+        if callback:
+            callback(ok, error)
 
-    def run_daemon(self):
-        """Run the application in daemon mode for wallpaper cycling"""
-        self.daemon_mode = True
-        
-        # Load the last used folder
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r') as f:
-                    folder = f.read().strip()
-                    if os.path.exists(folder):
-                        self.wallpaper_dir = folder
-            except Exception as e:
-                print(f"Error reading config file: {e}")
-        
-        # Load wallpapers
-        supported_formats = ['.png', '.jpg', '.jpeg', '.jxl', '.webp']
+    def is_service_enabled(self):
+        """Whether auto-start is on, from systemd when known, else from the unit file's presence"""
+        if self.systemd.unit_file_state is not None:
+            return self.systemd.unit_file_state in ('enabled', 'enabled-runtime', 'linked', 'linked-runtime')
+        return os.path.exists(os.path.expanduser(f"~/.config/systemd/user/{self.systemd.unit}"))
+
+    def on_service_state_changed(self, manager):
+        """Live status indicator, fed by systemd's PropertiesChanged signals"""
+        self.systemd_button.set_label("Disable Auto-Start" if self.is_service_enabled() else "Enable Auto-Start")
+        if manager.active_state:
+            self.service_status_label.set_label(f"Service: {manager.active_state} ({manager.sub_state})")
+
+    def on_daemon_unit_changed(self, manager):
+        """Mirror the daemon once its service runs, whoever started it"""
+        if manager.active_state == 'active' and not self.attached and self.cycle_timeout_id is None:
+            self.attach_to_daemon()
+
+    def load_daemon_wallpapers(self):
+        """Load the configured folder's wallpapers for the daemon; False if there are none"""
+        folder = self.settings.get('wallpaper_dir')
+        if folder and os.path.isdir(folder):
+            self.wallpaper_dir = folder
         try:
-            wallpapers = [os.path.join(self.wallpaper_dir, f) for f in os.listdir(self.wallpaper_dir)
-                         if os.path.isfile(os.path.join(self.wallpaper_dir, f)) and
-                         os.path.splitext(f)[1].lower() in supported_formats]
-            wallpapers.sort()
-            self.wallpaper_list = wallpapers
+            if self.is_cache_valid(self.wallpaper_dir):
+                self.wallpaper_list = self.load_wallpaper_cache()
+            else:
+                self.wallpaper_list = self.scan_wallpaper_folder(self.wallpaper_dir)
+                self.save_wallpaper_cache(self.wallpaper_dir, self.wallpaper_list)
+        except OSError as e:
+            cache = self.load_wallpaper_cache_file()
+            if not self.is_cached_folder(cache, self.wallpaper_dir):
+                log.error("Error loading wallpapers: %s", e, extra=fields(folder=self.wallpaper_dir))
+                return False
+            # Offline network share: hyprpaper may still have the files, keep cycling the last list
+            log.warning("Can't read the folder (%s), using the last known wallpapers", e,
+                        extra=fields(folder=self.wallpaper_dir))
+            self.wallpaper_list = cache['wallpapers']
         except Exception as e:
-            print(f"Error loading wallpapers: {e}")
-            return
-        
+            log.error("Error loading wallpapers: %s", e, extra=fields(folder=self.wallpaper_dir))
+            return False
+
         if not self.wallpaper_list:
-            print("No wallpapers found in the directory")
+            log.warning("No wallpapers found in the directory", extra=fields(folder=self.wallpaper_dir))
+            return False
+        return True
+
+    def run_daemon(self, on_demand=False):
+        """
+        Run the application in daemon mode for wallpaper cycling. With on_demand the
+        daemon only serves control requests (the timer unit does the cycling) and
+        exits after DAEMON_IDLE_EXIT seconds without one.
+        """
+        self.daemon_mode = True
+        self.on_demand = on_demand
+        self.shared_stats = on_demand
+        if not self.load_daemon_wallpapers():
             return
-        
-        # Load cycle configuration
-        self.load_cycle_config()
-        
-        # Start cycling
-        print(f"Starting wallpaper cycling with {len(self.wallpaper_list)} wallpapers")
-        self.start_cycling()
-        
+
+        self.start_control_server()
+        self.watch_config()
+        self.main_loop = GLib.MainLoop()
+        if on_demand:
+            self.prepare_cycle_order()
+            self.reset_idle_exit()
+        elif self.take_cycle_ownership():
+            # Start cycling
+            log.info("Starting wallpaper cycling with %d wallpapers", len(self.wallpaper_list),
+                     extra=fields(folder=self.wallpaper_dir))
+            self.start_cycling()
+        else:
+            self._lease_retry_id = GLib.timeout_add_seconds(LEASE_RETRY, self.on_lease_retry)
+
         # Run the main loop
-        from gi.repository import GLib
-        loop = GLib.MainLoop()
         try:
-            loop.run()
+            self.main_loop.run()
         except KeyboardInterrupt:
-            print("Stopping wallpaper cycling")
-            self.stop_cycling()
+            log.info("Stopping wallpaper cycling")
+            if not on_demand:
+                self.stop_cycling()
+
+    def run_cycle_once(self):
+        """Timer-unit mode: advance the persisted cycle by one wallpaper, save the state and exit"""
+        self.daemon_mode = True
+        self.shared_stats = True
+        if self.is_paused:
+            log.info("Cycling paused, skipping this change")
+            return
+        if not self.lease.acquire('timer'):
+            log.info("Cycling is run by %s, skipping this change", self.lease.holder())
+            return
+        if self.idle_aware:
+            # The next tick after the screen is back is the catch-up
+            self.presence.start()
+            reason = self.presence.away_reason()
+            self.presence.stop()
+            if reason:
+                log.info("Screen %s, skipping this change", reason)
+                METRICS.count('away.skipped_cycles')
+                self.write_metrics()
+                return
+        if not self.load_daemon_wallpapers():
+            return
+        self.prepare_cycle_order()
+        self.is_cycling = True
+        self.cycle_to_next_wallpaper()
+
+    def watch_config(self):
+        """Daemon: follow changes to pyprwall.json instead of needing a restart"""
+        try:
+            self.config_monitor = Gio.File.new_for_path(self.config_file).monitor_file(Gio.FileMonitorFlags.NONE, None)
+        except GLib.Error as e:
+            log.warning("Can't watch %s, config changes need a restart: %s", self.config_file, e.message)
+            return
+        self.config_monitor.connect('changed', self.on_config_file_changed)
+
+    def on_config_file_changed(self, monitor, file, other_file, event):
+        # A save arrives as several events (truncate, write, close); read once it is quiet
+        if self._config_reload_id:
+            GLib.source_remove(self._config_reload_id)
+        self._config_reload_id = GLib.timeout_add(CONFIG_RELOAD_DELAY, self.on_config_reload)
+
+    def on_config_reload(self):
+        self._config_reload_id = None
+        self.reload_config()
+        return False
+
+    def reload_config(self):
+        """Re-read pyprwall.json and apply whatever changed; the daemon's own state saves change nothing"""
+        try:
+            with open(self.config_file, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Not reloading the config: %s", e)  # half-written; the next change event retries
+            return
+        settings = Settings(config)
+        changed = settings.changed(self.settings)
+        if changed:
+            self.apply_settings(settings, changed)
+
+    def apply_settings(self, settings, changed):
+        """
+        Daemon: bring the running cycle in line with changed settings. The timer keeps the
+        time already waited, the playlist is rebuilt only for order or content changes,
+        and the folder is rescanned only when it is a different folder.
+        """
+        log.info("Config changed: %s", ', '.join(sorted(changed)))
+        old_interval = self.cycle_interval
+        was_lazy = self.lockscreen_mode == 'lazy'
+        self.load_cycle_config(settings)
+        running = self.is_cycling and self.cycle_timeout_id is not None
+
+        reorder = bool(changed & {'random_order', 'no_repeat_window', 'favorites', 'favorite_weight', 'weights'})
+        folder = settings.get('wallpaper_dir')
+        if ('wallpaper_dir' in changed and folder
+                and os.path.realpath(folder) != os.path.realpath(self.wallpaper_dir)):
+            old_dir, old_list = self.wallpaper_dir, self.wallpaper_list
+            if self.load_daemon_wallpapers():
+                log.info("Switched to %d wallpapers", len(self.wallpaper_list), extra=fields(folder=self.wallpaper_dir))
+                self.duplicate_of = {}
+                self.playlist = None  # different contents, the saved position can't carry over
+                reorder = True
+            else:
+                log.warning("Keeping the wallpapers from %s", old_dir, extra=fields(folder=folder))
+                self.wallpaper_dir, self.wallpaper_list = old_dir, old_list
+        elif 'skip_duplicates' in changed:
+            # wallpaper_list is the filtered playlist by now; start again from the folder's full list
+            old_list = self.wallpaper_list
+            if not self.load_daemon_wallpapers():
+                self.wallpaper_list = old_list
+            if self.skip_duplicates:
+                self.duplicate_of = {}  # regrouped from the index for the current files
+            self.playlist = None
+            reorder = True
+        if reorder and (self.playlist is not None or self.is_cycling):
+            self.prepare_cycle_order()
+            self.save_cycle_state()
+
+        if 'interval' in changed and running:
+            # Count the time already waited towards the new interval
+            waited = old_interval - self.cycle_countdown
+            self.cycle_countdown = max(1, self.cycle_interval - waited)
+        if changed & {'schedule', 'location'} and running:
+            self.disarm_schedule()
+            self.on_schedule_boundary()  # applies the new schedule now if it differs, and re-arms
+        if 'lockscreen_mode' in changed and running and was_lazy != (self.lockscreen_mode == 'lazy'):
+            if self.lockscreen_mode == 'lazy':
+                self.lock_watcher.start()
+            else:
+                self.lock_watcher.stop()
+        if 'idle_aware' in changed and running:
+            if self.idle_aware:
+                self.presence.start()
+            else:
+                self.presence.stop()
+                self.deferred_work.clear()
+        if 'symlink_configs' in changed:
+            self._linked_assignments = None  # rewrite the Hypr configs on the next change
+        if 'service_mode' in changed:
+            log.info("The new service mode takes effect when the service is restarted")
+
+    def start_control_server(self):
+        """
+        Serve control commands on the unix socket: the one systemd passes in (socket
+        activation) or, for a resident daemon, one bound at control_socket_path.
+        """
+        service = Gio.SocketService.new()
+        try:
+            if os.environ.get('LISTEN_PID') == str(os.getpid()) and int(os.environ.get('LISTEN_FDS', '0')) > 0:
+                service.add_socket(Gio.Socket.new_from_fd(SD_LISTEN_FDS_START), None)
+            else:
+                if os.path.exists(self.control_socket_path):
+                    try:
+                        send_control_command('status', self.control_socket_path, timeout=1.0)
+                        log.warning("Another daemon owns %s, control socket disabled", self.control_socket_path)
+                        return
+                    except OSError:
+                        os.unlink(self.control_socket_path)  # stale socket from a dead daemon
+                service.add_address(Gio.UnixSocketAddress.new(self.control_socket_path),
+                                    Gio.SocketType.STREAM, Gio.SocketProtocol.DEFAULT, None)
+        except GLib.Error as e:
+            log.warning("Could not start control socket: %s", e.message)
+            return
+        service.connect('incoming', self.on_control_incoming)
+        service.start()
+        self.control_service = service
+
+    def on_control_incoming(self, service, connection, source_object):
+        stream = Gio.DataInputStream.new(connection.get_input_stream())
+        stream.read_line_async(GLib.PRIORITY_DEFAULT, None, self.on_control_line, connection)
+        return True
+
+    def on_control_line(self, stream, result, connection):
+        try:
+            line, _length = stream.read_line_finish_utf8(result)
+            reply = self.handle_control_command((line or '').strip())
+            connection.get_output_stream().write_all((json.dumps(reply) + '\n').encode(), None)
+        except GLib.Error as e:
+            log.warning("Control connection error: %s", e.message)
+        finally:
+            connection.close(None)
+
+    def handle_control_command(self, command):
+        """Execute one control command and return the JSON-serialisable reply"""
+        log.debug("Control command %s", command)
+        if self.on_demand:
+            self.refresh_cycle_state()
+        if command == 'next':
+            self.cycle_to_next_wallpaper()
+        elif command == 'pause':
+            self.pause_cycling()
+        elif command == 'resume':
+            self.resume_cycling()
+        elif command == 'start':
+            if self.on_demand:
+                self.resume_cycling()  # the timer unit does the cycling
+            else:
+                self.start_cycling()
+        elif command == 'stop':
+            if self.on_demand:
+                self.pause_cycling()
+            else:
+                self.stop_cycling()
+        elif command == 'reload':
+            self.reload_config()
+        elif command != 'status':
+            return {'ok': False, 'error': f"unknown command {command!r}"}
+        if self.on_demand and command != 'status':
+            self.reset_idle_exit()  # a watching GUI's status polls don't keep the daemon up
+        return {
+            'ok': True,
+            'mode': 'on-demand' if self.on_demand else 'resident',
+            'is_cycling': self.is_cycling,
+            'is_paused': self.is_paused,
+            'current_wallpaper': self.current_wallpaper,
+            'next_wallpaper': self.playlist.peek() if self.playlist and self.is_cycling else None,
+            'next_change_in': self.cycle_countdown if self.cycle_timeout_id else None,
+            'interval': self.cycle_interval,
+            'random_order': self.is_random_order,
+            'owns_cycling': self.lease.fd is not None,
+            'held_back': sorted(self.deferred_work),
+            'skipped_cycles': METRICS.counters.get('away.skipped_cycles', 0),
+            'skipped_schedule': METRICS.counters.get('away.skipped_schedule', 0),
+            'hyprpaper': self.hyprpaper.state(),
+        }
+
+    def take_cycle_ownership(self):
+        """
+        Only one process runs the cycle timer. The GUI hands start requests to a running
+        daemon and mirrors it; otherwise the holder of the lease cycles. False if that isn't us.
+        """
+        if not self.daemon_mode and self.attached:
+            self.send_to_daemon('start')
+            return False
+        if self.lease.acquire('daemon' if self.daemon_mode else 'gui'):
+            return True
+        holder = self.lease.holder()
+        if self.daemon_mode:
+            log.warning("Cycling is run by %s, taking over when it stops", holder)
+        else:
+            self.cycle_status_label.set_label(f"Cycling is run by another PyprWall process ({holder})")
+            self.attach_to_daemon()  # mirror it if it is a daemon
+        return False
+
+    def on_lease_retry(self):
+        """Waiting daemon: start cycling once the previous owner (usually the GUI) has gone"""
+        if not self.lease.acquire('daemon'):
+            return True
+        self._lease_retry_id = None
+        log.info("Took over cycling with %d wallpapers", len(self.wallpaper_list))
+        self.start_cycling()
+        return False
+
+    def request_daemon(self, command, callback, timeout=2.0):
+        """
+        GUI: send a control command from a worker thread so a slow daemon can't stall the
+        main loop; callback(status, error) runs on the main loop, status None on failure.
+        """
+        def run():
+            try:
+                status, error = send_control_command(command, self.control_socket_path, timeout), None
+            except OSError as e:
+                status, error = None, e
+            GLib.idle_add(callback, status, error)
+        thread = self.threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def attach_to_daemon(self):
+        """GUI: mirror and control a running daemon's cycling, if one answers"""
+        if self.attached or self.attaching:
+            return
+        if self.service_mode == 'on-demand' and self.daemon_unit.active_state != 'active':
+            return  # connecting would socket-activate a daemon just because the GUI looked
+        self.attaching = True
+        self.request_daemon('status', self.on_attach_reply, timeout=1.0)
+
+    def on_attach_reply(self, status, error):
+        self.attaching = False
+        if not status or not status.get('ok'):
+            self.resume_saved_cycling()
+            return
+        if self.cycle_timeout_id is not None:
+            return  # started cycling here meanwhile; the daemon waits for the lease
+        log.info("Attached to the cycling daemon (%s mode)", status.get('mode'))
+        self.attached = True
+        self.apply_daemon_status(status)
+        # No countdown to show for the timer unit, just follow its changes while the daemon runs
+        interval = ATTACH_POLL if status.get('mode') == 'resident' else DAEMON_IDLE_EXIT // 2
+        self._attach_poll_id = GLib.timeout_add_seconds(interval, self.poll_daemon)
+
+    def detach_from_daemon(self):
+        if self._attach_poll_id:
+            GLib.source_remove(self._attach_poll_id)
+            self._attach_poll_id = None
+        self.attached = False
+        self.daemon_status = {}
+
+    def send_to_daemon(self, command):
+        """GUI: send a control command to the attached daemon and mirror its reply"""
+        def done(status, error):
+            if not self.attached:
+                return
+            if error is not None:
+                log.warning("Lost the cycling daemon: %s", error)
+                self.on_daemon_lost()
+            elif status.get('ok'):
+                self.apply_daemon_status(status)
+        self.request_daemon(command, done)
+
+    def poll_daemon(self):
+        if self.service_mode == 'on-demand' and self.daemon_unit.active_state != 'active':
+            return True  # it exited idle; a status request would only start it again
+        if not self._poll_in_flight:  # a slow daemon gets one request at a time
+            self._poll_in_flight = True
+            self.request_daemon('status', self.on_poll_reply, timeout=1.0)
+        return True
+
+    def on_poll_reply(self, status, error):
+        self._poll_in_flight = False
+        if not self.attached:
+            return
+        if error is not None:
+            log.info("Cycling daemon went away: %s", error)
+            self.on_daemon_lost()
+            return
+        self.apply_daemon_status(status)
+
+    def resume_saved_cycling(self):
+        """GUI: resume the saved cycling state once the wallpapers are known, unless a daemon cycles"""
+        if (not self.is_cycling or self.attached or self.attaching or self.cycle_timeout_id is not None
+                or not self.wallpaper_list):
+            return
+        if self.service_mode == 'on-demand' and self.is_service_enabled():
+            return  # the timer unit cycles; attach_to_daemon() mirrors it once its socket is up
+        if self.is_paused:
+            self.prepare_cycle_order()
+        else:
+            self.start_cycling()
+
+    def on_daemon_lost(self):
+        """The daemon stopped: take over its cycling if it was on, as a GUI without a daemon does"""
+        was_cycling = self.is_cycling and not self.is_paused
+        self.detach_from_daemon()
+        self.is_cycling = self.is_paused = False
+        if was_cycling and self.wallpaper_list:
+            self.start_cycling()
+        else:
+            self.cycle_button.set_label("Start Cycling")
+            self.next_button.set_sensitive(False)
+            self.pause_button.set_sensitive(False)
+            self.cycle_status_label.set_label("Cycling daemon stopped")
+
+    def apply_daemon_status(self, status):
+        """Mirror the daemon's cycling state in the cycling controls and the grid selection"""
+        previous = self.daemon_status.get('current_wallpaper')
+        self.daemon_status = status
+        self.is_cycling = status.get('is_cycling', False)
+        self.is_paused = status.get('is_paused', False)
+        self.cycle_countdown = status.get('next_change_in') or 0
+        self.cycle_button.set_label("Stop Cycling" if self.is_cycling else "Start Cycling")
+        self.cycle_button.set_sensitive(True)
+        self.next_button.set_sensitive(self.is_cycling)
+        self.pause_button.set_sensitive(self.is_cycling)
+        self.pause_button.set_label("Resume Cycling" if self.is_paused else "Pause Cycling")
+        wallpaper = status.get('current_wallpaper')
+        if wallpaper and wallpaper != previous:
+            self.current_wallpaper = wallpaper
+            self.update_ui_selection()
+        self.update_cycle_ui()
+
+    def reset_idle_exit(self):
+        """(Re)arm the idle timer that ends an on-demand daemon"""
+        if self._idle_exit_id:
+            GLib.source_remove(self._idle_exit_id)
+        def idle_exit():
+            log.info("Idle for %ds, exiting", DAEMON_IDLE_EXIT)
+            self._idle_exit_id = None
+            self.main_loop.quit()
+            return False
+        self._idle_exit_id = GLib.timeout_add_seconds(DAEMON_IDLE_EXIT, idle_exit)
 
     def do_activate(self):
         """
@@ -313,6 +2753,7 @@ WantedBy=default.target
         self.win = Gtk.ApplicationWindow(application=self)
         self.win.set_default_size(1200, 900)  # Increased height for new controls
         self.win.set_title("PyprWall - Hyprland Wallpaper Manager")
+        self.win.connect("close-request", self.on_window_close_request)
 
         # Create header bar
         header_bar = Gtk.HeaderBar()
@@ -335,23 +2776,37 @@ WantedBy=default.target
         self.apply_button.set_sensitive(False)
         header_bar.pack_end(self.apply_button)
 
+        # Favorite toggle, favorites come up more often in random cycling
+        self.favorite_button = Gtk.ToggleButton(label="★ Favorite")
+        self.favorite_button.set_sensitive(False)
+        self.favorite_handler_id = self.favorite_button.connect("toggled", self.on_favorite_toggled)
+        header_bar.pack_end(self.favorite_button)
+
         # Create main box
         main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
         self.win.set_child(main_box)
 
         # Create cycling controls
         self.create_cycling_controls(main_box)
+        self.create_library_controls(main_box)
 
         # Scrolled window for grid
-        scrolled = Gtk.ScrolledWindow()
-        scrolled.set_vexpand(True)  # Make it expand vertically
-        main_box.append(scrolled)
+        self.grid_scrolled = Gtk.ScrolledWindow()
+        self.grid_scrolled.set_vexpand(True)  # Make it expand vertically
+        main_box.append(self.grid_scrolled)
+        # Sharpen the thumbnails that come into view
+        adjustment = self.grid_scrolled.get_vadjustment()
+        adjustment.connect("value-changed", self.schedule_thumbnail_upgrade)
+        adjustment.connect("changed", self.schedule_thumbnail_upgrade)
 
         # Create flow box for thumbnails
         self.flow_box = Gtk.FlowBox()
-        self.flow_box.set_max_children_per_line(MAX_CHILDREN_PER_LINE)
+        self.flow_box.set_max_children_per_line(self.get_grid_columns())
+        self.flow_box.connect("notify::scale-factor", self.schedule_thumbnail_upgrade)
         self.flow_box.set_selection_mode(Gtk.SelectionMode.SINGLE)
         self.flow_box.connect("selected-children-changed", self.on_wallpaper_selected)
+        self.flow_box.set_sort_func(self.compare_thumbnails)
+        self.flow_box.set_filter_func(self.filter_thumbnail)
 
         # Increased spacing between thumbnails
         try:
@@ -361,7 +2816,7 @@ WantedBy=default.target
             # older bindings may not have these setters; ignore if not present
             pass
 
-        scrolled.set_child(self.flow_box)
+        self.grid_scrolled.set_child(self.flow_box)
 
         # Create a container for the status label and spinner
         status_container = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
@@ -386,42 +2841,182 @@ WantedBy=default.target
     def get_monitors(self):
         """Detect available monitors using hyprctl."""
         try:
-            result = subprocess.run(['hyprctl', 'monitors', '-j'], capture_output=True, text=True, timeout=5)
-            monitors = []
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                for mon in data:
-                    monitors.append(mon.get('name', ''))
-            return monitors if monitors else ['default']
+            with METRICS.span('hyprctl.monitors'):
+                result = subprocess.run(['hyprctl', 'monitors', '-j'], capture_output=True, text=True, timeout=5)
+            monitors = []
+            if result.returncode == 0:
+                data = json.loads(result.stdout)
+                for mon in data:
+                    monitors.append(mon.get('name', ''))
+            return monitors if monitors else ['default']
+        except Exception as e:
+            log.warning("Error detecting monitors: %s", e, extra=fields(backend='hyprctl'))
+            return ['default']
+
+    def resolve_assignments(self, fallback):
+        """
+        {monitor: wallpaper} for now: the schedule's wallpaper where one is in effect,
+        otherwise fallback(), which is called at most once and only when needed.
+        """
+        scheduled = self.schedule.resolve()
+        assignments = {m: scheduled.get(m) or scheduled.get('') for m in self.monitors}
+        if not all(assignments.values()):
+            wallpaper = fallback()
+            assignments = {m: w or wallpaper for m, w in assignments.items()}
+        return assignments
+
+    def apply_assignments(self, assignments):
+        """Write the configs and apply the {monitor: wallpaper} mapping, one IPC call per distinct change"""
+        self.monitor_wallpapers = dict(assignments)
+        self.current_wallpaper = next(iter(assignments.values()))
+        self.update_hyprpaper_config(assignments)
+        self.apply_hyprpaper_via_ipc(assignments)
+
+    def update_lockscreen(self):
+        """
+        Eager mode: point hyprlock.conf at the new wallpaper and restart hyprlock.
+        Lazy mode: nothing, prepare_lockscreen() runs when the screen locks or the system sleeps.
+        """
+        if self.lockscreen_mode == 'lazy':
+            METRICS.count('lockscreen.deferred')
+            return
+        if self.symlink_configs:
+            self.prepare_lockscreen()
+        else:
+            self.apply_hyprlock_wallpaper(assignments=self.monitor_wallpapers)
+        with METRICS.span('pkill.hyprlock'):
+            subprocess.run(["pkill", "hyprlock"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def prepare_lockscreen(self, wallpaper=None):
+        """
+        Point the lockscreen symlink at wallpaper (default: the current one). hyprlock.conf
+        names the link, so it is only rewritten when the link's extension changes.
+        """
+        wallpaper = wallpaper or self.current_wallpaper
+        if not wallpaper:
+            return False
+        link = os.path.join(self.link_dir, 'lockscreen' + os.path.splitext(wallpaper)[1].lower())
+        with METRICS.span('lockscreen.prepare'):
+            os.makedirs(self.link_dir, exist_ok=True)
+            point_symlink(link, wallpaper)
+            self.apply_hyprlock_wallpaper(link)
+        return True
+
+    def on_lock_signal(self, reason):
+        log.debug("Preparing lockscreen before %s", reason, extra=fields(wallpaper=self.current_wallpaper))
+        try:
+            self.prepare_lockscreen()
+        except OSError as e:
+            log.error("Could not prepare the lockscreen: %s", e)
+
+    def arm_schedule(self):
+        """Wake up exactly at the next schedule boundary (re-checking at least every SCHEDULE_MAX_WAIT)"""
+        self.disarm_schedule()
+        boundary = self.schedule.next_boundary()
+        if boundary is None:
+            return
+        delay = min(max(boundary - time.time(), 0), SCHEDULE_MAX_WAIT)
+        self.schedule_timeout_id = GLib.timeout_add(int(delay * 1000) + 1, self.on_schedule_boundary)
+
+    def disarm_schedule(self):
+        if self.schedule_timeout_id:
+            GLib.source_remove(self.schedule_timeout_id)
+            self.schedule_timeout_id = None
+
+    def on_schedule_boundary(self):
+        self.schedule_timeout_id = None
+        if not self.is_paused and not self.defer_if_away('schedule'):
+            self.apply_schedule()
+        self.arm_schedule()
+        return False
+
+    def apply_schedule(self):
+        """Apply the wallpapers the schedule resolves to now, if they differ from what is shown"""
+        # Monitors leaving a scheduled range go back to the playlist's wallpaper
+        fallback = (self.playlist.current() if self.playlist else None) or self.current_wallpaper
+        if not fallback:
+            return
+        assignments = self.resolve_assignments(lambda: fallback)
+        if assignments != self.monitor_wallpapers:
+            log.info("Schedule boundary, applying %s", ', '.join(
+                f"{m}={os.path.basename(w)}" for m, w in assignments.items()))
+            try:
+                self.apply_assignments(assignments)
+                self.update_lockscreen()
+            except Exception as e:
+                log.error("Error applying scheduled wallpaper: %s", e)
+            self.save_cycle_state()
+
+    def show_notification(self, message, replace_key=None):
+        """Show a desktop notification via D-Bus, falling back to notify-send without a session bus."""
+        try:
+            with METRICS.span('notify'):
+                self.notifier.notify(message, replace_key)
+            return
+        except GLib.Error as e:
+            log.debug("D-Bus notification failed (%s), using notify-send", e.message)
+        try:
+            with METRICS.span('notify-send'):
+                subprocess.run(['notify-send', 'PyprWall', message], check=False)
         except Exception as e:
-            print(f"Error detecting monitors: {e}")
-            return ['default']
-
-    def get_time_of_day(self):
-        import datetime
-        hour = datetime.datetime.now().hour
-        if 6 <= hour < 12:
-            return 'morning'
-        elif 12 <= hour < 17:
-            return 'afternoon'
-        elif 17 <= hour < 21:
-            return 'evening'
-        else:
-            return 'night'
+            log.warning("Notification error: %s", e)
 
-    def show_notification(self, message):
+    def write_metrics(self):
+        """Persist the metrics for --stats and, if requested, the Prometheus text file."""
+        if not self.daemon_mode:
+            return  # only the daemon owns stats.json, the GUI would overwrite it
         try:
-            subprocess.run(['notify-send', 'PyprWall', message], check=False)
+            if self.shared_stats:
+                snapshot = self.add_to_shared_stats(METRICS.snapshot())
+            else:
+                snapshot = METRICS.snapshot()
+                tmp_path = self.stats_file + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp_path, self.stats_file)
+            if self.metrics_file:
+                tmp_path = f"{self.metrics_file}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(METRICS.render_prometheus(snapshot))
+                os.replace(tmp_path, self.metrics_file)
         except Exception as e:
-            print(f"Notification error: {e}")
+            log.warning("Error writing metrics: %s", e)
+
+    def add_to_shared_stats(self, snapshot):
+        """
+        Add what this process recorded since its last write to stats.json and return the
+        total. Each --cycle-once run is a new process, so overwriting would keep one tick.
+        """
+        delta = combine_stats(snapshot, self._stats_flushed, -1) if self._stats_flushed else snapshot
+        with open(self.stats_file + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # the timer and the on-demand daemon may overlap
+            try:
+                with open(self.stats_file, 'r') as f:
+                    total = combine_stats(json.load(f), delta)
+            except (OSError, ValueError):
+                total = delta
+            tmp_path = f"{self.stats_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(total, f)
+            os.replace(tmp_path, self.stats_file)
+        self._stats_flushed = snapshot
+        return total
 
     def update_cycle_ui(self):
         # Show next wallpaper and countdown
+        if self.daemon_mode:
+            return  # no widgets to update
         if not self.is_cycling or self.is_paused:
             self.cycle_status_label.set_label("Cycling paused")
+        elif self.attached:
+            next_wallpaper = self.daemon_status.get('next_wallpaper')
+            if self.daemon_status.get('next_change_in') is None:
+                self.cycle_status_label.set_label("Cycled by the background service")
+            else:
+                self.cycle_status_label.set_label(
+                    f"Daemon: next {os.path.basename(next_wallpaper or '-')} in {self.cycle_countdown}s")
         else:
-            next_idx = (self.current_index + 1) % len(self.cycling_wallpapers)
-            next_wallpaper = os.path.basename(self.cycling_wallpapers[next_idx]) if self.cycling_wallpapers else "-"
+            next_wallpaper = os.path.basename(self.playlist.peek()) if self.playlist else "-"
             self.cycle_status_label.set_label(f"Next: {next_wallpaper} in {self.cycle_countdown}s")
 
     def pause_cycling(self):
@@ -529,27 +3124,21 @@ WantedBy=default.target
         """Handle interval spin button changes"""
         self.cycle_interval = int(spin_button.get_value()) * 60  # Convert minutes to seconds
         self.save_cycle_config()
-        # If currently cycling, restart with new interval
-        if self.is_cycling:
+        # If currently cycling, restart with new interval (a running daemon picks it up from the config file)
+        if self.is_cycling and not self.attached:
             self.stop_cycling()
             self.start_cycling()
-        # Debounced reload/restart
-        service_path = os.path.expanduser("~/.config/systemd/user/pyprwall.service")
-        if os.path.exists(service_path):
+        # Only the on-demand timer unit carries the interval itself and has to be rewritten
+        if self.service_mode == 'on-demand' and self.is_service_enabled():
             self.debounce_restart_service()
 
     def on_random_toggled(self, check_button):
         """Handle random order checkbox toggle"""
         self.is_random_order = check_button.get_active()
-        self.save_cycle_config()
-        # Debounced reload/restart
-        service_path = os.path.expanduser("~/.config/systemd/user/pyprwall.service")
-        if os.path.exists(service_path):
-            self.debounce_restart_service()
+        self.save_cycle_config()  # a running daemon re-orders its playlist when the file changes
     def on_reload_daemon_clicked(self, button):
         """Manual reload/restart daemon button callback."""
-        service_path = os.path.expanduser("~/.config/systemd/user/pyprwall.service")
-        if os.path.exists(service_path):
+        if self.is_service_enabled():
             self.reload_daemon()
         else:
             self.show_notification("Cycling service is not enabled.")
@@ -576,50 +3165,138 @@ WantedBy=default.target
 
     def on_systemd_button_clicked(self, button):
         """Handle systemd service enable/disable button"""
-        service_path = os.path.expanduser("~/.config/systemd/user/pyprwall.service")
-        service_enabled = os.path.exists(service_path)
-        
-        if service_enabled:
-            if self.disable_systemd_service():
-                button.set_label("Enable Auto-Start")
-                self.cycle_status_label.set_label("Auto-start disabled")
+        button.set_sensitive(False)
+        if self.is_service_enabled():
+            def disabled(ok, error):
+                button.set_sensitive(True)
+                if ok:
+                    button.set_label("Enable Auto-Start")
+                    self.cycle_status_label.set_label("Auto-start disabled")
+                else:
+                    self.cycle_status_label.set_label(f"Error disabling auto-start: {error}")
+            self.disable_systemd_service(disabled)
         else:
+            def enabled(ok, error):
+                button.set_sensitive(True)
+                if ok:
+                    button.set_label("Disable Auto-Start")
+                    self.cycle_status_label.set_label("Auto-start enabled")
+                else:
+                    self.cycle_status_label.set_label(f"Error enabling auto-start: {error}")
             self.create_systemd_service()
-            if self.enable_systemd_service():
-                button.set_label("Disable Auto-Start")
-                self.cycle_status_label.set_label("Auto-start enabled")
+            self.enable_systemd_service(enabled)
+
+    def on_service_mode_changed(self, dropdown, _pspec):
+        """Switch between a resident daemon and socket/timer activation, moving auto-start along"""
+        mode = list(SERVICE_MODES)[dropdown.get_selected()]
+        if mode == self.service_mode:
+            return
+        was_enabled = self.is_service_enabled()
 
+        def enabled(ok, error):
+            if ok:
+                self.cycle_status_label.set_label(f"Auto-start switched to {mode} mode")
+            else:
+                self.cycle_status_label.set_label(f"Error enabling auto-start: {error}")
+
+        def switch(ok=True, error=None):
+            if not ok:
+                self.cycle_status_label.set_label(f"Error switching service mode: {error}")
+                return
+            self.service_mode = mode
+            self.systemd.set_units(SERVICE_MODES[mode])
+            self.save_cycle_config()
+            if was_enabled:
+                self.create_systemd_service()
+                self.enable_systemd_service(enabled)
+
+        if was_enabled:
+            self.disable_systemd_service(switch)
+        else:
+            switch()
+
+    @METRICS.timed('state.save')
     def save_cycle_state(self):
-        config = self.load_config()
-        config['cycle_state'] = {
+        """
+        Persist the cycle position in its own small file, so pyprwall.json (which the
+        daemon watches) only changes when settings do.
+        """
+        state = {
             'is_cycling': self.is_cycling,
             'is_paused': self.is_paused,
-            'current_index': self.current_index,
-            'wallpaper_list': self.wallpaper_list,
+            'playlist': self.playlist.state() if self.playlist else self.saved_playlist_state,
             'current_wallpaper': self.current_wallpaper
         }
-        self.save_config(config)
+        if not self.write_cycle_state(state):
+            return
+        if self._legacy_cycle_state:
+            # Older versions kept the state inside pyprwall.json
+            config = self.load_config()
+            config.pop('cycle_state', None)
+            self.save_config(config)
+            self._legacy_cycle_state = False
+
+    def save_applied_wallpaper(self):
+        """Attached GUI: record the applied wallpaper for --prepare-lock, keeping the daemon's position"""
+        try:
+            with open(self.cycle_state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state['current_wallpaper'] = self.current_wallpaper
+        self.write_cycle_state(state)
+
+    def write_cycle_state(self, state):
+        try:
+            tmp_path = f"{self.cycle_state_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.cycle_state_file)
+            self._cycle_state_mtime = os.stat(self.cycle_state_file).st_mtime_ns
+        except OSError as e:
+            log.error("Error saving cycle state: %s", e)
+            return False
+        return True
 
     def restore_cycle_state(self):
-        config = self.load_config()
-        state = config.get('cycle_state', {})
+        try:
+            with open(self.cycle_state_file, 'r') as f:
+                self._cycle_state_mtime = os.fstat(f.fileno()).st_mtime_ns
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = self.load_config().get('cycle_state', {})
+            self._legacy_cycle_state = bool(state)
         self.is_cycling = state.get('is_cycling', False)
         self.is_paused = state.get('is_paused', False)
-        self.current_index = state.get('current_index', 0)
-        self.wallpaper_list = state.get('wallpaper_list', [])
+        self.saved_playlist_state = state.get('playlist')
         self.current_wallpaper = state.get('current_wallpaper', None)
 
+    def refresh_cycle_state(self):
+        """On-demand daemon: pick up the changes the timer's --cycle-once runs saved since the last request"""
+        try:
+            mtime = os.stat(self.cycle_state_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._cycle_state_mtime:
+            return
+        self.playlist = None  # the saved order replaces ours
+        self.restore_cycle_state()
+        self.prepare_cycle_order()
+
     def start_cycling(self):
         """Start the wallpaper cycling"""
+        if not self.take_cycle_ownership():
+            return
         if not self.wallpaper_list:
             if not self.daemon_mode:
                 self.cycle_status_label.set_label("No wallpapers available for cycling")
             else:
-                print("No wallpapers available for cycling")
+                log.warning("No wallpapers available for cycling")
             return
         
         self.is_cycling = True
         self.is_paused = False
+        self.prepare_cycle_order()
         self.save_cycle_state()
         
         # Only update UI if not in daemon mode
@@ -629,22 +3306,13 @@ WantedBy=default.target
             self.pause_button.set_sensitive(True)
             self.pause_button.set_label("Pause Cycling")
         
-        # Initialize wallpaper list order
-        if self.is_random_order:
-            # Create a shuffled copy of the list
-            self.cycling_wallpapers = self.wallpaper_list.copy()
-            random.shuffle(self.cycling_wallpapers)
-            self.current_index = 0
-        else:
-            self.cycling_wallpapers = self.wallpaper_list.copy()
-            # Start from current wallpaper if it exists in the list
-            if self.current_wallpaper and self.current_wallpaper in self.cycling_wallpapers:
-                self.current_index = self.cycling_wallpapers.index(self.current_wallpaper)
-            else:
-                self.current_index = 0
-        
         # Start the cycling timer
         self.schedule_next_cycle()
+        self.arm_schedule()
+        if self.lockscreen_mode == 'lazy':
+            self.lock_watcher.start()
+        if self.idle_aware:
+            self.presence.start()
         
         # Update status
         minutes = self.cycle_interval // 60
@@ -654,10 +3322,41 @@ WantedBy=default.target
         if not self.daemon_mode:
             self.cycle_status_label.set_label(f"Cycling every {time_str} in {order_str} order")
         else:
-            print(f"Cycling every {time_str} in {order_str} order")
+            log.info("Cycling every %s in %s order", time_str, order_str)
+
+    def prepare_cycle_order(self):
+        """Build the compact playlist from wallpaper_list, resuming the saved order if it still fits"""
+        saved_state = self.playlist.state() if self.playlist else self.saved_playlist_state
+        paths = self.wallpaper_list
+        if self.skip_duplicates:
+            if self.daemon_mode and not self.duplicate_of:
+                # No grid load in the daemon, group straight from the saved index
+                self.duplicate_of = find_duplicates(self.library_index, paths)
+            paths = [p for p in paths if self.duplicate_of.get(p, p) == p]
+        self.playlist = Playlist(paths, self.is_random_order,
+                                no_repeat=self.no_repeat_window, weights=self.get_cycle_weights())
+        if not self.playlist.restore(saved_state):
+            # Start from current wallpaper if it exists in the list
+            if not self.is_random_order and self.current_wallpaper:
+                self.playlist.seek(self.current_wallpaper)
+        self.saved_playlist_state = None
+        if self.daemon_mode:
+            # The daemon has no grid, keep only the compact copy
+            self.wallpaper_list = self.playlist
+
+    def get_cycle_weights(self):
+        """Per-wallpaper selection weights for random order, or None when all are equal"""
+        if not self.favorites and not self.cycle_weights:
+            return None
+        weights = dict.fromkeys(self.favorites, self.favorite_weight)
+        weights.update(self.cycle_weights)
+        return weights
 
     def stop_cycling(self):
         """Stop the wallpaper cycling"""
+        if self.attached:
+            self.send_to_daemon('stop')
+            return
         self.is_cycling = False
         self.is_paused = False
         self.save_cycle_state()
@@ -672,18 +3371,34 @@ WantedBy=default.target
         if self.cycle_timeout_id:
             GLib.source_remove(self.cycle_timeout_id)
             self.cycle_timeout_id = None
+        self.disarm_schedule()
+        self.presence.stop()
+        self.deferred_work.clear()
+        if self._dpms_recheck_id:
+            GLib.source_remove(self._dpms_recheck_id)
+            self._dpms_recheck_id = None
+        if self.lockscreen_mode == 'lazy':
+            # Nothing changes the wallpaper any more, settle the lockscreen now
+            self.lock_watcher.stop()
+            self.on_lock_signal('stop')
         
         if not self.daemon_mode:
             self.cycle_status_label.set_label("Cycling stopped")
         else:
-            print("Cycling stopped")
+            log.info("Cycling stopped")
 
     def pause_cycling(self):
+        if self.attached:
+            self.send_to_daemon('pause')
+            return
         self.is_paused = True
         self.save_cycle_state()
         self.update_cycle_ui()
 
     def resume_cycling(self):
+        if self.attached:
+            self.send_to_daemon('resume')
+            return
         self.is_paused = False
         self.save_cycle_state()
         self.update_cycle_ui()
@@ -710,7 +3425,7 @@ WantedBy=default.target
         interval_box.set_halign(Gtk.Align.CENTER)
 
         interval_label = Gtk.Label(label="Change wallpaper every:")
-        interval_label.set_tooltip_text("Changing this will restart the cycling daemon.")
+        interval_label.set_tooltip_text("The running daemon picks up changes without a restart.")
         interval_box.append(interval_label)
 
         # Spin button for interval (in minutes)
@@ -719,7 +3434,7 @@ WantedBy=default.target
         self.interval_spin.set_increments(1, 5)
         self.interval_spin.set_value(self.cycle_interval // 60)  # Convert seconds to minutes
         self.interval_spin.connect("value-changed", self.on_interval_changed)
-        self.interval_spin.set_tooltip_text("Changing this will restart the cycling daemon.")
+        self.interval_spin.set_tooltip_text("The running daemon picks up changes without a restart.")
         interval_box.append(self.interval_spin)
 
         minutes_label = Gtk.Label(label="minutes")
@@ -735,7 +3450,7 @@ WantedBy=default.target
         self.random_check = Gtk.CheckButton(label="Random order")
         self.random_check.set_active(self.is_random_order)
         self.random_check.connect("toggled", self.on_random_toggled)
-        self.random_check.set_tooltip_text("Changing this will restart the cycling daemon.")
+        self.random_check.set_tooltip_text("The running daemon picks up changes without a restart.")
         options_box.append(self.random_check)
 
         cycling_box.append(options_box)
@@ -768,6 +3483,14 @@ WantedBy=default.target
         systemd_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
         systemd_box.set_halign(Gtk.Align.CENTER)
 
+        # Resident daemon, or socket activation plus a timer unit
+        self.service_mode_dropdown = Gtk.DropDown.new_from_strings(["Resident daemon", "On demand (socket + timer)"])
+        self.service_mode_dropdown.set_selected(list(SERVICE_MODES).index(self.service_mode))
+        self.service_mode_dropdown.set_tooltip_text(
+            "On demand: nothing stays in memory; a timer changes the wallpaper and the daemon only starts for control requests.")
+        self.service_mode_dropdown.connect("notify::selected", self.on_service_mode_changed)
+        systemd_box.append(self.service_mode_dropdown)
+
         self.systemd_button = Gtk.Button(label="Enable Auto-Start")
         self.systemd_button.connect("clicked", self.on_systemd_button_clicked)
         systemd_box.append(self.systemd_button)
@@ -778,6 +3501,10 @@ WantedBy=default.target
         self.reload_button.connect("clicked", self.on_reload_daemon_clicked)
         systemd_box.append(self.reload_button)
 
+        # Live service state, updated from systemd's D-Bus signals
+        self.service_status_label = Gtk.Label(label="")
+        systemd_box.append(self.service_status_label)
+
         cycling_box.append(systemd_box)
 
         # Status for cycling
@@ -786,7 +3513,7 @@ WantedBy=default.target
         cycling_box.append(self.cycle_status_label)
 
         # Help/documentation label
-        doc_label = Gtk.Label(label="Changing cycling settings will automatically restart the background daemon.")
+        doc_label = Gtk.Label(label="The running daemon picks up changed cycling settings without a restart.")
         doc_label.set_wrap(True)
         doc_label.set_max_width_chars(60)
         doc_label.set_margin_top(5)
@@ -796,16 +3523,247 @@ WantedBy=default.target
         parent_box.append(cycling_frame)
 
     def set_wallpaper_for_monitor(self, monitor, wallpaper):
-        # For hyprpaper, use monitor-specific wallpaper config
+        """For hyprpaper, use monitor-specific wallpaper config; the caller preloads. False on failure"""
         try:
-            subprocess.run([
-                "hyprctl", "hyprpaper", "preload", f"{wallpaper}"
-            ], check=True, text=True, timeout=10, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            subprocess.run([
-                "hyprctl", "hyprpaper", "wallpaper", f"{monitor},{wallpaper}"
-            ], check=True, text=True, timeout=10, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except Exception as e:
-            print(f"Monitor wallpaper error: {e}")
+            self.hyprpaper.request('wallpaper', f"{monitor},{wallpaper}")
+            return True
+        except OSError as e:
+            log.error("Monitor wallpaper error: %s", e,
+                      extra=fields(monitor=monitor, wallpaper=wallpaper, backend='hyprpaper'))
+            return False
+
+    def create_library_controls(self, parent_box):
+        """Sort and filter controls for the thumbnail grid, using the library index"""
+        library_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        library_box.set_halign(Gtk.Align.CENTER)
+
+        # Typing anywhere in the window starts a search
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text("Search names, folders, tags")
+        self.search_entry.set_key_capture_widget(self.win)
+        self.search_entry.connect("search-changed", self.on_search_changed)
+        library_box.append(self.search_entry)
+
+        library_box.append(Gtk.Label(label="Sort by:"))
+        self.sort_dropdown = Gtk.DropDown.new_from_strings(LIBRARY_SORTS)
+        self.sort_dropdown.connect("notify::selected", self.on_library_view_changed)
+        library_box.append(self.sort_dropdown)
+
+        library_box.append(Gtk.Label(label="Brightness:"))
+        self.brightness_dropdown = Gtk.DropDown.new_from_strings(list(BRIGHTNESS_FILTERS))
+        self.brightness_dropdown.set_tooltip_text("Wallpapers not analyzed yet are always shown.")
+        self.brightness_dropdown.connect("notify::selected", self.on_library_view_changed)
+        library_box.append(self.brightness_dropdown)
+
+        self.collapse_duplicates_check = Gtk.CheckButton(label="Collapse duplicates")
+        self.collapse_duplicates_check.set_tooltip_text("Show only the largest file of each group of near-identical images.")
+        self.collapse_duplicates_check.connect("toggled", lambda _check: self.flow_box.invalidate_filter())
+        library_box.append(self.collapse_duplicates_check)
+
+        self.skip_duplicates_check = Gtk.CheckButton(label="Skip duplicates when cycling")
+        self.skip_duplicates_check.set_active(self.skip_duplicates)
+        self.skip_duplicates_check.connect("toggled", self.on_skip_duplicates_toggled)
+        library_box.append(self.skip_duplicates_check)
+
+        self.duplicates_label = Gtk.Label(label="")
+        library_box.append(self.duplicates_label)
+
+        library_box.append(Gtk.Label(label="Zoom:"))
+        self.zoom_scale = Gtk.Scale.new_with_range(Gtk.Orientation.HORIZONTAL, GRID_ZOOM_MIN, GRID_ZOOM_MAX, GRID_ZOOM_STEP)
+        self.zoom_scale.set_draw_value(False)
+        self.zoom_scale.set_size_request(140, -1)
+        self.zoom_scale.add_mark(1.0, Gtk.PositionType.BOTTOM, None)
+        self.zoom_scale.set_value(self.grid_zoom)
+        self.zoom_scale.connect("value-changed", self.on_grid_zoom_changed)
+        library_box.append(self.zoom_scale)
+
+        parent_box.append(library_box)
+
+    def get_grid_columns(self):
+        return max(1, round(MAX_CHILDREN_PER_LINE / self.grid_zoom))
+
+    def get_grid_cell_size(self):
+        """Thumbnail size in the grid at the current zoom, in logical pixels"""
+        return round(THUMB_WIDTH * self.grid_zoom), round(THUMB_HEIGHT * self.grid_zoom)
+
+    def get_grid_pixel_size(self):
+        """Thumbnail size in device pixels, what a sharp thumbnail needs on this display"""
+        width, height = self.get_grid_cell_size()
+        scale = self.flow_box.get_scale_factor()
+        return width * scale, height * scale
+
+    def on_grid_zoom_changed(self, scale):
+        zoom = round(scale.get_value() / GRID_ZOOM_STEP) * GRID_ZOOM_STEP
+        if zoom == self.grid_zoom:
+            return
+        self.grid_zoom = zoom
+        # Dragging the slider ticks many times; write pyprwall.json once it rests
+        if self._zoom_save_id:
+            GLib.source_remove(self._zoom_save_id)
+        self._zoom_save_id = GLib.timeout_add(GRID_ZOOM_SAVE_DELAY, self.save_grid_zoom)
+        width, height = self.get_grid_cell_size()
+        self.flow_box.set_max_children_per_line(self.get_grid_columns())
+        # Zooming out keeps the larger textures, zooming in sharpens what is visible
+        for child in self.thumbnail_children.values():
+            picture = self.get_thumbnail_picture(child)
+            picture.set_size_request(width, height)
+            picture.get_paintable().resize(width, height)
+        self.schedule_thumbnail_upgrade()
+
+    def save_grid_zoom(self):
+        self._zoom_save_id = None
+        self.save_cycle_config()
+        return False
+
+    def on_window_close_request(self, _window):
+        if self._zoom_save_id:
+            GLib.source_remove(self._zoom_save_id)
+            self.save_grid_zoom()
+        return False
+
+    def schedule_thumbnail_upgrade(self, *_args):
+        if self._upgrade_timeout_id:
+            GLib.source_remove(self._upgrade_timeout_id)
+        self._upgrade_timeout_id = GLib.timeout_add(THUMB_UPGRADE_DELAY, self.upgrade_visible_thumbnails)
+
+    def get_visible_thumbnail_paths(self):
+        """Paths of the cells in the scrolled window's viewport, top to bottom"""
+        adjustment = self.grid_scrolled.get_vadjustment()
+        top = int(adjustment.get_value())
+        bottom = top + int(adjustment.get_page_size())
+        width, height = self.get_grid_cell_size()
+        # Cells are larger than their thumbnail, so half-thumbnail steps hit every one
+        paths = {}
+        for y in range(top, bottom + 1, max(1, height // 2)):
+            for x in range(0, self.flow_box.get_width(), max(1, width // 2)):
+                child = self.flow_box.get_child_at_pos(x, y)
+                if child is not None and child in self.thumbnails:
+                    paths[self.thumbnails[child]] = None
+        return list(paths)
+
+    def upgrade_visible_thumbnails(self):
+        """
+        Reload the visible thumbnails made for a smaller box than the zoom and scale factor
+        now need, in the background. Larger levels are only ever made for what is seen.
+        """
+        self._upgrade_timeout_id = None
+        width, height = self.get_grid_pixel_size()
+        paths = [path for path in self.get_visible_thumbnail_paths()
+                 if self.thumbnail_resolution.get(path, 0) < width]
+        if not paths:
+            return False
+        self._upgrade_generation += 1
+        generation = self._upgrade_generation
+
+        def do_upgrade():
+            for path in paths:
+                if generation != self._upgrade_generation:
+                    return  # scrolled on, a newer pass covers what is visible now
+                pixbuf = self.load_or_create_thumbnail(path, width, height)
+                if pixbuf is not None:
+                    GLib.idle_add(self.set_thumbnail_pixbuf, path, pixbuf, width)
+
+        thread = self.threading.Thread(target=do_upgrade)
+        thread.daemon = True
+        thread.start()
+        return False
+
+    def get_thumbnail_picture(self, child):
+        return child.get_child().get_first_child()
+
+    def create_thumbnail_paintable(self, pixbuf):
+        return ThumbnailPaintable(Gdk.Texture.new_for_pixbuf(pixbuf), *self.get_grid_cell_size())
+
+    def set_thumbnail_pixbuf(self, full_path, pixbuf, resolution):
+        """Main thread: swap a cell's thumbnail for one made for a resolution wide box"""
+        child = self.thumbnail_children.get(full_path)
+        if child is not None:
+            self.get_thumbnail_picture(child).set_paintable(self.create_thumbnail_paintable(pixbuf))
+            self.thumbnail_resolution[full_path] = resolution
+        return False
+
+    def get_search_tags(self):
+        """Tags from the config, plus 'favorite' for favorites"""
+        tags = {path: list(values) for path, values in self.tags.items()}
+        for path in self.favorites:
+            tags.setdefault(path, []).append('favorite')
+        return tags
+
+    def on_search_changed(self, entry):
+        """Filter the grid as the user types, touching only the cells whose visibility changes"""
+        query = entry.get_text().strip()
+        if not query or self.search_index is None:
+            self.apply_search('', None)
+            return
+        # Still typing the same query: narrow the last result
+        within = self.search_ids if self.search_query and SearchIndex.refines(self.search_query, query) else None
+        with METRICS.span('search'):
+            ids = self.search_index.query(query, within)
+        self.apply_search(query, ids)
+
+    def apply_search(self, query, ids):
+        old = self.search_ids
+        self.search_query, self.search_ids = query, ids
+        if old is None and ids is None:
+            return
+        if self.search_index is None:
+            self.flow_box.invalidate_filter()
+            return
+        everything = range(len(self.search_index))
+        changed = (old if old is not None else set(everything)) ^ (ids if ids is not None else set(everything))
+        if len(changed) > len(self.thumbnail_children) // 2:
+            self.flow_box.invalidate_filter()  # cheaper as one pass
+            return
+        paths = self.search_index.paths
+        for doc in changed:
+            child = self.thumbnail_children.get(paths[doc])
+            if child is not None:
+                child.changed()
+
+    def update_duplicates_label(self):
+        hidden = sum(1 for path, keep in self.duplicate_of.items() if path != keep)
+        self.duplicates_label.set_label(f"{hidden} duplicate{'s' if hidden != 1 else ''}" if hidden else "")
+
+    def on_skip_duplicates_toggled(self, check_button):
+        self.skip_duplicates = check_button.get_active()
+        self.save_cycle_config()
+        if self.is_cycling:
+            # Different contents, so the saved position can't carry over
+            self.playlist = None
+            self.prepare_cycle_order()
+
+    def on_library_view_changed(self, dropdown, _pspec):
+        self.flow_box.invalidate_sort()
+        self.flow_box.invalidate_filter()
+
+    def compare_thumbnails(self, child1, child2):
+        """FlowBox sort function: by path, or by hue with grays and unanalyzed wallpapers last"""
+        key1, key2 = self.thumbnail_sort_key(child1), self.thumbnail_sort_key(child2)
+        return (key1 > key2) - (key1 < key2)
+
+    def thumbnail_sort_key(self, child):
+        path = self.thumbnails.get(child, '')
+        if LIBRARY_SORTS[self.sort_dropdown.get_selected()] != 'Hue':
+            return (0, 0.0, path)
+        entry = self.library_index.get(path)
+        if entry is None or 'hue' not in entry:
+            return (2, 0.0, path)
+        if entry['saturation'] < GRAY_SATURATION:
+            return (1, entry['brightness'], path)
+        return (0, entry['hue'], path)
+
+    def filter_thumbnail(self, child):
+        """FlowBox filter function for the brightness dropdown"""
+        path = self.thumbnails.get(child)
+        if self.search_ids is not None and self.search_index.doc_of.get(path) not in self.search_ids:
+            return False
+        if self.collapse_duplicates_check.get_active() and self.duplicate_of.get(path, path) != path:
+            return False
+        low, high = list(BRIGHTNESS_FILTERS.values())[self.brightness_dropdown.get_selected()]
+        entry = self.library_index.get(path)
+        if entry is None or 'brightness' not in entry:
+            return True
+        return low <= entry['brightness'] < high
 
     def update_ui_selection(self):
         """Update the UI to show the currently applied wallpaper as selected"""
@@ -822,10 +3780,12 @@ WantedBy=default.target
         """
         Handles the 'realize' signal of the window. This is the first time the window is shown.
         """
-        print("--- App starting, checking config file... ---")
+        log.debug("App starting, checking config file")
+        # A running daemon owns cycling; mirror it rather than starting a second timer
+        self.attach_to_daemon()
         config = self.load_config()
         last_folder = config.get('wallpaper_dir')
-        print(f"Path read from config: '{last_folder}'")
+        log.debug("Path read from config: %s", last_folder)
         # Use the last_folder if valid, otherwise use default
         if last_folder and os.path.exists(last_folder):
             self.wallpaper_dir = last_folder
@@ -833,15 +3793,21 @@ WantedBy=default.target
         else:
             self.load_wallpapers(self.wallpaper_dir)
             
-        # Check systemd service status
-        service_path = os.path.expanduser("~/.config/systemd/user/pyprwall.service")
-        if os.path.exists(service_path):
+        # Check systemd service status, then keep it live through systemd's D-Bus signals
+        if self.is_service_enabled():
             self.systemd_button.set_label("Disable Auto-Start")
         else:
             self.systemd_button.set_label("Enable Auto-Start")
+        try:
+            self.systemd.watch(self.on_service_state_changed)
+            self.daemon_unit.watch(self.on_daemon_unit_changed)
+        except GLib.Error as e:
+            log.debug("Can't watch %s over D-Bus: %s", SYSTEMD_UNIT, e.message)
 
         # Update UI based on saved cycle state
-        if self.is_cycling:
+        if self.attached:
+            pass  # apply_daemon_status has set the controls
+        elif self.is_cycling:
             # Update UI elements to reflect cycling state
             self.cycle_button.set_label("Stop Cycling")
             self.next_button.set_sensitive(True)
@@ -852,8 +3818,7 @@ WantedBy=default.target
                 self.cycle_status_label.set_label("Cycling paused")
             else:
                 self.pause_button.set_label("Pause Cycling")
-                # Start the cycling timer if not in paused state
-                self.start_cycling()
+            # The timer is started by finish_loading, once the wallpapers are listed
         else:
             self.cycle_button.set_label("Start Cycling")
             self.next_button.set_sensitive(False)
@@ -935,60 +3900,243 @@ WantedBy=default.target
             self.load_wallpapers(folder)
         dialog.destroy()
 
+    @METRICS.timed('load.scan')
+    def scan_wallpaper_folder(self, folder_path):
+        """Return the sorted full paths of all supported images in folder_path; raises OSError (TimeoutError if it hangs)."""
+        wallpapers = [path for batch in FolderScan(folder_path).batches() for path, _stat in batch]
+        wallpapers.sort()
+        return wallpapers
+
     def get_wallpaper_folder_meta(self, folder_path):
-        """Return a dict with folder mtime and file list for change detection."""
+        """
+        Return a dict with the folder mtime for change detection. Adding, removing or
+        renaming a file changes it, so no listing is needed.
+        """
         try:
-            stat = os.stat(folder_path)
-            mtime = stat.st_mtime
-            files = sorted([f for f in os.listdir(folder_path)
-                           if os.path.isfile(os.path.join(folder_path, f))])
-            return {"mtime": mtime, "files": files}
+            return {"mtime": os.stat(folder_path).st_mtime}
         except Exception:
             return None
 
+    def load_wallpaper_cache_file(self):
+        """Read the wallpaper list cache, kept apart from pyprwall.json so state saves stay small."""
+        try:
+            with open(self.wallpaper_cache_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @METRICS.timed('load.cache_check')
     def is_cache_valid(self, folder_path):
         """Check if cache meta matches current folder meta."""
-        config = self.load_config()
-        cached_meta = config.get('wallpaper_cache_meta')
+        cache = self.load_wallpaper_cache_file()
+        cached_meta = cache.get('meta') or {}
         current_meta = self.get_wallpaper_folder_meta(folder_path)
-        return cached_meta == current_meta
+        return (current_meta is not None and cached_meta.get('mtime') == current_meta['mtime']
+                and self.is_cached_folder(cache, folder_path))
 
-    def save_wallpaper_cache(self, folder_path, wallpaper_list):
-        """Save wallpaper list and meta to cache files."""
+    def is_cached_folder(self, cache, folder_path):
+        """Whether the wallpaper cache lists folder_path (it holds a single folder)"""
+        wallpapers = cache.get('wallpapers')
+        return bool(wallpapers) and os.path.dirname(wallpapers[0]) == folder_path
+
+    @METRICS.timed('load.cache_save')
+    def save_wallpaper_cache(self, folder_path, wallpaper_list, meta=None):
+        """Save wallpaper list and meta (by default the folder's current one) to cache files."""
         config = self.load_config()
-        config['wallpaper_cache'] = wallpaper_list
-        config['wallpaper_cache_meta'] = self.get_wallpaper_folder_meta(folder_path)
-        self.save_config(config)
+        if 'wallpaper_cache' in config:
+            # Older versions kept the list inside pyprwall.json
+            config.pop('wallpaper_cache', None)
+            config.pop('wallpaper_cache_meta', None)
+            self.save_config(config)
+        cache = {'wallpapers': list(wallpaper_list), 'meta': meta or self.get_wallpaper_folder_meta(folder_path)}
+        try:
+            with open(self.wallpaper_cache_file, 'w') as f:
+                json.dump(cache, f)
+        except Exception as e:
+            log.error("Error saving wallpaper cache: %s", e)
 
     def load_wallpaper_cache(self):
         """Load wallpaper list from cache file."""
-        config = self.load_config()
-        return config.get('wallpaper_cache', [])
+        return self.load_wallpaper_cache_file().get('wallpapers', [])
 
     def get_thumbnail_cache_path(self, wallpaper_path):
-        import hashlib
+        """Private cache path, only used when the shared thumbnail cache isn't writable."""
         h = hashlib.sha256(wallpaper_path.encode()).hexdigest()
         return os.path.join(self.thumbnail_cache_dir, f'{h}.png')
-    
-    def load_or_create_thumbnail(self, wallpaper_path):
+
+    def get_shared_thumbnail_path(self, uri, flavor):
+        """Path of a thumbnail in the shared freedesktop cache (~/.cache/thumbnails/<flavor>)."""
+        name = hashlib.md5(uri.encode()).hexdigest() + '.png'
+        return os.path.join(self.shared_thumbnail_dir, flavor, name)
+
+    def get_shared_thumbnail_flavors(self, width, height):
+        """Flavors whose thumbnails are large enough for a width x height box, smallest first."""
+        needed = min(max(width, height), FREEDESKTOP_THUMB_FLAVORS[-1][1])  # xx-large is the best there is
+        return [(flavor, size) for flavor, size in FREEDESKTOP_THUMB_FLAVORS if size >= needed]
+
+    def load_shared_thumbnail(self, uri, mtime, width, height):
+        """Return a valid shared-cache thumbnail for uri and its flavor, checking Thumb::URI and Thumb::MTime."""
+        for flavor, _size in self.get_shared_thumbnail_flavors(width, height):
+            path = self.get_shared_thumbnail_path(uri, flavor)
+            try:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+            except Exception:
+                continue  # missing or unreadable, try the next flavor
+            if pixbuf.get_option('tEXt::Thumb::URI') != uri:
+                continue
+            if pixbuf.get_option('tEXt::Thumb::MTime') != str(mtime):
+                continue  # stale, the image was modified after the thumbnail was made
+            return pixbuf, flavor
+        return None, None
+
+    def save_shared_thumbnail(self, pixbuf, uri, mtime, flavor):
+        """Store a thumbnail in the shared cache the way the spec asks: temp file, 0600, rename."""
+        path = self.get_shared_thumbnail_path(uri, flavor)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp_path = f"{path}.pyprwall-{os.getpid()}.tmp"
+        try:
+            pixbuf.savev(tmp_path, 'png',
+                         ['tEXt::Thumb::URI', 'tEXt::Thumb::MTime', 'tEXt::Software'],
+                         [uri, str(mtime), 'PyprWall'])
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def fit_pixbuf(self, pixbuf, width, height):
+        """Scale pixbuf to fit a width x height box, preserving the aspect ratio."""
+        scale = min(width / pixbuf.get_width(), height / pixbuf.get_height())
+        fit_width = max(1, round(pixbuf.get_width() * scale))
+        fit_height = max(1, round(pixbuf.get_height() * scale))
+        if (fit_width, fit_height) == (pixbuf.get_width(), pixbuf.get_height()):
+            return pixbuf
+        return pixbuf.scale_simple(fit_width, fit_height, GdkPixbuf.InterpType.BILINEAR)
+
+    def load_jpeg_thumbnail(self, wallpaper_path, width, height):
+        """
+        Fast thumbnail path for JPEGs. Uses the embedded EXIF preview when it is at least
+        as large as the requested size (and has the same aspect ratio), otherwise decodes
+        through a PixbufLoader whose size is set before decoding starts, so the JPEG module
+        picks a 1/2, 1/4 or 1/8 DCT scale instead of decoding at full resolution.
+        Returns None when the caller should fall back to the generic path.
+        """
+        try:
+            info = read_jpeg_info(wallpaper_path)
+        except OSError:
+            return None
+        if info is None:
+            return None
+        src_width, src_height, exif_thumbnail = info
+        scale = min(width / src_width, height / src_height)
+        target_width = max(1, round(src_width * scale))
+        target_height = max(1, round(src_height * scale))
+
+        if exif_thumbnail:
+            try:
+                loader = GdkPixbuf.PixbufLoader.new_with_type('jpeg')
+                loader.write(exif_thumbnail)
+                loader.close()
+                preview = loader.get_pixbuf()
+                preview_width, preview_height = preview.get_width(), preview.get_height()
+                same_aspect = abs(preview_width * src_height - preview_height * src_width) <= 0.01 * src_width * preview_height
+                if preview_width >= target_width and preview_height >= target_height and same_aspect:
+                    if (preview_width, preview_height) == (target_width, target_height):
+                        return preview
+                    return preview.scale_simple(target_width, target_height, GdkPixbuf.InterpType.BILINEAR)
+            except Exception:
+                pass  # broken preview, decode the image itself
+
+        try:
+            loader = GdkPixbuf.PixbufLoader.new_with_type('jpeg')
+            loader.connect('size-prepared', lambda l, w, h: l.set_size(target_width, target_height))
+            with open(wallpaper_path, 'rb') as f:
+                while True:
+                    chunk = f.read(JPEG_READ_CHUNK)
+                    if not chunk:
+                        break
+                    loader.write(chunk)
+            loader.close()
+            return loader.get_pixbuf()
+        except Exception as e:
+            log.debug("JPEG fast path failed for %s: %s", wallpaper_path, e)
+            return None
+
+    def load_or_create_thumbnail(self, wallpaper_path, width=THUMB_WIDTH, height=THUMB_HEIGHT):
+        """
+        Return a thumbnail fitting a width x height box, reading and writing the shared
+        freedesktop cache so images already browsed in a file manager show up instantly.
+        """
+        return self.load_thumbnail_with_source(wallpaper_path, width, height)[0]
+
+    def get_thumbnail_source_path(self, wallpaper_path, source):
+        """The cache file a thumbnail source from load_thumbnail_with_source refers to"""
+        if source == THUMB_SOURCE_PRIVATE:
+            return self.get_thumbnail_cache_path(wallpaper_path)
+        uri = GLib.filename_to_uri(wallpaper_path, None)
+        return self.get_shared_thumbnail_path(uri, FREEDESKTOP_THUMB_FLAVORS[source][0])
+
+    @METRICS.timed('load.thumbnail')
+    def load_thumbnail_with_source(self, wallpaper_path, width=THUMB_WIDTH, height=THUMB_HEIGHT, mtime=None):
+        """
+        load_or_create_thumbnail, also returning where the thumbnail is cached: the index
+        of its FREEDESKTOP_THUMB_FLAVORS flavor, THUMB_SOURCE_PRIVATE, or None if uncached.
+        The flavors form a pyramid: a missing level is derived from a larger cached one
+        rather than by decoding the original again. Pass mtime when the caller has stat()ed.
+        """
+        try:
+            if mtime is None:
+                mtime = int(os.stat(wallpaper_path).st_mtime)
+            uri = GLib.filename_to_uri(wallpaper_path, None)
+        except Exception as e:
+            log.warning("Error generating thumbnail for %s: %s", wallpaper_path, e)
+            return None, None
+        flavor_index = {flavor: i for i, (flavor, _size) in enumerate(FREEDESKTOP_THUMB_FLAVORS)}
+
+        # Generate at the smallest shared flavor that covers our size, then scale down
+        flavor, size = self.get_shared_thumbnail_flavors(width, height)[0]
+        pixbuf, found = self.load_shared_thumbnail(uri, mtime, width, height)
+        if pixbuf is not None:
+            if found != flavor and max(pixbuf.get_width(), pixbuf.get_height()) > size:
+                # Only a larger level is cached; store ours so the next load decodes less
+                pixbuf = self.fit_pixbuf(pixbuf, size, size)
+                try:
+                    self.save_shared_thumbnail(pixbuf, uri, mtime, flavor)
+                    found = flavor
+                except Exception as e:
+                    log.debug("Could not store the %s thumbnail of %s: %s", flavor, wallpaper_path, e)
+            return self.fit_pixbuf(pixbuf, width, height), flavor_index[found]
+
         cache_path = self.get_thumbnail_cache_path(wallpaper_path)
-        if os.path.exists(cache_path):
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= mtime:
             try:
                 pixbuf = GdkPixbuf.Pixbuf.new_from_file(cache_path)
-                return pixbuf
+                if pixbuf.get_width() >= width or pixbuf.get_height() >= height:
+                    return self.fit_pixbuf(pixbuf, width, height), THUMB_SOURCE_PRIVATE
             except Exception:
                 pass  # fallback to regeneration
+
+        try:
+            pixbuf = None
+            if os.path.splitext(wallpaper_path)[1].lower() in JPEG_EXTENSIONS:
+                pixbuf = self.load_jpeg_thumbnail(wallpaper_path, size, size)
+            if pixbuf is None:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(wallpaper_path, size, size)
+        except Exception as e:
+            log.warning("Error generating thumbnail for %s: %s", wallpaper_path, e)
+            return None, None
+        thumbnail = self.fit_pixbuf(pixbuf, width, height)
         try:
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(wallpaper_path, THUMB_WIDTH, THUMB_HEIGHT)
-            # Save to cache as PNG
+            self.save_shared_thumbnail(pixbuf, uri, mtime, flavor)
+            return thumbnail, flavor_index[flavor]
+        except Exception as e:
+            log.warning("Shared thumbnail cache not writable (%s), using private cache", e)
             try:
-                pixbuf.savev(cache_path, 'png', [], [])
+                thumbnail.savev(cache_path, 'png', [], [])
+                return thumbnail, THUMB_SOURCE_PRIVATE
             except Exception as e:
-                print(f"Error saving thumbnail cache for {wallpaper_path}: {e}")
-            return pixbuf
-        except Exception as e:
-            print(f"Error generating thumbnail for {wallpaper_path}: {e}")
-            return None
+                log.warning("Error saving thumbnail cache for %s: %s", wallpaper_path, e)
+        return thumbnail, None
 
     def load_wallpapers(self, folder_path):
         """
@@ -998,78 +4146,138 @@ WantedBy=default.target
         self.spinner.start()
         self.status_label.set_label(f"Loading from {os.path.basename(folder_path)}...")
 
+        @METRICS.timed('load.total')
         def do_load():
             # Clear existing thumbnails and wallpaper list (in main thread)
             def clear_thumbnails():
                 while self.flow_box.get_first_child() is not None:
                     self.flow_box.remove(self.flow_box.get_first_child())
                 self.thumbnails = {}
+                self.thumbnail_children = {}
+                self.thumbnail_resolution = {}
                 self.wallpaper_list = []
             GLib.idle_add(clear_thumbnails)
 
-            supported_formats = ['.png', '.jpg', '.jpeg', '.jxl', '.webp']
-            use_cache = self.is_cache_valid(folder_path)
-            if use_cache:
-                wallpapers = self.load_wallpaper_cache()
-            else:
+            # Thumbnails for the zoom at scale 1; visible cells are sharpened for HiDPI afterwards
+            cell_width, cell_height = self.get_grid_cell_size()
+
+            # Paint the last grid for this folder straight from the thumbnail cache, then check it
+            snapshot = self.load_grid_snapshot(folder_path)
+            painted = {}
+            if snapshot:
+                with METRICS.span('load.snapshot'):
+                    painted = self.paint_grid_snapshot(folder_path, snapshot, cell_width, cell_height)
+                GLib.idle_add(self.status_label.set_label, "Checking for changes...")
+
+            # One pass over the folder, thumbnails streaming into the grid as entries arrive;
+            # an unchanged folder isn't listed at all and the cached list is used
+            cache = self.load_wallpaper_cache_file()
+            cached = cache.get('wallpapers', []) if self.is_cached_folder(cache, folder_path) else []
+            scan = FolderScan(folder_path, (cache.get('meta') or {}).get('mtime') if cached else None, cached)
+            analyzer = ThumbnailAnalyzer(self.library_index)
+            seen = []
+            entries = []
+            batch = []
+            patched = 0
+
+            def add_wallpaper(full_path, stat):
+                nonlocal batch, patched
+                seen.append(full_path)
                 try:
-                    wallpapers = [f for f in os.listdir(folder_path)
-                                 if os.path.isfile(os.path.join(folder_path, f)) and
-                                 os.path.splitext(f)[1].lower() in supported_formats]
+                    mtime = int(stat.st_mtime)
+                    pixbuf = None
+                    known = painted.get(full_path)
+                    if known and known[0] == mtime:
+                        source = known[1]  # painted from the snapshot and unchanged
+                    else:
+                        pixbuf, source = self.load_thumbnail_with_source(full_path, cell_width, cell_height, mtime)
+                        if pixbuf is None:
+                            return
+                        batch.append((full_path, pixbuf, cell_width))
+                        patched += 1
+                        if len(batch) >= GRID_BATCH:
+                            GLib.idle_add(self.add_thumbnail_children, batch)
+                            batch = []
+                    entries.append((full_path, mtime, source))
+                    # Color, brightness and dHash for sorting/filtering/duplicates, once per file version
+                    entry = self.library_index.get(full_path, mtime)
+                    if entry is None or 'dhash' not in entry:
+                        if pixbuf is None:
+                            pixbuf = self.load_thumbnail_with_source(full_path, cell_width, cell_height, mtime)[0]
+                        if pixbuf is not None:  # unreadable since it was painted: nothing to analyze
+                            analyzer.add(full_path, stat, pixbuf)
                 except Exception as e:
+                    log.warning("Error loading thumbnail for %s: %s", full_path, e)
+
+            offline = None
+            try:
+                for found in scan.batches():
+                    for full_path, stat in found:
+                        add_wallpaper(full_path, stat)
+            except OSError as e:
+                if not cached:
                     GLib.idle_add(self.status_label.set_label, f"Error reading folder: {e}")
                     GLib.idle_add(self.spinner.stop)
                     return
-                wallpapers.sort()
-                # Save cache with full paths
-                full_paths = [os.path.join(folder_path, f) for f in wallpapers]
-                self.save_wallpaper_cache(folder_path, full_paths)
-                wallpapers = full_paths
-
-            if not wallpapers:
-                GLib.idle_add(self.status_label.set_label, "No wallpapers found in selected folder")
-                GLib.idle_add(self.spinner.stop)
-                GLib.idle_add(lambda: self.cycle_button.set_sensitive(False))
-                return
+                # Offline share: keep what is on screen and cycle through the last known list
+                log.warning("Can't read %s (%s), using the last known wallpapers", folder_path, e,
+                            extra=fields(folder=folder_path))
+                offline = e
+            if batch:
+                GLib.idle_add(self.add_thumbnail_children, batch)
 
-            for full_path in wallpapers:
-                GLib.idle_add(lambda p=full_path: self.wallpaper_list.append(p))
-                try:
-                    pixbuf = self.load_or_create_thumbnail(full_path)
-                    if pixbuf is None:
-                        continue
-                    thumbnail = Gtk.Image.new_from_pixbuf(pixbuf)
-                    thumbnail.set_size_request(THUMB_WIDTH, THUMB_HEIGHT)
-                    box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
-                    box.set_valign(Gtk.Align.START)
-                    try:
-                        box.set_margin_top(10)
-                        box.set_margin_bottom(10)
-                        box.set_margin_start(10)
-                        box.set_margin_end(10)
-                    except Exception:
-                        pass
-                    box.set_tooltip_text(os.path.basename(full_path))
-                    label = Gtk.Label(label=os.path.basename(full_path))
-                    label.set_max_width_chars(LABEL_MAX_CHARS)
-                    label.set_ellipsize(Pango.EllipsizeMode.END)
-                    label.set_wrap(False)
-                    label.set_halign(Gtk.Align.CENTER)
-                    box.append(thumbnail)
-                    box.append(label)
-                    child = Gtk.FlowBoxChild()
-                    child.set_child(box)
-                    def add_child(child=child, full_path=full_path):
-                        self.flow_box.append(child)
-                        self.thumbnails[child] = full_path
-                    GLib.idle_add(add_child)
-                except Exception as e:
-                    print(f"Error loading thumbnail for {full_path}: {e}")
+            if offline is not None:
+                wallpapers = sorted(set(cached).union(seen))
+                loaded = wallpapers
+            else:
+                if not seen:
+                    GLib.idle_add(clear_thumbnails)
+                    GLib.idle_add(self.status_label.set_label, "No wallpapers found in selected folder")
+                    GLib.idle_add(self.spinner.stop)
+                    GLib.idle_add(lambda: self.cycle_button.set_sensitive(False))
+                    self.save_grid_snapshot(folder_path, [])
+                    return
+                wallpapers = sorted(seen)
+                if not scan.unchanged:
+                    # Save cache with full paths
+                    self.save_wallpaper_cache(folder_path, wallpapers, scan.meta)
+                removed = set(painted).difference(wallpapers)
+                if removed:
+                    GLib.idle_add(self.remove_thumbnail_children, removed)
+                if snapshot:
+                    log.debug("Grid snapshot: %d painted, %d added or changed, %d removed",
+                              len(painted), patched, len(removed))
+                entries.sort()
+                self.save_grid_snapshot(folder_path, entries)
+                loaded = [path for path, _mtime, _source in entries]
+            GLib.idle_add(lambda: setattr(self, 'wallpaper_list', loaded))
+
+            with METRICS.span('load.analysis'):
+                analyzed = analyzer.finish()
+            if analyzed:
+                log.info("Analyzed %d wallpapers", analyzed)
+            with METRICS.span('load.duplicates'):
+                duplicates = find_duplicates(self.library_index, wallpapers)
+            with METRICS.span('load.search_index'):
+                search_index = SearchIndex(loaded, folder_path, self.get_search_tags())
 
             def finish_loading():
                 self.spinner.stop()
-                self.status_label.set_label("Select a wallpaper to apply or start cycling.")
+                self.duplicate_of = duplicates
+                self.update_duplicates_label()
+                self.search_index = search_index
+                self.search_query, self.search_ids = '', None
+                if self.search_entry.get_text().strip():
+                    self.on_search_changed(self.search_entry)
+                self.on_library_view_changed(None, None)
+                if offline is not None:
+                    self.status_label.set_label(f"{os.path.basename(folder_path)} is not responding, showing the last known wallpapers")
+                else:
+                    self.status_label.set_label("Select a wallpaper to apply or start cycling.")
                 self.cycle_button.set_sensitive(len(self.wallpaper_list) > 0)
+                self.schedule_thumbnail_upgrade()
+
+                self.resume_saved_cycling()
                 
                 # If we have a current wallpaper from saved state, select it
                 if self.current_wallpaper and self.current_wallpaper in self.wallpaper_list:
@@ -1083,6 +4291,111 @@ WantedBy=default.target
         thread.daemon = True
         thread.start()
 
+    def create_thumbnail_child(self, full_path, pixbuf):
+        """Build the grid cell (thumbnail and file name) for a wallpaper"""
+        thumbnail = Gtk.Picture.new_for_paintable(self.create_thumbnail_paintable(pixbuf))
+        thumbnail.set_can_shrink(True)
+        thumbnail.set_size_request(*self.get_grid_cell_size())
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        box.set_valign(Gtk.Align.START)
+        try:
+            box.set_margin_top(10)
+            box.set_margin_bottom(10)
+            box.set_margin_start(10)
+            box.set_margin_end(10)
+        except Exception:
+            pass
+        box.set_tooltip_text(os.path.basename(full_path))
+        label = Gtk.Label(label=os.path.basename(full_path))
+        label.set_max_width_chars(LABEL_MAX_CHARS)
+        label.set_ellipsize(Pango.EllipsizeMode.END)
+        label.set_wrap(False)
+        label.set_halign(Gtk.Align.CENTER)
+        box.append(thumbnail)
+        box.append(label)
+        child = Gtk.FlowBoxChild()
+        child.set_child(box)
+        return child
+
+    def add_thumbnail_children(self, items):
+        """
+        Main thread: add (path, pixbuf, resolution) cells to the grid, replacing a path's
+        existing cell; resolution is the width of the box the pixbuf was made for.
+        """
+        for full_path, pixbuf, resolution in items:
+            old = self.thumbnail_children.pop(full_path, None)
+            if old is not None:
+                self.flow_box.remove(old)
+                self.thumbnails.pop(old, None)
+            child = self.create_thumbnail_child(full_path, pixbuf)
+            self.flow_box.append(child)
+            self.thumbnails[child] = full_path
+            self.thumbnail_children[full_path] = child
+            self.thumbnail_resolution[full_path] = resolution
+        return False
+
+    def remove_thumbnail_children(self, paths):
+        """Main thread: drop the cells of wallpapers that are gone"""
+        for full_path in paths:
+            child = self.thumbnail_children.pop(full_path, None)
+            if child is not None:
+                self.flow_box.remove(child)
+                self.thumbnails.pop(child, None)
+            self.thumbnail_resolution.pop(full_path, None)
+        return False
+
+    def load_grid_snapshot(self, folder_path):
+        """The saved grid for folder_path as [[name, mtime, source], ...], or None"""
+        try:
+            with open(self.grid_snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if snapshot.get('version') != 1 or snapshot.get('folder') != folder_path:
+            return None
+        return snapshot.get('entries') or None
+
+    def save_grid_snapshot(self, folder_path, entries):
+        """Remember the grid as ordered (name, mtime, thumbnail source) triples, names relative to the folder"""
+        snapshot = {'version': 1, 'folder': folder_path,
+                     'entries': [[os.path.relpath(path, folder_path), mtime, source]
+                                 for path, mtime, source in entries if source is not None]}
+        temp = f"{self.grid_snapshot_file}.tmp"
+        try:
+            with open(temp, 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+            os.replace(temp, self.grid_snapshot_file)
+        except OSError as e:
+            log.warning("Could not save the grid snapshot: %s", e)
+
+    def paint_grid_snapshot(self, folder_path, snapshot, width, height):
+        """
+        Loader thread: add the snapshot's cells straight from their cached thumbnail files, in
+        GRID_BATCH batches so the first rows appear at once. Returns {path: (mtime, source)}.
+        Thumbnails cached smaller than width x height (the zoom changed) are left to reconciling.
+        """
+        painted = {}
+        batch = []
+        for name, mtime, source in snapshot:
+            full_path = os.path.join(folder_path, name)
+            try:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file(self.get_thumbnail_source_path(full_path, source))
+            except Exception:
+                continue  # the thumbnail is gone, reconciling will recreate it
+            if pixbuf.get_width() < width and pixbuf.get_height() < height:
+                continue
+            batch.append((full_path, self.fit_pixbuf(pixbuf, width, height), width))
+            painted[full_path] = (mtime, source)
+            if len(batch) >= GRID_BATCH:
+                GLib.idle_add(self.add_thumbnail_children, batch)
+                batch = []
+        if batch:
+            GLib.idle_add(self.add_thumbnail_children, batch)
+        paths = list(painted)
+        # Clicking and cycling work before the folder has been checked
+        GLib.idle_add(lambda: setattr(self, 'wallpaper_list', paths))
+        return painted
+
     def on_wallpaper_selected(self, flow_box):
         """
         Handles selection changes in the flow box. Only one child can be selected at a time.
@@ -1094,6 +4407,7 @@ WantedBy=default.target
                 self.current_wallpaper = self.thumbnails[child]
                 self.apply_button.set_sensitive(True)
                 self.preview_button.set_sensitive(True)
+                self.update_favorite_button()
                 # Highlight selected
                 for c in self.flow_box:
                     c.get_style_context().remove_class("thumbnail-selected")
@@ -1102,6 +4416,28 @@ WantedBy=default.target
             self.current_wallpaper = None
             self.apply_button.set_sensitive(False)
             self.preview_button.set_sensitive(False)
+            self.update_favorite_button()
+
+    def update_favorite_button(self):
+        """Reflect the selected wallpaper's favorite state without re-triggering the toggle"""
+        self.favorite_button.handler_block(self.favorite_handler_id)
+        self.favorite_button.set_sensitive(self.current_wallpaper is not None)
+        self.favorite_button.set_active(self.current_wallpaper in self.favorites)
+        self.favorite_button.handler_unblock(self.favorite_handler_id)
+
+    def on_favorite_toggled(self, button):
+        """Add or remove the selected wallpaper from the favorites"""
+        if not self.current_wallpaper:
+            return
+        if button.get_active():
+            self.favorites.add(self.current_wallpaper)
+        else:
+            self.favorites.discard(self.current_wallpaper)
+        self.save_cycle_config()
+        if self.is_cycling and self.is_random_order:
+            # Rebuild with the new weights; the order changes so the saved position can't carry over
+            self.playlist = None
+            self.prepare_cycle_order()
 
     def on_apply_clicked(self, button):
         """
@@ -1112,82 +4448,176 @@ WantedBy=default.target
             return
             
         try:
+            self.monitor_wallpapers = {m: self.current_wallpaper for m in self.monitors}
             # Always update the hyprpaper config first for persistence
             self.update_hyprpaper_config()
             
             # Then, try to apply via IPC for an immediate change
             self.apply_hyprpaper_via_ipc()
 
-            # Always update the hyprlock config for persistence and then restart hyprlock
-            self.apply_hyprlock_wallpaper()
-            subprocess.run(["pkill", "hyprlock"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if self.lockscreen_mode == 'lazy':
+                # Keep --prepare-lock in step with what was applied, then swap the link
+                if self.attached:
+                    self.save_applied_wallpaper()  # the playlist in there is the daemon's
+                else:
+                    self.save_cycle_state()
+                self.prepare_lockscreen()
+            else:
+                # Always update the hyprlock config for persistence and then restart hyprlock
+                self.update_lockscreen()
             
             self.status_label.set_label(f"Applied {os.path.basename(self.current_wallpaper)} to desktop and lockscreen!")
             
         except Exception as e:
             self.status_label.set_label(f"Error applying wallpaper: {e}")
 
-    def apply_hyprpaper_via_ipc(self):
-        """Try applying wallpaper to hyprpaper using IPC commands."""
+    def apply_hyprpaper_via_ipc(self, assignments=None):
+        """
+        Try applying wallpaper to hyprpaper using IPC commands. While hyprpaper isn't
+        answering only the latest request is kept, and sent once it is back.
+        """
+        assignments = dict(assignments) if assignments else {m: self.current_wallpaper for m in self.monitors}
+        if not self.hyprpaper.available():
+            self.queue_hyprpaper_apply(assignments)
+            return
         try:
-            # Preload the new wallpaper
-            subprocess.run([
-                "hyprctl", "hyprpaper", "preload", 
-                f"{self.current_wallpaper}"
-            ], check=True, text=True, timeout=10, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-            # Set the wallpaper
-            subprocess.run([
-                "hyprctl", "hyprpaper", "wallpaper", 
-                f",{self.current_wallpaper}"
-            ], check=True, text=True, timeout=10, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                
-        except (FileNotFoundError, subprocess.CalledProcessError, subprocess.TimeoutExpired, Exception) as e:
-            print(f"IPC method failed: {e}. The config file has been updated for persistence.")
-            # No further action needed as update_hyprpaper_config() was already called.
+            # Preload each new wallpaper once
+            wallpapers = list(dict.fromkeys(assignments.values()))
+            for wallpaper in wallpapers:
+                self.hyprpaper.request('preload', wallpaper)
 
-    def update_hyprpaper_config(self):
-        """Update hyprpaper config file with new wallpaper."""
-        config_content = []
-        
-        # Read existing config if it exists
-        if os.path.exists(self.hyprpaper_conf):
-            with open(self.hyprpaper_conf, 'r') as f:
-                config_content = f.readlines()
-        
-        # Remove existing preload and wallpaper lines
-        new_content = []
-        for line in config_content:
-            stripped_line = line.strip()
-            if not stripped_line.startswith(('preload =', 'wallpaper =')):
-                new_content.append(line)
-        
-        # Add new wallpaper configuration
-        new_content.append(f"preload = {self.current_wallpaper}\n")
-        new_content.append(f"wallpaper = ,{self.current_wallpaper}\n")
-        
-        # Write updated config
-        with open(self.hyprpaper_conf, 'w') as f:
-            f.writelines(new_content)
+            if len(wallpapers) > 1:
+                # Monitors differ (schedule rules per monitor), set them one by one
+                failed = [monitor for monitor, wallpaper in assignments.items()
+                          if not self.set_wallpaper_for_monitor(monitor, wallpaper)]
+                if failed and not self.hyprpaper.healthy:
+                    # The breaker opened part way: resend the whole apply once hyprpaper is back
+                    self.queue_hyprpaper_apply(assignments)
+                    return
+            else:
+                # Set the wallpaper on every monitor at once
+                self.hyprpaper.request('wallpaper', f",{wallpapers[0]}")
+            self.pending_apply = None
+        except OSError as e:
+            log.warning("IPC method failed: %s. The config file has been updated for persistence.", e,
+                        extra=fields(wallpaper=self.current_wallpaper, backend='hyprpaper'))
+            # The config file is already updated; once hyprpaper is back the live state follows
+            if not self.hyprpaper.healthy:
+                self.queue_hyprpaper_apply(assignments)
+
+    def queue_hyprpaper_apply(self, assignments):
+        """Keep only the latest apply while hyprpaper is down, and retry when the backoff allows"""
+        if self.pending_apply is not None:
+            METRICS.count('hyprpaper.collapsed')
+        self.pending_apply = assignments
+        if self._hyprpaper_retry_id is None:
+            self._hyprpaper_retry_id = GLib.timeout_add(int(self.hyprpaper.retry_in() * 1000) + 1,
+                                                        self.on_hyprpaper_retry)
+
+    def on_hyprpaper_retry(self):
+        self._hyprpaper_retry_id = None
+        if self.pending_apply is not None:
+            assignments, self.pending_apply = self.pending_apply, None
+            self.apply_hyprpaper_via_ipc(assignments)  # probes first, queues again if still down
+        return False
+
+    @METRICS.timed('config.hyprpaper')
+    def update_hyprpaper_config(self, assignments=None):
+        """
+        Update hyprpaper config file with new wallpaper, per monitor when assignments differ.
+        With symlink_configs the file names stable per-monitor links instead, so a change is
+        one rename per monitor and the file is only rewritten when the link names change.
+        """
+        if self.symlink_configs:
+            assignments = self.point_wallpaper_links(assignments or {'': self.current_wallpaper})
+            if assignments == self._linked_assignments:
+                return
+        wallpapers = list(dict.fromkeys(assignments.values())) if assignments else [self.current_wallpaper]
+        if len(wallpapers) == 1:
+            desired = {'': wallpapers[0]}
+        else:
+            desired = {('' if m == 'default' else m): w for m, w in assignments.items()}
+            # Monitors plugged in later get the first monitor's wallpaper
+            desired.setdefault('', wallpapers[0])
+
+        config = HyprlangConfig.load(self.hyprpaper_conf)
+        root = config.root
+        blocks = root.blocks('wallpaper')
+        if blocks:
+            # hyprpaper 0.8+: one `wallpaper { monitor = ... path = ... }` block per monitor, no preload
+            seen = set()
+            for block in blocks:
+                monitor = block.get('monitor', '')
+                block.set('path', desired.get(monitor, desired['']))
+                seen.add(monitor)
+            for monitor, wallpaper in desired.items():
+                if monitor not in seen:
+                    root.append_block('wallpaper', [('monitor', monitor), ('path', wallpaper)])
+        else:
+            # Reuse the existing preload and `wallpaper = monitor,path` lines in place, drop the rest
+            preloads = root.find('preload')
+            for line, wallpaper in zip(preloads, wallpapers):
+                line.set_value(wallpaper)
+            for line in preloads[len(wallpapers):]:
+                root.remove(line)
+            anchor = preloads[min(len(preloads), len(wallpapers)) - 1] if preloads else None
+            for wallpaper in wallpapers[len(preloads):]:
+                index = root.children.index(anchor) + 1 if anchor else len(root.children)
+                anchor = root.insert(index, 'preload', wallpaper)
+            seen = set()
+            for line in root.find('wallpaper'):
+                monitor = line.value.split(',', 1)[0].strip()
+                if monitor in desired and monitor not in seen:
+                    line.set_value(f"{monitor},{desired[monitor]}")
+                    seen.add(monitor)
+                    anchor = line
+                else:
+                    root.remove(line)
+            for monitor, wallpaper in desired.items():
+                if monitor not in seen:
+                    index = root.children.index(anchor) + 1 if anchor else len(root.children)
+                    anchor = root.insert(index, 'wallpaper', f"{monitor},{wallpaper}")
+        config.save(self.hyprpaper_conf)
+        if self.symlink_configs:
+            self._linked_assignments = assignments
         
         # NOTE: We no longer pkill -SIGUSR2 here. The IPC command handles immediate change.
         # This is for persistence only.
 
-    def apply_hyprlock_wallpaper(self):
+    def point_wallpaper_links(self, assignments):
+        """
+        Point each monitor's link (~/.cache/pyprwall/wallpaper-MONITOR.EXT) at its wallpaper
+        and return {monitor: link}. The extension stays in the name so hyprpaper can tell the format.
+        """
+        if '' in assignments:
+            assignments = {m: assignments[''] for m in self.monitors}
+        os.makedirs(self.link_dir, exist_ok=True)
+        links = {}
+        for monitor, wallpaper in assignments.items():
+            name = monitor if monitor != 'default' else 'all'
+            link = os.path.join(self.link_dir, f"wallpaper-{name}{os.path.splitext(wallpaper)[1].lower()}")
+            point_symlink(link, wallpaper)
+            links[monitor if monitor != 'default' else ''] = link
+        return links
+
+    @METRICS.timed('config.hyprlock')
+    def apply_hyprlock_wallpaper(self, path=None, assignments=None):
         """
-        Update hyprlock configuration to use the same wallpaper by only
-        modifying the 'background' block.
+        Update hyprlock configuration to use the same wallpaper (or path) by only
+        modifying the `path` of its 'background' blocks; blocks for a monitor in
+        assignments get that monitor's wallpaper. An unchanged config isn't rewritten.
         """
+        path = path or self.current_wallpaper
         # Read existing hyprlock config
         try:
             with open(self.hyprlock_conf, 'r') as f:
-                content = f.readlines()
+                content = f.read()
         except FileNotFoundError:
             # If file doesn't exist, create a basic one
             base_config = f"""
 background {{
     monitor =
-    path = {self.current_wallpaper}
+    path = {path}
     color = rgba(25, 20, 20, 1.0)
     blur_size = 8
     blur_passes = 3
@@ -1213,31 +4643,16 @@ label {{
                 f.write(base_config)
             return
 
-        new_content = []
-        in_background_section = False
-        path_updated = False
-        
-        for line in content:
-            stripped_line = line.strip()
-
-            if stripped_line.startswith('background {'):
-                in_background_section = True
-                new_content.append(line)
-            elif in_background_section and stripped_line == '}':
-                # Add path if it was not found and then close the section
-                if not path_updated:
-                    new_content.insert(-1, f"    path = {self.current_wallpaper}\n")
-                in_background_section = False
-                new_content.append(line)
-            elif in_background_section and stripped_line.startswith('path ='):
-                new_content.append(f"    path = {self.current_wallpaper}\n")
-                path_updated = True
-            else:
-                new_content.append(line)
-        
+        # Every background block gets its monitor's wallpaper, or path when it has none
+        config = HyprlangConfig(content)
+        blocks = config.root.blocks('background')
+        if not blocks:
+            blocks = [config.root.append_block('background', [('monitor', '')])]
+        for block in blocks:
+            monitor = block.get('monitor', '')
+            block.set('path', (assignments or {}).get(monitor) or path)
         # Write updated config
-        with open(self.hyprlock_conf, 'w') as f:
-            f.writelines(new_content)
+        config.save(self.hyprlock_conf)
 
 def main():
     """
@@ -1246,12 +4661,63 @@ def main():
     parser = argparse.ArgumentParser(description='PyprWall - Hyprland Wallpaper Manager')
     parser.add_argument('--cycle-daemon', action='store_true', 
                        help='Run in daemon mode for wallpaper cycling')
+    parser.add_argument('--on-demand', action='store_true',
+                       help='With --cycle-daemon: only serve control requests and exit when idle (socket activation)')
+    parser.add_argument('--cycle-once', action='store_true',
+                       help='Change to the next wallpaper once and exit (used by the timer unit)')
+    parser.add_argument('--prepare-lock', action='store_true',
+                       help='Point the lockscreen at the current wallpaper and exit (for hypridle lock/sleep hooks)')
+    parser.add_argument('--control', choices=CONTROL_COMMANDS,
+                       help='Send a command to the running (or socket-activated) daemon')
+    parser.add_argument('--stats', action='store_true',
+                       help="Print the cycling daemon's timing metrics and exit")
+    parser.add_argument('--metrics-file', metavar='PATH',
+                       help='Daemon mode: also write Prometheus text metrics to PATH after every cycle')
+    parser.add_argument('--log-level', default='info', choices=['debug', 'info', 'warning', 'error'],
+                       help='Minimum level of log messages (default: info)')
+    parser.add_argument('--log-json', action='store_true',
+                       help='Write log messages as JSON lines')
     args = parser.parse_args()
+    setup_logging(args.log_level, args.log_json)
+
+    if args.stats:
+        stats_file = Path.home() / ".config" / "pyprwall" / "stats.json"
+        try:
+            with open(stats_file, 'r') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"No daemon metrics available ({e})")
+            return
+        print(f"Metrics since {time.ctime(snapshot['started'])}, updated {time.ctime(snapshot['updated'])}")
+        print(format_stats(snapshot))
+        return
     
+    if args.control:
+        try:
+            print(json.dumps(send_control_command(args.control), indent=2))
+        except OSError as e:
+            print(f"Could not reach the PyprWall daemon: {e}")
+            sys.exit(1)
+        return
+
+    if args.prepare_lock:
+        app = WallpaperManager(application_id="com.reeves.pyprwall")
+        app.daemon_mode = True
+        if not app.prepare_lockscreen():
+            log.warning("No current wallpaper to put on the lockscreen")
+        return
+
+    if args.cycle_once:
+        app = WallpaperManager(application_id="com.reeves.pyprwall")
+        app.metrics_file = args.metrics_file
+        app.run_cycle_once()
+        return
+
     if args.cycle_daemon:
         # Run in daemon mode
         app = WallpaperManager(application_id="com.reeves.pyprwall")
-        app.run_daemon()
+        app.metrics_file = args.metrics_file
+        app.run_daemon(on_demand=args.on_demand)
         return
     
     # Load CSS for styling
@@ -0,0 +1,79 @@
+"""
+Pixel analysis for PyprWall's library index: dominant color, brightness and dHash.
+
+Process pool workers run this module on its own, so it must not import GTK, GLib
+or pyprwall itself; the pixel buffers arrive as plain bytes.
+"""
+import colorsys
+
+try:
+    import numpy
+except ImportError:  # Optional, color analysis falls back to pure Python
+    numpy = None
+
+COLOR_HISTOGRAM_BITS = 4  # per channel
+
+
+def dominant_color(pixels, width, height, rowstride, channels):
+    """
+    Dominant color and mean brightness of an 8-bit RGB(A) pixel buffer: the fullest
+    cell of a 4-bit-per-channel histogram, refined to the mean of its pixels.
+    Returns ((r, g, b), brightness) with brightness the mean luma in 0..1.
+    """
+    shift = 8 - COLOR_HISTOGRAM_BITS
+    if numpy is not None:
+        buffer = numpy.zeros(rowstride * height, dtype=numpy.uint8)
+        buffer[:len(pixels)] = numpy.frombuffer(pixels, dtype=numpy.uint8)  # last row isn't padded
+        rgb = buffer.reshape(height, rowstride)[:, :width * channels].reshape(-1, channels)[:, :3]
+        cells = rgb >> shift
+        keys = (cells[:, 0].astype(numpy.int32) << (2 * COLOR_HISTOGRAM_BITS)) \
+            | (cells[:, 1].astype(numpy.int32) << COLOR_HISTOGRAM_BITS) | cells[:, 2]
+        top = numpy.bincount(keys, minlength=1 << (3 * COLOR_HISTOGRAM_BITS)).argmax()
+        color = rgb[keys == top].mean(axis=0)
+        brightness = float((rgb @ numpy.array([0.2126, 0.7152, 0.0722])).mean()) / 255
+        return tuple(int(round(c)) for c in color), brightness
+    counts = {}
+    luma = 0.0
+    for y in range(height):
+        row = y * rowstride
+        for x in range(row, row + width * channels, channels):
+            r, g, b = pixels[x], pixels[x + 1], pixels[x + 2]
+            luma += 0.2126 * r + 0.7152 * g + 0.0722 * b
+            key = (r >> shift, g >> shift, b >> shift)
+            cell = counts.get(key)
+            if cell is None:
+                counts[key] = [1, r, g, b]
+            else:
+                cell[0] += 1
+                cell[1] += r
+                cell[2] += g
+                cell[3] += b
+    n, r, g, b = max(counts.values())
+    return (round(r / n), round(g / n), round(b / n)), luma / (width * height * 255)
+
+
+def difference_hash(pixels, width, height, rowstride, channels):
+    """
+    dHash of a (DHASH_SIZE + 1) x DHASH_SIZE RGB(A) buffer: one bit per horizontally
+    adjacent pair, set where the luma increases. Resizing and re-encoding barely change it.
+    """
+    value = 0
+    for y in range(height):
+        row = y * rowstride
+        lumas = [299 * pixels[x] + 587 * pixels[x + 1] + 114 * pixels[x + 2]
+                 for x in range(row, row + width * channels, channels)]
+        for left, right in zip(lumas, lumas[1:]):
+            value = (value << 1) | (left < right)
+    return value
+
+
+def analyze_batch(items):
+    """Process pool entry point: [(path, mtime, values, color_buffer, hash_buffer)] -> results"""
+    results = []
+    for path, mtime, values, color_buffer, hash_buffer in items:
+        color, brightness = dominant_color(*color_buffer)
+        hue, saturation, _value = colorsys.rgb_to_hsv(*(c / 255 for c in color))
+        values.update({'color': '#%02x%02x%02x' % color, 'hue': round(hue, 4), 'saturation': round(saturation, 4),
+                       'brightness': round(brightness, 4), 'dhash': '%016x' % difference_hash(*hash_buffer)})
+        results.append((path, mtime, values))
+    return results
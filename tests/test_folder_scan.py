@@ -0,0 +1,57 @@
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip('gi')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+try:
+    import pyprwall
+except (ImportError, ValueError) as e:  # ValueError: GTK 4 / libadwaita typelibs missing
+    pytest.skip(f"pyprwall needs GTK 4: {e}", allow_module_level=True)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    for name in ('a.jpg', 'b.png', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+    (tmp_path / 'dir.jpg').mkdir()
+    return tmp_path
+
+
+def scanned(scan):
+    return sorted(os.path.basename(path) for batch in scan.batches() for path, _stat in batch)
+
+
+def test_lists_supported_files_once(folder):
+    scan = pyprwall.FolderScan(str(folder))
+    assert scanned(scan) == ['a.jpg', 'b.png']
+    assert not scan.unchanged
+    assert scan.meta == {'mtime': os.stat(folder).st_mtime}
+
+
+def test_unchanged_folder_stats_the_known_paths(folder):
+    mtime = os.stat(folder).st_mtime
+    known = [str(folder / 'a.jpg'), str(folder / 'gone.jpg')]
+    scan = pyprwall.FolderScan(str(folder), mtime, known)
+    assert scanned(scan) == ['a.jpg']
+    assert scan.unchanged
+
+
+def test_hanging_stat_of_a_known_path_times_out(folder, monkeypatch):
+    release = threading.Event()
+    real_stat = os.stat
+
+    def stat(path, *args, **kwargs):
+        if str(path).endswith('a.jpg'):
+            release.wait(5)  # a mount answering the folder, then hanging on its files
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(pyprwall.os, 'stat', stat)
+    scan = pyprwall.FolderScan(str(folder), real_stat(folder).st_mtime, [str(folder / 'a.jpg')], timeout=0.2)
+    try:
+        with pytest.raises(TimeoutError):
+            list(scan.batches())
+    finally:
+        release.set()
@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+
+import pytest
+
+gi = pytest.importorskip('gi')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+try:
+    import pyprwall
+except (ImportError, ValueError) as e:  # ValueError: GTK 4 / libadwaita typelibs missing
+    pytest.skip(f"pyprwall needs GTK 4: {e}", allow_module_level=True)
+from gi.repository import Gio, GLib  # noqa: E402
+
+NOTIFICATIONS_XML = """
+<node>
+  <interface name="org.freedesktop.Notifications">
+    <method name="Notify">
+      <arg type="s" name="app_name" direction="in"/>
+      <arg type="u" name="replaces_id" direction="in"/>
+      <arg type="s" name="app_icon" direction="in"/>
+      <arg type="s" name="summary" direction="in"/>
+      <arg type="s" name="body" direction="in"/>
+      <arg type="as" name="actions" direction="in"/>
+      <arg type="a{sv}" name="hints" direction="in"/>
+      <arg type="i" name="expire_timeout" direction="in"/>
+      <arg type="u" name="id" direction="out"/>
+    </method>
+  </interface>
+</node>
+"""
+
+
+class FakeNotifications:
+    """org.freedesktop.Notifications stand-in on the test bus; records every Notify call"""
+
+    def __init__(self, address):
+        self.calls = []
+        self.held = []  # invocations not answered yet while hold is set
+        self.hold = False
+        self._next_id = 1
+        self.connection = Gio.DBusConnection.new_for_address_sync(
+            address, Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION,
+            None, None)
+        interface = Gio.DBusNodeInfo.new_for_xml(NOTIFICATIONS_XML).interfaces[0]
+        self.connection.register_object(pyprwall.Notifier.OBJECT_PATH, interface, self._on_call, None, None)
+        self.connection.call_sync('org.freedesktop.DBus', '/org/freedesktop/DBus', 'org.freedesktop.DBus',
+                                  'RequestName', GLib.Variant('(su)', (pyprwall.Notifier.BUS_NAME, 0)),
+                                  GLib.VariantType.new('(u)'), Gio.DBusCallFlags.NONE, -1, None)
+
+    def _on_call(self, connection, sender, path, interface, method, params, invocation):
+        args = params.unpack()
+        self.calls.append({'replaces_id': args[1], 'body': args[4]})
+        if self.hold:
+            self.held.append((invocation, args[1]))
+        else:
+            self.answer(invocation, args[1])
+
+    def answer(self, invocation, replaces_id):
+        notification_id = replaces_id
+        if not notification_id:
+            notification_id, self._next_id = self._next_id, self._next_id + 1
+        invocation.return_value(GLib.Variant('(u)', (notification_id,)))
+
+    def close(self):
+        self.connection.close_sync(None)
+
+
+def wait_for(condition, timeout=5.0):
+    context = GLib.MainContext.default()
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for the bus")
+        context.iteration(False)
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def server():
+    Gio.TestDBus.unset()
+    bus = Gio.TestDBus.new(Gio.TestDBusFlags.NONE)
+    bus.up()
+    fake = FakeNotifications(bus.get_bus_address())
+    yield fake
+    fake.close()
+    bus.down()
+
+
+def test_replace_key_reuses_the_server_id(server):
+    notifier = pyprwall.Notifier()
+    assert notifier.notify("Wallpaper changed to a.jpg", replace_key='cycle')
+    wait_for(lambda: 'cycle' in notifier._ids)
+    assert notifier.notify("Wallpaper changed to b.jpg", replace_key='cycle')
+    wait_for(lambda: len(server.calls) == 2)
+    assert server.calls[0]['replaces_id'] == 0
+    assert server.calls[1]['replaces_id'] == notifier._ids['cycle'] != 0
+
+
+def test_repeated_messages_are_rate_limited(server):
+    notifier = pyprwall.Notifier(min_interval=60)
+    assert notifier.notify("Cycling service restarted")
+    assert not notifier.notify("Cycling service restarted")
+    assert notifier.notify("Cycling stopped")
+    wait_for(lambda: len(server.calls) == 2)
+    assert [call['body'] for call in server.calls] == ["Cycling service restarted", "Cycling stopped"]
+
+
+def test_notify_does_not_wait_for_the_server(server):
+    server.hold = True
+    notifier = pyprwall.Notifier()
+    assert notifier.notify("Wallpaper changed to a.jpg", replace_key='cycle')
+    wait_for(lambda: server.held)
+    assert 'cycle' not in notifier._ids  # returned before the reply
+    server.answer(*server.held.pop())
+    wait_for(lambda: 'cycle' in notifier._ids)
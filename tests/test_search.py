@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('gi')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+try:
+    from pyprwall import SearchIndex
+except (ImportError, ValueError) as e:  # ValueError: GTK 4 / libadwaita typelibs missing
+    pytest.skip(f"pyprwall needs GTK 4: {e}", allow_module_level=True)
+
+PATHS = ['/w/xabc.jpg', '/w/abend.jpg', '/w/sea/blue.png', '/w/abc.jpg']
+
+
+def names(index, ids):
+    return sorted(os.path.basename(index.paths[doc]) for doc in ids)
+
+
+def typed(index, *queries):
+    """Query as the grid does while typing: narrow the last result when refines() allows it"""
+    last, ids = '', None
+    for query in queries:
+        within = ids if last and SearchIndex.refines(last, query) else None
+        last, ids = query, index.query(query, within)
+    return ids
+
+
+def test_short_terms_match_word_prefixes():
+    index = SearchIndex(PATHS, '/w')
+    assert names(index, index.query('ab')) == ['abc.jpg', 'abend.jpg']
+
+
+def test_long_terms_match_substrings():
+    index = SearchIndex(PATHS, '/w')
+    assert names(index, index.query('abc')) == ['abc.jpg', 'xabc.jpg']
+
+
+def test_crossing_to_three_characters_queries_everything_again():
+    index = SearchIndex(PATHS, '/w')
+    assert not SearchIndex.refines('ab', 'abc')
+    assert typed(index, 'a', 'ab', 'abc') == index.query('abc')
+
+
+@pytest.mark.parametrize('old, new', [('a', 'ab'), ('abc', 'abcd'), ('abc', 'xabc'), ('ab x', 'ab xy'), ('sea', 'sea bl')])
+def test_refinements_narrow(old, new):
+    index = SearchIndex(PATHS, '/w')
+    assert SearchIndex.refines(old, new)
+    assert typed(index, old, new) == index.query(new)
+
+
+@pytest.mark.parametrize('old, new', [('ab', 'abc'), ('abc', 'ab'), ('sea', 'blue'), ('ab', 'a')])
+def test_non_refinements(old, new):
+    assert not SearchIndex.refines(old, new)
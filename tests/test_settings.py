@@ -0,0 +1,24 @@
+import math
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('gi')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+try:
+    from pyprwall import Playlist, Settings
+except (ImportError, ValueError) as e:  # ValueError: GTK 4 / libadwaita typelibs missing
+    pytest.skip(f"pyprwall needs GTK 4: {e}", allow_module_level=True)
+
+
+def test_bad_weights_are_dropped():
+    settings = Settings({'weights': {'/w/a.jpg': 'high', '/w/b.jpg': '2', '/w/c.jpg': -1,
+                                     '/w/d.jpg': math.inf, '/w/e.jpg': None, '/w/f.jpg': 0.5}})
+    weights = settings.get('weights')
+    assert weights == {'/w/b.jpg': 2.0, '/w/f.jpg': 0.5}
+    Playlist(['/w/a.jpg', '/w/b.jpg', '/w/f.jpg'], random_order=True, weights=weights)
+
+
+def test_weights_that_are_not_a_mapping_are_ignored():
+    assert Settings({'weights': ['/w/a.jpg']}).get('weights') is None